@@ -12,12 +12,21 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 # region Imports
 from pathlib import Path
 import os
-from dotenv import load_dotenv
 from datetime import timedelta
 # endregion
 
-# Load environment variables from .env.dev file
-load_dotenv()
+# region Application Profile -------------------------------------------------------------------
+# 'development' (default) loads dev tooling and the .env file;
+# 'production' skips dev-only apps and reads configuration from the real environment only.
+APP_PROFILE = os.getenv('APP_PROFILE', 'development')
+IS_PRODUCTION = APP_PROFILE == 'production'
+
+if not IS_PRODUCTION:
+    from dotenv import load_dotenv
+
+    # Load environment variables from .env file
+    load_dotenv()
+# endregion
 
 # -------------------------------------------------------------------
 # Base Directory and Paths
@@ -47,22 +56,30 @@ INSTALLED_APPS = [
     # 'django.contrib.staticfiles',
 
     # Third-party apps
-    'django_extensions',  # For dev tools like shell_plus
     'corsheaders',  # Cross-Origin Resource Sharing (CORS)
     'rest_framework',  # Django REST framework
     'rest_framework_simplejwt',
-    'drf_spectacular',  # Swagger Documentation
     'safedelete',  # Safe Delete DRF
 
     # Your apps
     'utils',
     'inventory'
 ]
+
+# Dev tooling, never loaded by production workers
+DEV_ONLY_APPS = [
+    'django_extensions',  # For dev tools like shell_plus
+    'drf_spectacular',  # Swagger Documentation
+]
+
+if not IS_PRODUCTION:
+    INSTALLED_APPS += DEV_ONLY_APPS
 # endregion
 
 # region Middleware -------------------------------------------------------------------
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'utils.middleware.RequestProfilingMiddleware',  # No-op unless the request carries a staff profiling token
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,7 +92,6 @@ MIDDLEWARE = [
 
 # region Django REST Framework Configuration -------------------------------------------------------------------
 REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'EXCEPTION_HANDLER': 'utils.endpointhandling.exception_handler.custom_exception_handler',
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
@@ -92,6 +108,9 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
+
+if not IS_PRODUCTION:
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
 # endregion
 
 # -------------------------------------------------------------------
@@ -122,6 +141,15 @@ TEMPLATES = [
 # -------------------------------------------------------------------
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Run in the master by `manage.py serve` before forking workers (see utils.warmup)
+WARMUP_HOOKS = [
+    'utils.warmup.warm_imports',
+    'utils.warmup.warm_url_resolvers',
+    'utils.warmup.warm_serializers',
+    'inventory.warmup.preload_catalog',
+    'utils.warmup.warm_database',  # Last: closes the connections the other hooks opened
+]
+
 # -------------------------------------------------------------------
 # Database Configuration
 # -------------------------------------------------------------------
@@ -130,9 +158,155 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', '0')),  # Seconds; > 0 keeps per-worker connections open
     }
 }
 
+# Read replicas: safe CustomResponseViewSet reads go to these aliases, everything else to 'default'.
+# Locally, SQLITE_REPLICAS="replica1.sqlite3,replica2.sqlite3" adds SQLite replicas
+# (refresh them with `manage.py sync_sqlite_replicas`). Only SQLite replicas are read from the environment:
+# replicas of another engine (e.g. PostgreSQL) must be added by hand, as an alias in DATABASES and in
+# DATABASE_REPLICAS.
+DATABASE_REPLICAS = []
+for replica_index, replica_name in enumerate(filter(None, os.getenv('SQLITE_REPLICAS', '').split(','))):
+    DATABASES[f'replica_{replica_index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / replica_name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{replica_index}')
+
+DATABASE_ROUTERS = ['utils.db_routers.PrimaryReplicaRouter']
+
+# Seconds a client's reads stay on the primary after it writes (read-your-writes)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
+# -------------------------------------------------------------------
+# Caching
+# -------------------------------------------------------------------
+# REDIS_URL makes the default cache shared between workers (replica pins, order detail cache, profiles and
+# the shared tier of utils.caching); without it each process keeps its own local-memory cache.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient'},
+        },
+    }
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+
+# Rendered order detail responses (orders are immutable, so this only bounds the memory old orders hold)
+ORDER_DETAIL_CACHE_TIMEOUT = int(os.getenv('ORDER_DETAIL_CACHE_TIMEOUT', str(7 * 24 * 60 * 60)))  # Seconds
+
+# Two-tier caches (utils.caching.get_two_tier_cache): a bounded per-worker LRU in front of the shared cache.
+# Local entries live at most LOCAL_TTL seconds, which bounds staleness if an invalidation message is missed.
+# Without REDIS_URL the "shared" cache is per process and hears no other worker's writes, so its entries are
+# kept at most LOCAL_TTL seconds as well instead of SHARED_TIMEOUT.
+TWO_TIER_CACHE = {
+    'SHARED_ALIAS': 'default',
+    'SHARED_TIMEOUT': int(os.getenv('TWO_TIER_CACHE_TIMEOUT', str(60 * 60))),  # Seconds
+    'LOCAL_MAX_ENTRIES': int(os.getenv('TWO_TIER_CACHE_LOCAL_ENTRIES', '4096')),
+    'LOCAL_TTL': float(os.getenv('TWO_TIER_CACHE_LOCAL_TTL', '30')),  # Seconds
+    'INVALIDATION_CHANNEL': 'two-tier-cache-invalidation',
+}
+
+# -------------------------------------------------------------------
+# Kitchen Display Event Stream
+# -------------------------------------------------------------------
+# With django-redis as SHARED_ALIAS (REDIS_URL), events are published through Redis, so subscribers on every
+# worker receive them and replay from a shared buffer of BUFFER_SIZE events. Otherwise they stay in the worker
+# that committed them, and `serve --asgi` refuses more than one worker.
+EVENT_STREAM = {
+    'SHARED_ALIAS': 'default',
+    'CHANNEL': 'order-events',
+    'BUFFER_SIZE': 1000,  # Events kept for Last-Event-ID replay
+    'QUEUE_SIZE': 100,  # Events a subscriber may fall behind before it is dropped
+}
+
+# -------------------------------------------------------------------
+# Shared Recipe Matrix
+# -------------------------------------------------------------------
+# Flattened recipes are compiled into one memory-mapped file per node that every worker maps read-only
+# (inventory.recipe_matrix); /dev/shm keeps it in memory, elsewhere DIR None means the system temp directory.
+# Recipe changes reach other nodes over the two-tier cache's invalidation bus; MAX_AGE rebuilds a matrix that
+# is older anyway, bounding staleness if a broadcast is missed (0 disables). Disable to read recipes through
+# the two-tier cache.
+RECIPE_MATRIX = {
+    'ENABLED': os.getenv('RECIPE_MATRIX_ENABLED', 'True') == 'True',
+    'DIR': os.getenv('RECIPE_MATRIX_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else None),
+    'MAX_AGE': int(os.getenv('RECIPE_MATRIX_MAX_AGE', '300')),  # Seconds
+}
+
+# -------------------------------------------------------------------
+# Cart Stock Reservations
+# -------------------------------------------------------------------
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', '600'))  # Seconds a cart holds its stock by default
+STOCK_RESERVATION_MAX_TTL = int(os.getenv('STOCK_RESERVATION_MAX_TTL', '3600'))
+
+# -------------------------------------------------------------------
+# POS Catalog Sync
+# -------------------------------------------------------------------
+# Rows saved more recently than this are held back from the delta feed, so a transaction that commits
+# after a newer one cannot slip behind a terminal's (updated_at, id) cursor.
+CATALOG_SYNC_SETTLE_SECONDS = float(os.getenv('CATALOG_SYNC_SETTLE_SECONDS', '2'))
+CATALOG_SYNC_PAGE_SIZE = 500
+
+# -------------------------------------------------------------------
+# Stockout Forecast
+# -------------------------------------------------------------------
+# Burn rates are an exponentially weighted mean of the hourly consumption over WINDOW_HOURS (recent hours
+# weigh more, halving every HALF_LIFE_HOURS); the projection is recomputed at most every REFRESH_SECONDS.
+STOCKOUT_FORECAST = {
+    'WINDOW_HOURS': int(os.getenv('STOCKOUT_FORECAST_WINDOW_HOURS', str(28 * 24))),
+    'HALF_LIFE_HOURS': float(os.getenv('STOCKOUT_FORECAST_HALF_LIFE_HOURS', str(3 * 24))),
+    'REFRESH_SECONDS': int(os.getenv('STOCKOUT_FORECAST_REFRESH_SECONDS', '60')),
+}
+
+# -------------------------------------------------------------------
+# On-Demand Request Profiling
+# -------------------------------------------------------------------
+# Staff get a signed, single-use token from /utils/api/profiles/token/ and send it as `X-Profile` with one of
+# their requests; that request is profiled and its summary kept in the cache under the returned X-Profile-Id.
+REQUEST_PROFILING = {
+    'TOKEN_MAX_AGE': int(os.getenv('PROFILING_TOKEN_MAX_AGE', '600')),  # Seconds
+    'RESULT_TTL': int(os.getenv('PROFILING_RESULT_TTL', '3600')),  # Seconds
+    'TOP_FUNCTIONS': 40,
+}
+
+# -------------------------------------------------------------------
+# Admission Control
+# -------------------------------------------------------------------
+# Bounded concurrency in front of hot write paths (utils.admission). Requests beyond LIMIT queue up to
+# QUEUE_DEPTH for QUEUE_TIMEOUT seconds, the rest get 429 + Retry-After. Limits apply per worker process;
+# SQLite allows a single writer, so keep LIMIT * workers small and QUEUE_TIMEOUT below the lock timeout.
+ADMISSION_CONTROL = {
+    'order_writes': {
+        'LIMIT': int(os.getenv('ORDER_WRITE_CONCURRENCY', '1')),
+        'QUEUE_DEPTH': int(os.getenv('ORDER_WRITE_QUEUE_DEPTH', '32')),
+        'QUEUE_TIMEOUT': float(os.getenv('ORDER_WRITE_QUEUE_TIMEOUT', '2')),  # Seconds
+    },
+}
+
+# -------------------------------------------------------------------
+# Order Group Commit
+# -------------------------------------------------------------------
+# Opt-in: orders created concurrently in one worker are gathered for up to MAX_WAIT_MS (at most MAX_BATCH)
+# and committed in a single transaction by one writer thread (inventory.group_commit). Batches only form
+# between the threads of a worker, so serve with --threads; beyond MAX_PENDING waiting orders, or when an order
+# is not taken into a batch within TIMEOUT seconds, a 429 is returned.
+ORDER_GROUP_COMMIT = {
+    'ENABLED': os.getenv('ORDER_GROUP_COMMIT', 'False') == 'True',
+    'MAX_WAIT_MS': float(os.getenv('ORDER_GROUP_COMMIT_MAX_WAIT_MS', '5')),
+    'MAX_BATCH': int(os.getenv('ORDER_GROUP_COMMIT_MAX_BATCH', '64')),
+    'MAX_PENDING': int(os.getenv('ORDER_GROUP_COMMIT_MAX_PENDING', '256')),
+    'TIMEOUT': float(os.getenv('ORDER_GROUP_COMMIT_TIMEOUT', '10')),  # Seconds
+}
+
 # -------------------------------------------------------------------
 # Spectacular Swagger Settings
 # -------------------------------------------------------------------
@@ -149,6 +323,12 @@ SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
 
+# Prebuilt schema artifacts written by `manage.py build_openapi_schema` and served statically.
+# Runtime schema generation (drf_spectacular views) is only mounted behind OPENAPI_RUNTIME_SCHEMA.
+OPENAPI_SCHEMA_DIR = BASE_DIR / 'openapi'
+OPENAPI_SCHEMA_MAX_AGE = int(os.getenv('OPENAPI_SCHEMA_MAX_AGE', str(60 * 60 * 24)))  # Seconds
+OPENAPI_RUNTIME_SCHEMA = os.getenv('OPENAPI_RUNTIME_SCHEMA', str(DEBUG)) == 'True' and not IS_PRODUCTION
+
 # -------------------------------------------------------------------
 # Password Validation
 # -------------------------------------------------------------------
@@ -202,11 +382,16 @@ AUTH_USER_MODEL = 'utils.User'
 # -------------------------------------------------------------------
 # Shell Plus (django-extensions)
 # -------------------------------------------------------------------
-SHELL_PLUS = "ipython"
+if not IS_PRODUCTION:
+    SHELL_PLUS = "ipython"
 
 # region Logging Configuration -------------------------------------------------------------------
-os.makedirs('logs', exist_ok=True)
+# Production logs to the console only; the log file (and its directory) is a development convenience
 LOG_FILE = os.path.join(BASE_DIR, 'logs/django.log')
+LOG_HANDLERS = ['console'] if IS_PRODUCTION else ['console', 'file']
+
+if not IS_PRODUCTION:
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
 
 LOGGING = {
     'version': 1,
@@ -232,11 +417,12 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': LOG_FILE,
             'formatter': 'verbose',
+            'delay': True,  # Open the file on first write, not at import
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': LOG_HANDLERS,
             'level': 'INFO' if DEBUG else 'DEBUG',
             'propagate': True,
         },
@@ -264,3 +450,12 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get('EMAIL')  # Your email address
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASSWORD')  # Your email password
 DEFAULT_FROM_EMAIL = os.environ.get('EMAIL')
+
+# Low-stock digests: crossings are collected for the window (seconds, 0 sends immediately), then one
+# email per recipient is sent over a single connection
+LOW_STOCK_ALERT_RECIPIENTS = [
+    email.strip() for email in os.environ.get('LOW_STOCK_ALERT_RECIPIENTS', 'merchant@example.com').split(',')
+    if email.strip()
+]
+LOW_STOCK_BRANCH_RECIPIENTS = {}  # Optional {branch id: [emails]} overriding the recipients per branch
+LOW_STOCK_DIGEST_WINDOW = float(os.environ.get('LOW_STOCK_DIGEST_WINDOW', '60'))
@@ -14,23 +14,41 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from utils.views import openapi_artifact
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('utils/', include('utils.urls')),
     path('inventory/', include('inventory.urls')),
+]
+
+# Prebuilt artifacts from `manage.py build_openapi_schema`
+openapi_artifact_urlpatterns = [
+    path('schema/', openapi_artifact,
+         {'filename': 'schema.yaml', 'content_type': 'application/vnd.oai.openapi'}, name='schema'),
+    path('swagger/', openapi_artifact,
+         {'filename': 'swagger.html', 'content_type': 'text/html'}, name='swagger-ui'),
+    path('redoc/', openapi_artifact,
+         {'filename': 'redoc.html', 'content_type': 'text/html'}, name='redoc'),
+]
 
-    # Swagger documentation paths
-    # Schema view for OpenAPI schema
-    path('schema/', SpectacularAPIView.as_view(), name='schema'),
+# Swagger documentation paths
+if settings.OPENAPI_RUNTIME_SCHEMA:
+    # Runtime generation re-introspects every view per request; debug only
+    from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
-    # Swagger UI
-    path('swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    urlpatterns += [
+        # Schema view for OpenAPI schema
+        path('schema/', SpectacularAPIView.as_view(), name='schema'),
 
-    # ReDoc
-    path('redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+        # Swagger UI
+        path('swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
 
-]
+        # ReDoc
+        path('redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    ]
+else:
+    urlpatterns += openapi_artifact_urlpatterns
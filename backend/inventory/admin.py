@@ -1,3 +1,92 @@
 from django.contrib import admin
+from utils.baseclasses.base_admin import LargeTableModelAdmin
+from .models import Ingredient, BranchIngredient, Product, ProductIngredient, ProductSubRecipe, Order, OrderProduct
+from .models import StockReservation, StockReservationLine, StockReservationProduct
 
-# Register your models here.
+
+class ProductIngredientInline(admin.TabularInline):
+    model = ProductIngredient
+    fields = ('ingredient', 'quantity', 'user_id_create', 'user_id_update')
+    autocomplete_fields = ('ingredient',)
+    raw_id_fields = ('user_id_create', 'user_id_update')
+    extra = 0
+
+
+class ProductSubRecipeInline(admin.TabularInline):
+    model = ProductSubRecipe
+    fk_name = 'parent'
+    fields = ('component', 'quantity', 'user_id_create', 'user_id_update')
+    autocomplete_fields = ('component',)
+    raw_id_fields = ('user_id_create', 'user_id_update')
+    extra = 0
+
+
+class OrderProductInline(admin.TabularInline):
+    model = OrderProduct
+    fields = ('product', 'quantity', 'user_id_create', 'user_id_update')
+    raw_id_fields = ('product', 'user_id_create', 'user_id_update')
+    extra = 0
+
+
+class StockReservationProductInline(admin.TabularInline):
+    model = StockReservationProduct
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+class StockReservationLineInline(admin.TabularInline):
+    model = StockReservationLine
+    raw_id_fields = ('ingredient',)
+    extra = 0
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(LargeTableModelAdmin):
+    list_display = ('id', 'name', 'stock', 'reserved', 'stock_initial', 'email_sent', 'updated_at')
+    search_fields = ('name',)
+
+
+@admin.register(BranchIngredient)
+class BranchIngredientAdmin(LargeTableModelAdmin):
+    list_display = ('id', 'branch', 'ingredient', 'stock', 'reserved', 'stock_initial', 'email_sent')
+    list_select_related = ('branch', 'ingredient')
+    autocomplete_fields = ('branch', 'ingredient')
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableModelAdmin):
+    list_display = ('id', 'name', 'updated_at')
+    search_fields = ('name',)
+    inlines = (ProductIngredientInline, ProductSubRecipeInline)
+
+
+@admin.register(ProductIngredient)
+class ProductIngredientAdmin(LargeTableModelAdmin):
+    list_display = ('id', 'product', 'ingredient', 'quantity')
+    list_select_related = ('product', 'ingredient')
+    autocomplete_fields = ('product', 'ingredient')
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableModelAdmin):
+    list_display = ('id', 'branch', 'user_id_create', 'created_at')
+    list_select_related = ('branch', 'user_id_create')
+    raw_id_fields = ('branch', 'user_id_create', 'user_id_update')
+    date_hierarchy = 'created_at'  # Backed by the inventory_order created_at index
+    inlines = (OrderProductInline,)
+
+
+@admin.register(OrderProduct)
+class OrderProductAdmin(LargeTableModelAdmin):
+    list_display = ('id', 'order', 'product', 'quantity', 'created_at')
+    list_select_related = ('order', 'product')
+    raw_id_fields = ('order', 'product', 'user_id_create', 'user_id_update')
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(LargeTableModelAdmin):
+    list_display = ('id', 'branch', 'status', 'expires_at', 'order', 'user_id_create')
+    list_filter = ('status',)
+    list_select_related = ('branch', 'user_id_create')
+    raw_id_fields = ('branch', 'order', 'user_id_create', 'user_id_update')
+    inlines = (StockReservationProductInline, StockReservationLineInline)
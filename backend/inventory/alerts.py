@@ -0,0 +1,118 @@
+# region Imports
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+# endregion
+
+logger = logging.getLogger(__name__)
+
+
+class LowStockAlertAggregator:
+    """
+    Collects low-stock threshold crossings for LOW_STOCK_DIGEST_WINDOW seconds, then sends one digest
+    per recipient, all over a single mail connection. A window of 0 flushes on every crossing.
+
+    Digests that fail to send are requeued for their recipient and retried with the next window, so a
+    mail outage delays alerts instead of dropping them (the ingredient's email flag is already set).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+
+    def record(self, ingredient, stock_limit):
+        """
+        Queues one threshold crossing; starts the window timer on the first crossing of a window.
+        """
+        crossing = {
+            'ingredient': ingredient.name,
+            'branch_id': getattr(ingredient, 'branch_id', None),
+            'stock': ingredient.stock,
+            'stock_initial': ingredient.stock_initial,
+            'stock_limit': stock_limit,
+        }
+        window = settings.LOW_STOCK_DIGEST_WINDOW
+
+        with self._lock:
+            self._pending.append(crossing)
+            self._schedule(window)
+
+        if window <= 0:
+            self.flush()
+
+    def _schedule(self, window):
+        # Call holding the lock
+        if window > 0 and self._timer is None:
+            self._timer = threading.Timer(window, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        Sends every pending crossing as one digest per recipient over one connection.
+        Returns the number of digests sent; the crossings of unsent digests are queued again.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not pending:
+            return 0
+
+        digests = list(self.group_by_recipient(pending).items())
+        sent = 0
+        try:
+            with get_connection(fail_silently=False) as connection:
+                for recipient, crossings in digests:
+                    sent += connection.send_messages([EmailMessage(
+                        subject=f"Stock Alert: {len(crossings)} ingredient(s) below threshold",
+                        body=self.render(crossings),
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        to=[recipient],
+                    )])
+        except Exception:
+            logger.exception("Sending low-stock digests failed, %s of %s will be retried",
+                             len(digests) - sent, len(digests))
+            with self._lock:
+                # Only the recipients that did not get their digest hear about these crossings again
+                self._pending[:0] = [{**crossing, 'recipients': [recipient]}
+                                     for recipient, crossings in digests[sent:] for crossing in crossings]
+                self._schedule(settings.LOW_STOCK_DIGEST_WINDOW)
+        return sent
+
+    @staticmethod
+    def group_by_recipient(crossings):
+        """
+        Maps each recipient to the crossings it should hear about: the branch's recipients from
+        LOW_STOCK_BRANCH_RECIPIENTS when configured, otherwise LOW_STOCK_ALERT_RECIPIENTS. Requeued
+        crossings keep the recipients that are still owed them.
+        """
+        grouped = {}
+        for crossing in crossings:
+            recipients = crossing.get('recipients') or settings.LOW_STOCK_BRANCH_RECIPIENTS.get(
+                crossing['branch_id'], settings.LOW_STOCK_ALERT_RECIPIENTS)
+            for recipient in recipients:
+                grouped.setdefault(recipient, []).append(crossing)
+        return grouped
+
+    @staticmethod
+    def render(crossings):
+        lines = ["The stock for the following ingredients is below the alert threshold:", ""]
+        for crossing in crossings:
+            branch = f" (branch {crossing['branch_id']})" if crossing['branch_id'] is not None else ""
+            lines.append(
+                f"- {crossing['ingredient']}{branch}: {crossing['stock'] / 1000:g}g left of "
+                f"{crossing['stock_initial'] / 1000:g}g, below {float(crossing['stock_limit']) * 100:g}%"
+            )
+        return "\n".join(lines)
+
+
+low_stock_alerts = LowStockAlertAggregator()
+
+# Do not drop crossings still waiting for their window when the worker exits
+atexit.register(low_stock_alerts.flush)
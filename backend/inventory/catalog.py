@@ -0,0 +1,110 @@
+# region Imports
+import base64
+import datetime
+import json
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from utils.endpointhandling.exceptions import BaseCustomException
+from .models import CatalogTombstone, Ingredient, Product, ProductIngredient
+# endregion
+
+# Catalog section -> (model, fields sent to terminals); every model has an (updated_at, id) index
+CATALOG_SECTIONS = {
+    'ingredients': (Ingredient, ['id', 'name']),
+    'products': (Product, ['id', 'name']),
+    'product_ingredients': (ProductIngredient, ['id', 'product_id', 'ingredient_id', 'quantity']),
+}
+TOMBSTONES = 'deleted'
+
+
+# region Cursor
+def encode_cursor(positions):
+    """
+    Opaque cursor holding the last (timestamp, id) served for each section.
+    """
+    data = {section: [moment.isoformat(), pk] for section, (moment, pk) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns {section: (timestamp, id)}; an empty cursor means a full initial sync.
+    """
+    if not cursor:
+        return {}
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return {section: (datetime.datetime.fromisoformat(moment), int(pk))
+                for section, (moment, pk) in data.items() if section in CATALOG_SECTIONS or section == TOMBSTONES}
+    except (ValueError, TypeError, AttributeError):
+        raise BaseCustomException("Invalid catalog cursor, restart the sync without `since`.", 400,
+                                  key="invalid_cursor")
+
+
+def after(queryset, field, position):
+    """
+    Rows strictly after (timestamp, id), in cursor order.
+    """
+    if position is not None:
+        moment, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': pk}))
+    return queryset.order_by(field, 'id')
+
+
+# endregion
+
+
+def catalog_changes(since=None, limit=None):
+    """
+    Catalog rows created or updated after the `since` cursor, plus the ids of rows deleted since then.
+
+    Each section returns at most `limit` rows ordered by (updated_at, id); `has_more` tells the terminal
+    to call again with the returned cursor. Rows saved within the last CATALOG_SYNC_SETTLE_SECONDS are held
+    back, so a transaction that commits late with an earlier updated_at is not skipped by the cursor.
+    Without `since` the whole catalog is returned and no tombstones are needed. Terminals apply the
+    upserts first, then drop the ids listed under `deleted`.
+    """
+    limit = limit or settings.CATALOG_SYNC_PAGE_SIZE
+    positions = decode_cursor(since)
+    settled_before = timezone.now() - datetime.timedelta(seconds=settings.CATALOG_SYNC_SETTLE_SECONDS)
+    changes, has_more = {}, False
+
+    for section, (model, fields) in CATALOG_SECTIONS.items():
+        queryset = after(model.objects.filter(updated_at__lt=settled_before), 'updated_at', positions.get(section))
+        rows = list(queryset.values(*fields, 'updated_at')[:limit + 1])
+        has_more |= len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            positions[section] = (rows[-1]['updated_at'], rows[-1]['id'])
+        changes[section] = [{**row, 'updated_at': row['updated_at'].isoformat()} for row in rows]
+
+    deleted = {section: [] for section in CATALOG_SECTIONS}
+    if since:
+        queryset = after(CatalogTombstone.objects.filter(deleted_at__lt=settled_before), 'deleted_at',
+                         positions.get(TOMBSTONES))
+        tombstones = list(queryset.values('id', 'model', 'object_id', 'deleted_at')[:limit + 1])
+        has_more |= len(tombstones) > limit
+        tombstones = tombstones[:limit]
+        for tombstone in tombstones:
+            deleted[tombstone['model']].append(tombstone['object_id'])
+        if tombstones:
+            positions[TOMBSTONES] = (tombstones[-1]['deleted_at'], tombstones[-1]['id'])
+    else:
+        # A full sync already lacks every deleted row, so its tombstone stream starts at the newest settled one
+        latest = (CatalogTombstone.objects.filter(deleted_at__lt=settled_before)
+                  .order_by('-deleted_at', '-id').values_list('deleted_at', 'id').first())
+        if latest:
+            positions[TOMBSTONES] = latest
+
+    return {**changes, TOMBSTONES: deleted, 'cursor': encode_cursor(positions), 'has_more': has_more}
+
+
+def record_tombstone(instance):
+    """
+    Called on post_delete of catalog models.
+    """
+    for section, (model, _) in CATALOG_SECTIONS.items():
+        if isinstance(instance, model):
+            CatalogTombstone.objects.create(model=section, object_id=instance.pk)
+            return
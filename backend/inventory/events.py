@@ -0,0 +1,274 @@
+# region Imports
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from django.conf import settings
+# endregion
+
+logger = logging.getLogger(__name__)
+
+# Assigns the next event id (a microsecond timestamp, strictly increasing), keeps the newest ARGV[3] events in
+# the replay set and publishes the event, all atomically: subscribers receive events in id order.
+PUBLISH_SCRIPT = """
+local now = redis.call('TIME')
+local event_id = now[1] * 1000000 + now[2]
+local last_id = tonumber(redis.call('GET', KEYS[1]) or '0')
+if event_id <= last_id then event_id = last_id + 1 end
+event_id = string.format('%d', event_id)
+redis.call('SET', KEYS[1], event_id)
+local message = event_id .. '\\0' .. ARGV[1] .. '\\0' .. ARGV[2]
+redis.call('ZADD', KEYS[2], event_id, message)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[3]) - 1)
+redis.call('PUBLISH', KEYS[3], message)
+return event_id
+"""
+
+
+class Event:
+    """
+    A committed domain event, encoded once per process as an SSE frame and shared by every subscriber.
+    """
+    __slots__ = ('id', 'branch_id', 'frame')
+
+    def __init__(self, event_id, body, branch_id=None):
+        self.id = event_id
+        self.branch_id = branch_id
+        self.frame = f"id: {event_id}\n".encode() + body
+
+    @staticmethod
+    def encode_body(event_type, data):
+        return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+    @classmethod
+    def from_message(cls, message):
+        """
+        Decodes an event published through Redis: b"<id>\\0<branch id or empty>\\0<body>".
+        """
+        event_id, branch_id, body = message.split(b'\0', 2)
+        return cls(int(event_id), body, int(branch_id) if branch_id else None)
+
+    def visible_to(self, branch_id):
+        """
+        Subscribers without a branch see every event; branch subscribers only see their branch.
+        """
+        return branch_id is None or self.branch_id is None or self.branch_id == branch_id
+
+
+class EventBroker:
+    """
+    Fan-out of committed events to server-sent-event subscribers.
+
+    With django-redis behind `alias`, events go through Redis so every worker's subscribers see every event,
+    whichever worker (WSGI or ASGI) committed it: a script assigns the id, appends the event to a shared replay
+    set and publishes it on `channel`, and one listener thread per process hands it to that process's
+    subscribers. Other cache backends keep events inside the process, which only works with a single worker.
+
+    The replay buffer keeps the newest `buffer_size` events, so a reconnecting client can resume from its
+    Last-Event-ID instead of reloading history. Event ids are microsecond timestamps made strictly increasing,
+    so they stay ordered across restarts.
+
+    Each subscriber queue holds at most `queue_size` events. A subscriber that falls that far behind is
+    dropped and its stream ends, so a stalled client cannot grow memory; it reconnects with its
+    Last-Event-ID and catches up from the replay buffer.
+    """
+
+    def __init__(self, buffer_size=1000, queue_size=100, alias=None, channel='order-events'):
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=buffer_size)
+        self._buffer_size = buffer_size
+        self._queue_size = queue_size
+        self._subscribers = set()
+        self._last_id = 0
+        self.alias = alias
+        self.channel = channel
+        self._listener_pid = None
+        self._publish_script = None
+
+    def redis(self):
+        """
+        The shared Redis connection, or None when events stay inside this process.
+        """
+        if self.alias is None:
+            return None
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection(self.alias)
+        except (ImportError, NotImplementedError):
+            return None
+
+    # region Redis Keys
+    def _last_id_key(self):
+        return f'{self.channel}:last-id'
+
+    def _replay_key(self):
+        return f'{self.channel}:replay'
+
+    # endregion
+
+    def publish(self, event_type, data, branch_id=None):
+        """
+        Encodes the event once and hands it to every subscriber. Safe to call from any thread.
+        """
+        body = Event.encode_body(event_type, data)
+        connection = self.redis()
+        if connection is not None:
+            if self._publish_script is None:
+                self._publish_script = connection.register_script(PUBLISH_SCRIPT)
+            event_id = self._publish_script(
+                keys=[self._last_id_key(), self._replay_key(), self.channel],
+                args=['' if branch_id is None else branch_id, body, self._buffer_size],
+                client=connection,
+            )
+            return Event(int(event_id), body, branch_id)  # Subscribers get it from the listener
+
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+            event = Event(self._last_id, body, branch_id)
+            self._buffer.append(event)
+            self._fan_out(event)
+        return event
+
+    def _fan_out(self, event):
+        """
+        Schedules the event on every subscriber's loop; called under the lock so events arrive in id order.
+        """
+        for subscriber in self._subscribers:
+            subscriber[0].call_soon_threadsafe(self._deliver, subscriber, event)
+
+    def _deliver(self, subscriber, event):
+        """
+        Queues the event on the subscriber's loop, or drops a subscriber whose queue is full: its pending
+        events are discarded and the stream is told to close (None).
+        """
+        _, queue = subscriber
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.unsubscribe(subscriber)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def replay(self, last_event_id):
+        """
+        Returns the buffered events newer than last_event_id.
+        """
+        connection = self.redis()
+        if connection is not None:
+            messages = connection.zrangebyscore(self._replay_key(), f'({last_event_id}', '+inf')
+            return [Event.from_message(message) for message in messages]
+        with self._lock:
+            return [event for event in self._buffer if event.id > last_event_id]
+
+    # region Redis Listener
+    def ensure_listener(self):
+        """
+        Starts this process's listener thread on the event channel unless it runs already, so workers forked
+        from the master get their own.
+        """
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            connection = self.redis()
+            if connection is not None:
+                threading.Thread(target=self._listen, args=(connection,), name='event-stream', daemon=True).start()
+            self._listener_pid = os.getpid()
+
+    def _listen(self, connection):
+        while True:
+            try:
+                pubsub = connection.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    try:
+                        event = Event.from_message(message['data'])
+                        with self._lock:
+                            self._fan_out(event)
+                    except Exception:
+                        logger.exception("Malformed event stream message: %r", message)
+            except Exception:
+                # Subscribers miss what is published while disconnected; they catch up when they reconnect
+                logger.exception("Event stream listener lost its Redis connection, resubscribing")
+                time.sleep(1)
+
+    # endregion
+
+    def subscribe(self):
+        """
+        Registers a subscriber queue bound to the running event loop.
+        """
+        self.ensure_listener()
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self._queue_size))
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    async def stream(self, last_event_id=None, branch_id=None, keepalive=15):
+        """
+        Async generator of SSE frames: the missed events after last_event_id, then live events.
+        Sends a comment line every `keepalive` seconds so proxies keep the connection open, and ends when
+        the subscriber is dropped for falling behind.
+        """
+        subscriber = self.subscribe()
+        try:
+            sent_id = last_event_id or 0
+            if last_event_id is not None:
+                for event in self.replay(last_event_id):
+                    if event.visible_to(branch_id):
+                        sent_id = event.id
+                        yield event.frame
+
+            _, queue = subscriber
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event is None:
+                    return  # Dropped for falling behind; the client reconnects and replays from sent_id
+                # Events published during the replay may already have been sent
+                if event.id > sent_id and event.visible_to(branch_id):
+                    sent_id = event.id
+                    yield event.frame
+        finally:
+            self.unsubscribe(subscriber)
+
+
+broker = EventBroker(
+    settings.EVENT_STREAM['BUFFER_SIZE'], settings.EVENT_STREAM['QUEUE_SIZE'],
+    settings.EVENT_STREAM['SHARED_ALIAS'], settings.EVENT_STREAM['CHANNEL'],
+)
+
+
+# region Event Publishers
+def publish_order_created(order, products_data):
+    broker.publish('order_created', {
+        'id': order.id,
+        'branch': order.branch_id,
+        'created_at': order.created_at,
+        'products': [
+            {'product': product_data['product'].id, 'quantity': product_data['quantity']}
+            for product_data in products_data
+        ],
+    }, branch_id=order.branch_id)
+
+
+def publish_low_stock(stock_row, branch_id=None):
+    broker.publish('low_stock', {
+        'ingredient': stock_row.name,
+        'branch': branch_id,
+        'stock_mg': stock_row.stock,
+        'stock_initial_mg': stock_row.stock_initial,
+    }, branch_id=branch_id)
+# endregion
@@ -0,0 +1,154 @@
+# region Imports
+import csv
+import datetime
+import json
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_date, parse_datetime
+from utils.endpointhandling.exceptions import BaseCustomException
+from .models import Order, OrderProduct
+# endregion
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CSV_HEADER = ['order_id', 'created_at', 'branch_id', 'created_by_id', 'product_id', 'product', 'quantity']
+DEFAULT_CHUNK_SIZE = 2000
+WRITE_BUFFER_BYTES = 64 * 1024  # Rows are joined into blocks this size before being sent
+
+
+# region Date Range
+def parse_export_bound(value, name, end=False):
+    """
+    Parses an ISO date or datetime. A plain date used as the end bound covers that whole day.
+    """
+    if not value:
+        return None
+    try:
+        day = parse_date(value)  # Checked first, parse_datetime also accepts a bare date
+        parsed = None if day else parse_datetime(value)
+    except ValueError:
+        day = parsed = None
+    if day is not None:
+        return datetime.datetime.combine(day + datetime.timedelta(days=1) if end else day, datetime.time.min)
+    if parsed is None:
+        raise BaseCustomException(f"Invalid {name}: expected YYYY-MM-DD or an ISO datetime.", 400,
+                                  key="invalid_date_range", errors={name: value})
+    return parsed + datetime.timedelta(microseconds=1) if end else parsed
+
+
+# endregion
+
+
+# region Querying
+def export_queryset(start=None, end=None, branch_id=None, using=None):
+    """
+    Orders created in [start, end) ordered by creation, with their line items and product names
+    prefetched. Iterate it with `.iterator(chunk_size=...)` so each chunk's line items are fetched in
+    one query and nothing beyond the current chunk is kept in memory.
+    """
+    queryset = Order.objects.all()
+    if using:
+        queryset = queryset.using(using)
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+    if branch_id is not None:
+        queryset = queryset.filter(branch_id=branch_id)
+
+    lines = OrderProduct.objects.select_related('product').only('order_id', 'quantity', 'product__name')
+    if using:
+        lines = lines.using(using)
+    return (queryset.order_by('created_at', 'id')
+            .only('id', 'created_at', 'branch_id', 'user_id_create_id')
+            .prefetch_related(Prefetch('orderproduct_set', queryset=lines.order_by('id'))))
+
+
+def iter_orders(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields one plain dict per order, line items included.
+    """
+    for order in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'order_id': order.id,
+            'created_at': order.created_at.isoformat(),
+            'branch_id': order.branch_id,
+            'created_by_id': order.user_id_create_id,
+            'products': [{'product_id': line.product_id, 'product': line.product.name, 'quantity': line.quantity}
+                         for line in order.orderproduct_set.all()],
+        }
+
+
+# endregion
+
+
+# region Encoding
+class _LineBuffer:
+    """
+    File-like target for csv.writer that hands each written row back instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(orders):
+    """
+    Encodes orders as CSV, one row per line item, yielding bytes row by row.
+    """
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(CSV_HEADER).encode()
+    for order in orders:
+        for line in order['products']:
+            yield writer.writerow([order['order_id'], order['created_at'], order['branch_id'],
+                                   order['created_by_id'], line['product_id'], line['product'],
+                                   line['quantity']]).encode()
+
+
+def stream_ndjson(orders):
+    """
+    Encodes orders as newline-delimited JSON, one order per line.
+    """
+    for order in orders:
+        yield (json.dumps(order, separators=(',', ':')) + '\n').encode()
+
+
+def buffered(chunks, size=WRITE_BUFFER_BYTES):
+    """
+    Joins small byte chunks into blocks of about `size` bytes to avoid one socket write per row.
+    """
+    block, block_size = [], 0
+    for chunk in chunks:
+        block.append(chunk)
+        block_size += len(chunk)
+        if block_size >= size:
+            yield b''.join(block)
+            block, block_size = [], 0
+    if block:
+        yield b''.join(block)
+
+
+def stream_export(export_format, queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Byte blocks of the export in the given format.
+    """
+    encoder = stream_csv if export_format == 'csv' else stream_ndjson
+    return buffered(encoder(iter_orders(queryset, chunk_size)))
+
+
+async def async_blocks(blocks):
+    """
+    Async iterator over the blocks for ASGI responses, which would otherwise collect a sync iterator into a list
+    before sending anything. Each block is produced in the request's sync thread, where its database cursor lives.
+    """
+    iterator = iter(blocks)
+    while True:
+        block = await sync_to_async(next)(iterator, None)
+        if block is None:
+            return
+        yield block
+
+
+# endregion
@@ -0,0 +1,190 @@
+# region Imports
+import datetime
+import threading
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from utils.caching import get_two_tier_cache
+from .models import FlattenedRecipe, OrderProduct, StockPartition
+# endregion
+
+# NumPy is imported on first projection only, so it never weighs on worker boot
+np = None
+
+
+def _numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+def epoch_hour(moment):
+    return int(moment.timestamp() // 3600)
+
+
+class StockoutProjector:
+    """
+    Hourly ingredient consumption of one stock partition over a sliding window, kept as a
+    (window_hours x ingredients) NumPy matrix and folded forward incrementally: each refresh only re-reads
+    the most recent `overlap_hours` of order lines by creation time, aggregated per (hour, product) in SQL,
+    and expands them through the flattened recipes with one matrix product. Re-reading whole hours rather
+    than orders past an id catches orders whose transaction committed after a higher id was seen.
+
+    The burn rate is an exponentially weighted mean of the complete hours in the window (recent hours
+    weigh more; the current, partial hour is left out), and hours to stockout is stock / burn rate.
+    """
+    overlap_hours = 2  # The current and previous hour; orders commit long before an hour settles
+
+    def __init__(self, branch_id=None, window_hours=None, half_life_hours=None):
+        np = _numpy()
+        self.partition = StockPartition(branch_id)
+        self.window_hours = window_hours or settings.STOCKOUT_FORECAST['WINDOW_HOURS']
+        self.half_life_hours = half_life_hours or settings.STOCKOUT_FORECAST['HALF_LIFE_HOURS']
+        self.end_hour = None  # Epoch hour of the last (current) bucket
+        self.ingredient_index = {}  # ingredient id -> column
+        self.buckets = np.zeros((self.window_hours, 0))
+        self.lock = threading.Lock()
+
+    # region Incremental Refresh
+    def refresh(self, now=None):
+        """
+        Slides the window to the current hour and re-reads the hours that may still receive orders:
+        the whole window on the first refresh, then the last `overlap_hours` plus any hours skipped since.
+        """
+        np = _numpy()
+        now_hour = epoch_hour(now or timezone.now())
+        if self.end_hour is None:
+            first_hour = now_hour - self.window_hours + 1
+        else:
+            first_hour = min(self.end_hour, now_hour) - self.overlap_hours + 1
+            shift = now_hour - self.end_hour
+            if shift >= self.window_hours:
+                self.buckets[:] = 0
+            elif shift > 0:
+                self.buckets = np.roll(self.buckets, -shift, axis=0)
+                self.buckets[-shift:] = 0
+        self.end_hour = now_hour
+        first_hour = max(first_hour, now_hour - self.window_hours + 1)
+        self.buckets[first_hour - now_hour - 1:] = 0
+
+        grouped = list(
+            OrderProduct.objects.filter(
+                order__branch_id=self.partition.branch_id,
+                order__created_at__gte=datetime.datetime.fromtimestamp(first_hour * 3600),
+                order__created_at__lt=datetime.datetime.fromtimestamp((now_hour + 1) * 3600),
+            )
+            .annotate(hour=TruncHour('order__created_at')).values('hour', 'product_id')
+            .annotate(total=Sum('quantity')).values_list('hour', 'product_id', 'total')
+        )
+        if grouped:
+            self.fold(grouped, now_hour)
+
+    def fold(self, grouped, now_hour):
+        """
+        Adds (hour, product id, units) rows to the buckets: units (hours x products) @ recipes (products x
+        ingredients) gives milligrams per hour and ingredient.
+        """
+        np = _numpy()
+        rows = [self.window_hours - 1 - (now_hour - epoch_hour(hour)) for hour, _, _ in grouped]
+        # Rows outside the window (clock skew, ingested timestamps) are left out rather than misplaced
+        grouped = [line for line, row in zip(grouped, rows) if 0 <= row < self.window_hours]
+        rows = [row for row in rows if 0 <= row < self.window_hours]
+        if not grouped:
+            return
+        product_ids = sorted({product_id for _, product_id, _ in grouped})
+        product_index = {product_id: column for column, product_id in enumerate(product_ids)}
+
+        recipe_lines = list(FlattenedRecipe.objects.filter(product_id__in=product_ids).values_list(
+            'product_id', 'ingredient_id', 'quantity'))
+        for _, ingredient_id, _ in recipe_lines:
+            if ingredient_id not in self.ingredient_index:
+                self.ingredient_index[ingredient_id] = len(self.ingredient_index)
+        if len(self.ingredient_index) > self.buckets.shape[1]:
+            self.buckets = np.pad(self.buckets, ((0, 0), (0, len(self.ingredient_index) - self.buckets.shape[1])))
+
+        units = np.zeros((self.window_hours, len(product_ids)))
+        np.add.at(units, (rows, [product_index[product_id] for _, product_id, _ in grouped]),
+                  [total for _, _, total in grouped])
+        recipes = np.zeros((len(product_ids), self.buckets.shape[1]))
+        if recipe_lines:
+            recipe_products, recipe_ingredients, recipe_quantities = zip(*recipe_lines)
+            recipes[[product_index[product_id] for product_id in recipe_products],
+                    [self.ingredient_index[ingredient_id] for ingredient_id in recipe_ingredients]] = recipe_quantities
+        self.buckets += units @ recipes
+
+    # endregion
+
+    # region Projection
+    def burn_rates(self):
+        """
+        Milligrams per hour per ingredient column, weighted towards recent complete hours.
+        """
+        np = _numpy()
+        complete = self.buckets[:-1]
+        age = np.arange(len(complete))[::-1]  # Hours before the newest complete hour
+        weights = 0.5 ** (age / self.half_life_hours)
+        return weights @ complete / weights.sum() if len(complete) else np.zeros(self.buckets.shape[1])
+
+    def project(self):
+        """
+        Returns one entry per stocked ingredient, soonest stockout first; ingredients that are not being
+        consumed have no projected stockout.
+        """
+        np = _numpy()
+        ids, names, stock = [], [], []
+        for ingredient_id, name, level in self.partition.queryset.values_list(
+                self.partition.ingredient_field, self.partition.name_field, 'stock'):
+            ids.append(ingredient_id)
+            names.append(name)
+            stock.append(level)
+        stock = np.array(stock, dtype=float)
+
+        rates = np.zeros(len(ids))
+        known = [position for position, ingredient_id in enumerate(ids) if ingredient_id in self.ingredient_index]
+        if known:
+            rates[known] = self.burn_rates()[[self.ingredient_index[ids[position]] for position in known]]
+        hours = np.divide(stock, rates, out=np.full(len(ids), np.inf), where=rates > 0)
+
+        now = timezone.now()
+        projection = []
+        for position in np.argsort(hours, kind='stable'):
+            finite = bool(np.isfinite(hours[position]))
+            projection.append({
+                'ingredient_id': ids[position],
+                'ingredient': names[position],
+                'stock': int(stock[position]),
+                'burn_rate_per_hour': round(float(rates[position]), 3),
+                'hours_to_stockout': round(float(hours[position]), 2) if finite else None,
+                'stockout_at': (now + datetime.timedelta(hours=float(hours[position]))).isoformat()
+                if finite else None,
+            })
+        return projection
+
+    # endregion
+
+
+# One incrementally refreshed projector per stock partition in this process
+_projectors = {}
+_projectors_lock = threading.Lock()
+
+
+def stockout_projection(branch_id=None):
+    """
+    Cached projection of a partition, recomputed at most every STOCKOUT_FORECAST['REFRESH_SECONDS'] by one
+    worker at a time; each recompute only re-reads the most recent hours.
+    """
+    def compute():
+        with _projectors_lock:
+            projector = _projectors.get(branch_id)
+            if projector is None:
+                projector = _projectors[branch_id] = StockoutProjector(branch_id)
+        with projector.lock:
+            projector.refresh()
+            return {'generated_at': timezone.now().isoformat(), 'window_hours': projector.window_hours,
+                    'ingredients': projector.project()}
+
+    return get_two_tier_cache('stockout').get_or_set(
+        f'branch:{branch_id}', compute, timeout=settings.STOCKOUT_FORECAST['REFRESH_SECONDS'])
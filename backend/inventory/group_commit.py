@@ -0,0 +1,209 @@
+# region Imports
+import logging
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from utils.admission import ServiceOverloaded
+from .events import publish_order_created
+from .ingest import StockChanged, admit_orders, apply_orders
+from .models import StockPartition
+from .reservations import release_expired_reservations
+from .serializers import OrderSerializer
+# endregion
+
+logger = logging.getLogger(__name__)
+
+
+class PendingOrder:
+    """
+    A validated order waiting for the group-commit writer, and the outcome the request thread waits on.
+    Either the writer claims it for a batch or the request, tired of waiting, cancels it; never both.
+    """
+    QUEUED, WRITING, CANCELLED = 'queued', 'writing', 'cancelled'
+    created_at = None
+
+    def __init__(self, products, user, branch_id):
+        self.products = products
+        self.user = user
+        self.branch_id = branch_id
+        self.consumption = OrderSerializer.calculate_consumption(products)
+        self.order = None
+        self.error = None
+        self.done = threading.Event()
+        self.state = self.QUEUED
+        self._state_lock = threading.Lock()
+
+    def _leave_queue(self, state):
+        with self._state_lock:
+            if self.state != self.QUEUED:
+                return False
+            self.state = state
+            return True
+
+    def claim(self):
+        """
+        Writer side: takes the order into a batch; False if its request already gave up.
+        """
+        return self._leave_queue(self.WRITING)
+
+    def cancel(self):
+        """
+        Request side: withdraws the order; False if the writer is already committing it.
+        """
+        return self._leave_queue(self.CANCELLED)
+
+    def resolve(self, order=None, error=None):
+        self.order, self.error = order, error
+        self.done.set()
+
+
+class GroupCommitWriter:
+    """
+    Gathers orders created concurrently in this process and writes them in one transaction.
+
+    Request threads hand their validated order to submit() and wait. A single writer thread takes the first
+    waiting order, collects whatever else arrives within `max_wait` seconds (up to `max_batch` orders), then
+    admits them in arrival order against one stock read and commits the accepted ones together: one
+    conditional UPDATE per ingredient with the batch's combined consumption and bulk inserts of the orders
+    and their lines. Each request then gets its own order or its own insufficient-stock error, so a batch
+    pays a single commit (fsync) however many orders it holds.
+
+    A request whose order is not taken into a batch within `timeout` seconds withdraws it and gets a 429,
+    so a stalled or dead writer never hangs requests; a dead writer is restarted by the next submit().
+    """
+    max_retries = 3
+
+    def __init__(self, max_wait, max_batch, max_pending, timeout=10):
+        self.max_wait = max_wait
+        self.max_batch = max(1, max_batch)
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._writer_pid = None
+        self._writer_thread = None
+        self._lock = threading.Lock()
+
+    # region Request Side
+    def submit(self, products, user, branch_id):
+        """
+        Queues an order for the next batch and blocks until it is committed; returns the created Order or
+        raises the order's error (insufficient stock, or ServiceOverloaded when too many are waiting or the
+        writer does not take the order in time).
+        """
+        pending = PendingOrder(products, user, branch_id)
+        OrderSerializer.check_available(pending.consumption, StockPartition(branch_id))  # Fast read-only reject
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            raise ServiceOverloaded("Too many orders waiting for the group commit, retry in 1s.", 1)
+
+        if not pending.done.wait(self.timeout):
+            if pending.cancel():
+                raise ServiceOverloaded("The group commit did not take the order in time, retry in 1s.", 1)
+            # The writer is committing it: wait for the outcome as long as the writer lives
+            while not pending.done.wait(1):
+                if not self._writer_alive() and not pending.done.is_set():
+                    raise ServiceOverloaded("The group commit writer stopped, retry in 1s.", 1)
+        if pending.error is not None:
+            raise pending.error
+        return pending.order
+
+    # endregion
+
+    # region Writer Side
+    def _writer_alive(self):
+        # A writer started before a fork does not exist in the child
+        return self._writer_pid == os.getpid() and self._writer_thread.is_alive()
+
+    def _ensure_writer(self):
+        if self._writer_alive():
+            return
+        with self._lock:
+            if not self._writer_alive():
+                self._writer_thread = threading.Thread(target=self._run, name='order-group-commit', daemon=True)
+                self._writer_thread.start()
+                self._writer_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [pending for pending in self.gather() if pending.claim()]
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                self.commit(batch)
+            except Exception as e:
+                logger.exception("Group commit of %s orders failed", len(batch))
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.resolve(error=e)
+
+    def gather(self):
+        """
+        Blocks for the first order, then takes what arrives within max_wait, up to max_batch orders.
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def commit(self, batch):
+        """
+        Admits and writes one batch in a single transaction, then answers every order in it.
+        """
+        for attempt in range(self.max_retries):
+            accepted, short = admit_orders(batch)
+            if short and release_expired_reservations():
+                accepted, short = admit_orders(batch)
+            if not accepted:
+                created = []
+                break
+            try:
+                with transaction.atomic():
+                    created = apply_orders(accepted)  # Each stock row records its last order's user
+                    for pending, order in zip(accepted, created):
+                        transaction.on_commit(
+                            lambda order=order, products=pending.products: publish_order_created(order, products))
+                break
+            except StockChanged:
+                # Orders outside this process consumed stock since the admission read; admit again
+                logger.info("Stock changed under a group commit of %s orders, retrying (attempt %s)",
+                            len(batch), attempt + 1)
+        else:
+            raise StockChanged(f"Stock kept changing under a group commit of {len(batch)} orders")
+
+        for pending, order in zip(accepted, created):
+            pending.resolve(order)
+        for pending, entries in short:
+            pending.resolve(error=OrderSerializer.shortfall_error(entries))
+        logger.debug("Group commit: %s orders accepted, %s rejected", len(accepted), len(short))
+
+    # endregion
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_group_commit_writer():
+    """
+    Returns this process's writer when settings.ORDER_GROUP_COMMIT is enabled, else None.
+    """
+    global _writer
+    config = settings.ORDER_GROUP_COMMIT
+    if not config['ENABLED']:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = GroupCommitWriter(config['MAX_WAIT_MS'] / 1000, config['MAX_BATCH'], config['MAX_PENDING'],
+                                            config['TIMEOUT'])
+    return _writer
@@ -0,0 +1,278 @@
+# region Imports
+import json
+import logging
+import time
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+from utils.models import Branch, User
+from .models import Order, OrderIngestCheckpoint, OrderProduct, StockPartition, get_stock_limit
+from .serializers import OrderSerializer
+# endregion
+
+logger = logging.getLogger(__name__)
+
+
+class StockChanged(Exception):
+    """
+    A conditional stock update found less stock than the batch was admitted against; retry the batch.
+    """
+
+
+# region Batched Order Writes
+def admit_orders(orders):
+    """
+    Splits orders (objects with `branch_id` and `consumption`) into (accepted, [(order, shortfall entries)])
+    against one stock read per branch, in order: each accepted order reduces the stock left for the next.
+    Shortfall entries have the shape of OrderSerializer.check_inventory().
+    """
+    remaining, accepted, rejected = {}, [], []
+    by_branch = defaultdict(set)
+    for order in orders:
+        by_branch[order.branch_id].update(order.consumption)
+    for branch_id, ingredient_ids in by_branch.items():
+        remaining[branch_id] = StockPartition(branch_id).stock_levels(ingredient_ids)
+
+    for order in orders:
+        stock = remaining[order.branch_id]
+        short = [{'ingredient_id': ingredient_id, 'ingredient': stock[ingredient_id][0], 'required': required,
+                  'available': stock[ingredient_id][1], 'shortfall': required - stock[ingredient_id][1]}
+                 for ingredient_id, required in order.consumption.items() if stock[ingredient_id][1] < required]
+        if short:
+            rejected.append((order, short))
+            continue
+        for ingredient_id, required in order.consumption.items():
+            name, level = stock[ingredient_id]
+            stock[ingredient_id] = (name, level - required)
+        accepted.append(order)
+    return accepted, rejected
+
+
+def apply_orders(orders, stock_user=None):
+    """
+    Writes admitted orders (objects with `products`, `user`, `branch_id`, `created_at` and `consumption`)
+    with one conditional UPDATE per ingredient for their aggregated consumption and bulk inserts of the
+    orders and their lines; returns the created orders, in order. Call inside a transaction; raises
+    StockChanged if stock was consumed since admission.
+
+    Stock rows record `stock_user` as their last editor, or by default the user of the last order that
+    consumed them, as if the orders had been written one by one.
+    """
+    stock_limit = get_stock_limit()
+    totals = defaultdict(lambda: defaultdict(int))
+    last_users = defaultdict(dict)
+    for order in orders:
+        for ingredient_id, required in order.consumption.items():
+            totals[order.branch_id][ingredient_id] += required
+            last_users[order.branch_id][ingredient_id] = order.user
+
+    for branch_id, consumption in totals.items():
+        partition = StockPartition(branch_id)
+        for ingredient_id, required in consumption.items():
+            if not partition.row(ingredient_id).filter(stock__gte=required).update(
+                    stock=F('stock') - required,
+                    user_id_update=stock_user or last_users[branch_id][ingredient_id]):
+                raise StockChanged(ingredient_id)
+        OrderSerializer.flag_low_stock(partition, consumption, stock_limit)
+
+    created = Order.objects.bulk_create([
+        Order(branch_id=order.branch_id, user_id_create=order.user, user_id_update=order.user)
+        for order in orders
+    ])
+    backdated = []
+    for order, row in zip(orders, created):
+        if order.created_at is not None:
+            row.created_at = order.created_at
+            backdated.append(row)
+    if backdated:
+        Order.objects.bulk_update(backdated, ['created_at'])
+
+    OrderProduct.objects.bulk_create([
+        OrderProduct(order=row, product=product['product'], quantity=product['quantity'],
+                     user_id_create=order.user, user_id_update=order.user)
+        for order, row in zip(orders, created)
+        for product in order.products
+    ])
+    return created
+# endregion
+
+
+class SpooledOrder:
+    """
+    One validated NDJSON line: the order's products, owner, branch and consumption.
+    """
+
+    def __init__(self, line_number, raw, products, user, branch_id, created_at, consumption):
+        self.line_number = line_number
+        self.raw = raw
+        self.products = products
+        self.user = user
+        self.branch_id = branch_id
+        self.created_at = created_at
+        self.consumption = consumption
+
+
+class OrderIngestor:
+    """
+    Replays spooled orders from an NDJSON file (one `POST /inventory/orders/` payload per line, optionally
+    with "branch", "user" (email) and "created_at") in batches.
+
+    Each line is validated by OrderSerializer. Every batch is admitted against one stock read per branch,
+    then committed in a single transaction: one conditional UPDATE per ingredient with the batch's
+    aggregated consumption, bulk inserts of the orders and their lines, and the checkpoint. Lines that fail
+    validation or do not fit the remaining stock are appended to the rejects file with the reason.
+    """
+    max_retries = 3
+
+    def __init__(self, default_user, batch_size=500, rejects=None, stdout=None):
+        self.default_user = default_user
+        self.batch_size = batch_size
+        self.rejects = rejects  # Binary file object, or None to only count rejections
+        self.stdout = stdout
+        self._users = {default_user.email: default_user}
+        self._branches = {}
+
+    # region Reading
+    def ingest(self, path):
+        """
+        Streams the file from its checkpoint to the end; returns the checkpoint.
+        """
+        checkpoint, _ = OrderIngestCheckpoint.objects.get_or_create(source=str(path))
+        started, accepted_before = time.monotonic(), checkpoint.accepted
+
+        with open(path, 'rb') as spool:
+            spool.seek(checkpoint.offset)
+            offset, line_number, batch = checkpoint.offset, checkpoint.lines, []
+            for raw in spool:
+                if not raw.endswith(b'\n') and not self.is_complete(raw):
+                    break  # The device is still writing this line; it is picked up by the next run
+                offset += len(raw)
+                line_number += 1
+                if raw.strip():
+                    batch.append((line_number, raw))
+                if len(batch) >= self.batch_size:
+                    self.commit_batch(checkpoint, batch, offset, line_number)
+                    self.report(path, checkpoint, started, accepted_before)
+                    batch = []
+            if batch or line_number != checkpoint.lines:
+                self.commit_batch(checkpoint, batch, offset, line_number)
+                self.report(path, checkpoint, started, accepted_before)
+        return checkpoint
+
+    @staticmethod
+    def is_complete(raw):
+        try:
+            json.loads(raw)
+            return True
+        except ValueError:
+            return False
+
+    def report(self, path, checkpoint, started, accepted_before):
+        if self.stdout is not None:
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f"{path}: line {checkpoint.lines}, {checkpoint.accepted} accepted, "
+                              f"{checkpoint.rejected} rejected, "
+                              f"{(checkpoint.accepted - accepted_before) / elapsed:.1f} orders/s")
+
+    # endregion
+
+    # region Validation
+    def parse(self, line_number, raw):
+        """
+        Returns a SpooledOrder, or raises ValueError with the rejection reason.
+        """
+        try:
+            payload = json.loads(raw)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON: {e}")
+        if not isinstance(payload, dict):
+            raise ValueError("expected a JSON object")
+
+        serializer = OrderSerializer(data=payload)
+        if not serializer.is_valid():
+            raise ValueError(serializer.errors)
+        products = serializer.validated_data['products']
+
+        user = self.user_for(payload.get('user'))
+        branch_id = self.branch_for(payload['branch']) if payload.get('branch') is not None else user.branch_id
+        created_at = None
+        if payload.get('created_at'):
+            created_at = parse_datetime(payload['created_at'])
+            if created_at is None:
+                raise ValueError(f"invalid created_at: {payload['created_at']}")
+        return SpooledOrder(line_number, raw, products, user, branch_id, created_at,
+                            OrderSerializer.calculate_consumption(products))
+
+    def user_for(self, email):
+        if not email:
+            return self.default_user
+        if email not in self._users:
+            self._users[email] = User.objects.filter(email=email).first()
+        if self._users[email] is None:
+            raise ValueError(f"unknown user: {email}")
+        return self._users[email]
+
+    def branch_for(self, branch_id):
+        if branch_id not in self._branches:
+            self._branches[branch_id] = Branch.objects.filter(pk=branch_id).exists()
+        if not self._branches[branch_id]:
+            raise ValueError(f"unknown branch: {branch_id}")
+        return branch_id
+
+    # endregion
+
+    # region Batches
+    def admit(self, orders):
+        """
+        Splits orders into (accepted, [(order, reason)]) against one stock read per branch, in file order.
+        """
+        accepted, short = admit_orders(orders)
+        return accepted, [
+            (order, f"insufficient stock for ingredients {sorted(entry['ingredient_id'] for entry in entries)}")
+            for order, entries in short
+        ]
+
+    def commit_batch(self, checkpoint, lines, offset, line_number):
+        orders, rejected = [], []
+        for number, raw in lines:
+            try:
+                orders.append(self.parse(number, raw))
+            except ValueError as e:
+                rejected.append((number, raw, str(e)))
+
+        for attempt in range(self.max_retries):
+            accepted, short = self.admit(orders)
+            try:
+                with transaction.atomic():
+                    self.apply(accepted)
+                    checkpoint.offset, checkpoint.lines = offset, line_number
+                    checkpoint.accepted += len(accepted)
+                    checkpoint.rejected += len(rejected) + len(short)
+                    checkpoint.save()
+                    # Written before the commit: a crash here repeats rejects on resume rather than losing them
+                    self.write_rejects(rejected + [(order.line_number, order.raw, reason) for order, reason in short])
+                break
+            except StockChanged:
+                # Live orders consumed stock since the admission read; re-admit against fresh levels
+                checkpoint.refresh_from_db()
+                logger.info("Stock changed while ingesting %s, retrying batch (attempt %s)",
+                            checkpoint.source, attempt + 1)
+        else:
+            raise StockChanged(f"Stock kept changing under batch ending at line {line_number}")
+
+    def apply(self, orders):
+        """
+        Writes an admitted batch; call inside a transaction.
+        """
+        apply_orders(orders, self.default_user)
+
+    def write_rejects(self, rejected):
+        if self.rejects is None or not rejected:
+            return
+        for line_number, raw, reason in rejected:
+            self.rejects.write((json.dumps({'line': line_number, 'error': reason,
+                                            'order': raw.decode(errors='replace').strip()}) + '\n').encode())
+        self.rejects.flush()
+
+    # endregion
@@ -0,0 +1,182 @@
+# region Imports
+import datetime
+import json
+import re
+import sys
+from contextlib import ExitStack, contextmanager
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.urls import get_resolver
+from rest_framework.test import APIClient
+from inventory.ingest import apply_orders
+from inventory.models import Order, Product, StockReservation
+from inventory.recipes import rebuild_flattened_recipes
+from utils import caching
+from utils.models import User
+from utils.query_plans import FINDING_TYPES, PlanRecorder, QueryPlanAudit
+# endregion
+
+
+class Command(BaseCommand):
+    help = ('Run typical requests against every endpoint on a freshly seeded throwaway database, EXPLAIN each '
+            'distinct query and report full scans, temporary B-trees and non-covering index lookups as JSON')
+
+    # region Arguments
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--output', help='Report file (stdout by default)')
+        parser.add_argument('--orders', type=int, default=200, help='Orders seeded before the audit')
+        parser.add_argument('--fail-on', default='',
+                            help=f"Comma-separated finding types that make the command fail "
+                                 f"({', '.join(FINDING_TYPES)})")
+
+    # endregion
+
+    def handle(self, *args, **options):
+        fail_on = [finding_type for finding_type in options['fail_on'].split(',') if finding_type]
+        unknown = set(fail_on) - set(FINDING_TYPES)
+        if unknown:
+            raise CommandError(f"Unknown finding types: {', '.join(sorted(unknown))}")
+
+        # Throwaway databases (the test database settings, replicas mirror them) and a process-local cache,
+        # so the audit never touches real data or the shared Redis
+        with self.isolated_caches():
+            old_config = setup_databases(verbosity=0, interactive=False, aliases=set(connections))
+            try:
+                self.seed(options['orders'])
+                report = self.audit()
+            finally:
+                teardown_databases(old_config, verbosity=0)
+
+        body = json.dumps(report, indent=2, default=str) + '\n'
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(body)
+        else:
+            sys.stdout.write(body)
+
+        summary = report['summary']
+        counts = ', '.join(f'{finding_type}={count}' for finding_type, count in summary['findings'].items())
+        self.stderr.write(f"{summary['statements']} distinct statements from {summary['requests']} requests, "
+                          f"{summary['flagged_statements']} flagged: {counts}")
+        failing = {finding_type: summary['findings'][finding_type] for finding_type in fail_on
+                   if summary['findings'][finding_type]}
+        if failing:
+            raise CommandError(f"Query plan findings: {failing}")
+
+    @staticmethod
+    @contextmanager
+    def isolated_caches():
+        """
+        Swaps the default cache for a local-memory one, with fresh two-tier caches and invalidation bus,
+        so neither cache.clear() nor invalidation broadcasts reach the configured Redis.
+        """
+        saved = dict(caching._caches), caching._bus
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                   'LOCATION': 'audit-query-plans'}}):
+            caching._caches.clear()
+            caching._bus = None
+            try:
+                yield
+            finally:
+                caching._caches.clear()
+                caching._caches.update(saved[0])
+                caching._bus = saved[1]
+
+    # region Step 1: Seed the catalog, a staff user and order history
+    def seed(self, order_count):
+        # The fixtures are owned by user 1
+        user = User(email='audit@foodex.com', first_name='Query', last_name='Audit', phone='+200000000000',
+                    is_superuser=True, is_staff=True)
+        user.set_password('audit-query-plans')
+        user.save()
+        call_command('loaddata', 'ingredients.json', 'products.json', 'product_ingredients.json', verbosity=0)
+        rebuild_flattened_recipes()
+
+        class SeededOrder:
+            def __init__(self, product):
+                self.products = [{'product': product, 'quantity': 1}]
+                self.user, self.branch_id, self.created_at, self.consumption = user, None, None, {}
+
+        products = list(Product.objects.all())
+        apply_orders([SeededOrder(products[index % len(products)]) for index in range(order_count)], user)
+
+    # endregion
+
+    # region Step 2: Replay typical requests and explain their statements
+    @staticmethod
+    def typical_requests():
+        """
+        Yields (label, method, path, payload) for every API endpoint's common calls, in an order where later
+        requests use what earlier ones created. Callable paths are resolved before the request is recorded,
+        so their lookups stay out of the report.
+        """
+        product = Product.objects.order_by('id').first()
+        today = datetime.date.today().isoformat()
+        order_payload = {'products': [{'product': product.id, 'quantity': 1}]}
+
+        def latest_order():
+            return f'/inventory/orders/{Order.objects.latest("id").id}/'
+
+        def latest_reservation(suffix=''):
+            return f'/inventory/reservations/{StockReservation.objects.latest("id").id}/{suffix}'
+
+        yield 'POST /utils/api/token/', 'post', '/utils/api/token/', {'email': 'audit@foodex.com',
+                                                                      'password': 'audit-query-plans'}
+        yield 'POST /inventory/orders/', 'post', '/inventory/orders/', order_payload
+        yield 'GET /inventory/orders/', 'get', '/inventory/orders/', None
+        yield 'GET /inventory/orders/<id>/', 'get', latest_order, None
+        yield 'GET /inventory/orders/export/?output=csv', 'get', \
+            f'/inventory/orders/export/?output=csv&start={today}&end={today}', None
+        yield 'GET /inventory/orders/export/?output=ndjson', 'get', '/inventory/orders/export/?output=ndjson', None
+        yield 'GET /inventory/catalog/changes/', 'get', '/inventory/catalog/changes/', None
+        yield 'GET /inventory/stock/stockout/', 'get', '/inventory/stock/stockout/', None
+        yield 'POST /inventory/reservations/', 'post', '/inventory/reservations/', order_payload
+        yield 'GET /inventory/reservations/', 'get', '/inventory/reservations/', None
+        yield 'POST /inventory/reservations/<id>/confirm/', 'post', lambda: latest_reservation('confirm/'), None
+        yield 'POST /inventory/reservations/', 'post', '/inventory/reservations/', order_payload
+        yield 'GET /inventory/reservations/<id>/', 'get', latest_reservation, None
+        yield 'POST /inventory/reservations/<id>/release/', 'post', lambda: latest_reservation('release/'), None
+        yield 'GET /utils/api/metrics/admission/', 'get', '/utils/api/metrics/admission/', None
+        yield 'GET /utils/api/metrics/cache/', 'get', '/utils/api/metrics/cache/', None
+
+    def audit(self):
+        audit = QueryPlanAudit()
+        client = APIClient()
+        exercised = set()
+        for label, method, path, payload in self.typical_requests():
+            path = path() if callable(path) else path
+            cache.clear()  # Measure the database path, not a cached response
+            recorders = [PlanRecorder(alias) for alias in connections]  # Safe reads may go to replicas
+            with ExitStack() as stack:
+                for recorder in recorders:
+                    stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+                response = getattr(client, method)(path, payload, format='json')
+                if response.streaming:
+                    b''.join(response.streaming_content)  # Streamed exports query while being consumed
+            if label == 'POST /utils/api/token/':
+                client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+            audit.record(label, response.status_code,
+                         [statement for recorder in recorders for statement in recorder.statements])
+            exercised.add(label.split()[1].split('?')[0])
+        return audit.report(unexercised_routes=self.api_routes() - exercised)
+
+    @staticmethod
+    def api_routes():
+        """
+        The API routes (under /utils/ and /inventory/) with path parameters written as <id>.
+        """
+        routes, pending = set(), [('/', pattern) for pattern in get_resolver().url_patterns]
+        while pending:
+            prefix, pattern = pending.pop()
+            route = prefix + str(pattern.pattern).lstrip('^').rstrip('$')
+            if hasattr(pattern, 'url_patterns'):
+                pending.extend((route, child) for child in pattern.url_patterns)
+            elif route.startswith(('/utils/', '/inventory/')) and 'format' not in route:
+                routes.add(re.sub(r'\(\?P<\w+>[^)]*\)|<[^>]+>', '<id>', route))
+        return routes
+
+    # endregion
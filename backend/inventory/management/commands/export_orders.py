@@ -0,0 +1,46 @@
+# region Imports
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from utils.endpointhandling.exceptions import BaseCustomException
+from inventory.exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, export_queryset, parse_export_bound, stream_export
+# endregion
+
+
+class Command(BaseCommand):
+    help = ('Stream orders with their line items as CSV or NDJSON to a file or stdout, '
+            'reading them in chunks so memory stays flat for any date range')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day or datetime to include (ISO format)')
+        parser.add_argument('--end', help='Last day to include, or an ISO datetime')
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--branch', type=int, help='Only export orders of this branch id')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Orders fetched (and line items prefetched) per database round trip')
+        parser.add_argument('--output', '-o', default='-', help='Output file, "-" for stdout')
+        parser.add_argument('--database', default='default', help='Database alias to read from')
+
+    def handle(self, *args, **options):
+        try:
+            start = parse_export_bound(options['start'], 'start')
+            end = parse_export_bound(options['end'], 'end', end=True)
+        except BaseCustomException as e:
+            raise CommandError(str(e))
+
+        queryset = export_queryset(start, end, branch_id=options['branch'], using=options['database'])
+        blocks = stream_export(options['export_format'], queryset, chunk_size=options['chunk_size'])
+
+        written = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for block in blocks:
+                output.write(block)
+                written += len(block)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+            else:
+                output.flush()
+
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(f"Exported {written} bytes to {options['output']}"))
@@ -0,0 +1,40 @@
+# region Imports
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from inventory.ingest import OrderIngestor
+from utils.models import User
+# endregion
+
+
+class Command(BaseCommand):
+    help = ('Replay spooled NDJSON orders (files or directories of *.ndjson) in batched transactions, '
+            'resuming from the last committed checkpoint of each file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='NDJSON spool files or directories')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders committed per transaction')
+        parser.add_argument('--email', default='iwanttojoinfoodex@foodex.com',
+                            help='Owner of orders whose line has no "user"')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError(f"User {options['email']} does not exist, run create_system_user first")
+
+        files = []
+        for path in map(Path, options['paths']):
+            if path.is_dir():
+                files.extend(sorted(path.glob('*.ndjson')))
+            elif path.is_file():
+                files.append(path)
+            else:
+                raise CommandError(f"{path} does not exist")
+
+        for path in files:
+            path = path.resolve()
+            # Rejected lines (with the reason) go next to the spool file, e.g. orders.ndjson.rejected
+            with open(f'{path}.rejected', 'ab') as rejects:
+                ingestor = OrderIngestor(user, batch_size=options['batch_size'], rejects=rejects, stdout=self.stdout)
+                checkpoint = ingestor.ingest(path)
+            self.stdout.write(self.style.SUCCESS(
+                f"{path}: {checkpoint.accepted} orders ingested, {checkpoint.rejected} rejected"))
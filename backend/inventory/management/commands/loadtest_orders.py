@@ -0,0 +1,217 @@
+# region Imports
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import BranchIngredient, Ingredient, Order, Product, ProductIngredient, OrderProduct
+from inventory.models import StockPartition
+from utils.models import User
+# endregion
+
+
+class Command(BaseCommand):
+    help = ('Start the app under gunicorn with N workers, race concurrent orders for a few shared '
+            'ingredients, report throughput / errors / latency and verify that no stock was oversold. '
+            'The seeded rows and the orders placed are deleted afterwards')
+
+    # region Arguments
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Gunicorn worker processes')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per gunicorn worker')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client connections')
+        parser.add_argument('--requests', type=int, default=500, help='Total orders to submit')
+        parser.add_argument('--ingredients', type=int, default=3, help='Shared ingredients in the test recipe')
+        parser.add_argument('--stock', type=int, default=10_000_000,
+                            help='Initial stock per ingredient (milligrams)')
+        parser.add_argument('--recipe-quantity', type=int, default=100_000,
+                            help='Milligrams of each ingredient per product')
+        parser.add_argument('--order-quantity', type=int, default=1, help='Products per order')
+        parser.add_argument('--port', type=int, default=0, help='Bind port (0 picks a free one)')
+        parser.add_argument('--email', default='iwanttojoinfoodex@foodex.com', help='Superuser used for the orders')
+        parser.add_argument('--password', default='accept_me_in_foodex')
+
+    # endregion
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError(f"User {options['email']} does not exist, run create_system_user first")
+
+        # region Step 1: Seed the shared ingredients and the contested product
+        # Orders consume the stock of the user's branch (global stock when they have none)
+        partition = StockPartition(user.branch_id)
+        product, ingredients = self.seed(user, partition, options)
+        # endregion
+
+        try:
+            self.run_load(partition, product, ingredients, options)
+        finally:
+            # region Step 5: Delete the seeded rows and the orders placed, so the database is left as found
+            self.clean_up(product, ingredients)
+            # endregion
+
+    def run_load(self, partition, product, ingredients, options):
+        initial_stock = {ingredient_id: stock for ingredient_id, (_, stock)
+                         in partition.stock_levels([ingredient.id for ingredient in ingredients]).items()}
+        order_products_before = OrderProduct.objects.filter(product=product).count()
+
+        # region Step 2: Start the server and fire the concurrent order traffic
+        port = options['port'] or self.free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        server = self.start_server(port, options)
+        try:
+            token = self.wait_for_token(base_url, options)
+            payload = {'products': [{'product': product.id, 'quantity': options['order_quantity']}]}
+            headers = {'Authorization': f'Bearer {token}'}
+
+            def place_order(_):
+                started = time.perf_counter()
+                try:
+                    response = requests.post(f'{base_url}/inventory/orders/', json=payload, headers=headers,
+                                             timeout=60)
+                    outcome = self.classify(response)
+                except requests.RequestException:
+                    outcome = 'connection_error'
+                return outcome, time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                results = list(executor.map(place_order, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        # endregion
+
+        # region Step 3: Report throughput, error rate and latency
+        outcomes = Counter(outcome for outcome, _ in results)
+        latencies_ms = sorted(latency * 1000 for _, latency in results)
+        percentiles = statistics.quantiles(latencies_ms, n=100) if len(latencies_ms) > 1 else latencies_ms * 99
+        # 429s are load shed by admission control, not failures
+        errors = sum(count for outcome, count in outcomes.items()
+                     if outcome not in ('accepted', 'insufficient_stock', 'overloaded'))
+
+        self.stdout.write(f"Requests:     {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f} req/s)")
+        for outcome, count in sorted(outcomes.items()):
+            self.stdout.write(f"  {outcome:<20} {count}")
+        self.stdout.write(f"Error rate:   {errors / len(results):.2%}")
+        self.stdout.write(f"Latency (ms): p50={percentiles[49]:.1f} p95={percentiles[94]:.1f} "
+                          f"p99={percentiles[98]:.1f} max={latencies_ms[-1]:.1f}")
+        # endregion
+
+        # region Step 4: Verify final stock == initial stock - consumption of accepted orders
+        accepted = outcomes['accepted']
+        persisted = OrderProduct.objects.filter(product=product).count() - order_products_before
+        consumption = options['recipe_quantity'] * options['order_quantity']
+
+        mismatches = []
+        if persisted != accepted:
+            mismatches.append(f"{accepted} orders acknowledged but {persisted} persisted")
+        for ingredient_id, (name, stock) in partition.stock_levels(list(initial_stock)).items():
+            expected = initial_stock[ingredient_id] - consumption * accepted
+            if stock != expected:
+                mismatches.append(f"{name}: stock {stock}, expected {expected}")
+
+        if mismatches:
+            raise CommandError("Stock consistency check failed: " + "; ".join(mismatches))
+        self.stdout.write(self.style.SUCCESS(f"Stock consistent: {accepted} accepted orders, no oversell"))
+        # endregion
+
+    # region Helpers
+    @staticmethod
+    def seed(user, partition, options):
+        """
+        Creates (or resets) the contested ingredients, their stock in the user's partition and a product
+        consuming all of them.
+        """
+        audit = {'user_id_create': user, 'user_id_update': user}
+        product, _ = Product.objects.get_or_create(name='loadtest product', defaults=audit)
+        ProductIngredient.objects.filter(product=product).delete()
+
+        ingredients = []
+        for index in range(options['ingredients']):
+            ingredient, _ = Ingredient.objects.get_or_create(
+                name=f'loadtest ingredient {index}', defaults={'stock': options['stock'], **audit})
+            ingredient.stock = ingredient.stock_initial = options['stock']
+            ingredient.save()
+            if partition.branch_id is not None:
+                BranchIngredient.objects.update_or_create(
+                    branch_id=partition.branch_id, ingredient=ingredient,
+                    defaults={'stock': options['stock'], 'stock_initial': options['stock'], 'reserved': 0,
+                              'email_sent': False, 'user_id_update': user},
+                    create_defaults={'stock': options['stock'], 'stock_initial': options['stock'], **audit})
+            ProductIngredient.objects.create(product=product, ingredient=ingredient,
+                                             quantity=options['recipe_quantity'], **audit)
+            ingredients.append(ingredient)
+
+        return product, ingredients
+
+    @staticmethod
+    def clean_up(product, ingredients):
+        """
+        Deletes the orders placed for the contested product, the product and the seeded ingredients
+        (their branch stock and recipe lines cascade).
+        """
+        Order.objects.filter(orderproduct__product=product).delete()
+        product.delete()
+        Ingredient.objects.filter(pk__in=[ingredient.id for ingredient in ingredients]).delete()
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    @staticmethod
+    def start_server(port, options):
+        command = [
+            sys.executable, '-m', 'gunicorn', 'backend.wsgi:application',
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(options['workers']),
+            '--threads', str(options['threads']),
+            '--log-level', 'warning',
+        ]
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')}
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+
+    @staticmethod
+    def wait_for_token(base_url, options, timeout=30):
+        """
+        Polls the token endpoint until the server answers, then returns an access token.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = requests.post(f'{base_url}/utils/api/token/', timeout=5,
+                                         json={'email': options['email'], 'password': options['password']})
+                if response.status_code != 200:
+                    raise CommandError(f"Token retrieval failed: {response.status_code} {response.text}")
+                return response.json()['access']
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise CommandError(f"Server did not start on {base_url} within {timeout}s")
+                time.sleep(0.2)
+
+    @staticmethod
+    def classify(response):
+        if response.status_code == 201:
+            return 'accepted'
+        if response.status_code == 429:
+            return 'overloaded'
+        if 'database is locked' in response.text:
+            return 'database_locked'
+        if response.status_code >= 500:
+            return f'http_{response.status_code}'
+        if 'insufficient_stock' in response.text or 'Insufficient stock' in response.text:
+            return 'insufficient_stock'
+        return f'http_{response.status_code}'
+
+    # endregion
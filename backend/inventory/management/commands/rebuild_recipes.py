@@ -0,0 +1,12 @@
+# region Imports
+from django.core.management.base import BaseCommand
+from inventory.recipes import rebuild_flattened_recipes
+# endregion
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the flattened bill of materials of every product (run after loading recipe fixtures)'
+
+    def handle(self, *args, **kwargs):
+        products = rebuild_flattened_recipes()
+        self.stdout.write(self.style.SUCCESS(f'Flattened recipes rebuilt for {len(products)} products'))
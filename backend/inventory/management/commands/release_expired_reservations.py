@@ -0,0 +1,21 @@
+# region Imports
+from django.core.management.base import BaseCommand
+from inventory.reservations import release_expired_reservations
+# endregion
+
+
+class Command(BaseCommand):
+    help = ('Return the stock held by expired cart reservations (run from cron; orders and new reservations '
+            'also release them when they would otherwise be short)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Reservations released per pass')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = release_expired_reservations(limit=options['batch_size'])
+            total += released
+            if released < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f'Released {total} expired reservations'))
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_order_branch_branchingredient'),
+        ('utils', '0002_branch_user_branch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='inventory_order_created_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:15
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Round
+
+# (model, float gram fields converted to integer milligrams)
+GRAM_FIELDS = [
+    ('Ingredient', ['stock', 'stock_initial']),
+    ('BranchIngredient', ['stock', 'stock_initial']),
+    ('ProductIngredient', ['quantity']),
+]
+
+
+def grams_to_milligrams(apps, schema_editor):
+    for model_name, fields in GRAM_FIELDS:
+        apps.get_model('inventory', model_name).objects.update(**{
+            # Clamp drifted negative stock to zero, the new columns are unsigned
+            field: Greatest(Round(F(field) * 1000), Value(0)) for field in fields
+        })
+
+
+def milligrams_to_grams(apps, schema_editor):
+    for model_name, fields in GRAM_FIELDS:
+        apps.get_model('inventory', model_name).objects.update(**{
+            field: F(field) / 1000.0 for field in fields
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_order_created_at_index'),
+    ]
+
+    operations = [
+        # Convert the units while the columns are still floats, then narrow the types
+        migrations.RunPython(grams_to_milligrams, milligrams_to_grams),
+        migrations.AlterField(
+            model_name='branchingredient',
+            name='stock',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='branchingredient',
+            name='stock_initial',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='stock',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='stock_initial',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='productingredient',
+            name='quantity',
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def flatten_existing_recipes(apps, schema_editor):
+    # No sub-recipes exist yet, so each product's flat recipe is its own ingredient lines
+    ProductIngredient = apps.get_model('inventory', 'ProductIngredient')
+    FlattenedRecipe = apps.get_model('inventory', 'FlattenedRecipe')
+
+    totals = {}
+    for product_id, ingredient_id, quantity in ProductIngredient.objects.values_list(
+            'product_id', 'ingredient_id', 'quantity'):
+        totals[product_id, ingredient_id] = totals.get((product_id, ingredient_id), 0) + quantity
+    FlattenedRecipe.objects.bulk_create([
+        FlattenedRecipe(product_id=product_id, ingredient_id=ingredient_id, quantity=quantity)
+        for (product_id, ingredient_id), quantity in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_integer_milligram_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlattenedRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveBigIntegerField()),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.ingredient')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flattened_recipe', to='inventory.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'ingredient'), name='unique_flattened_recipe_line')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSubRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='used_in', to='inventory.product')),
+                ('parent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sub_recipes', to='inventory.product')),
+                ('user_id_create', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL)),
+                ('user_id_update', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='%(class)s_updated_by', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('parent', 'component'), name='unique_product_sub_recipe')],
+            },
+        ),
+        migrations.RunPython(flatten_existing_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderIngestCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500, unique=True)),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('lines', models.PositiveBigIntegerField(default=0)),
+                ('accepted', models.PositiveBigIntegerField(default=0)),
+                ('rejected', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,34 +1,100 @@
+from fractions import Fraction
 from django.db import models
-from utils.models import BaseFullModel
+from django.db.models import F
+from utils.models import BaseFullModel, Branch
 from utils.importinglibs.data_manipulation_libs import os
 
 
-class Ingredient(BaseFullModel):
-    name = models.CharField(max_length=100, unique=True)
-    stock = models.FloatField()  # Stock in grams
-    stock_initial = models.FloatField(default=0)  # Initial stock for threshold calculation
+def get_stock_limit():
+    """
+    Returns STOCK_LIMIT (e.g. "0.5") as an exact fraction, so threshold math stays in integers.
+    """
+    return Fraction(os.environ.get('STOCK_LIMIT')).limit_denominator(10000)
+
+
+class StockLevelQuerySet(models.QuerySet):
+    def below_threshold(self, stock_limit):
+        """
+        Rows whose stock is below stock_initial * stock_limit, compared exactly in SQL:
+        stock * denominator < stock_initial * numerator.
+        """
+        return self.alias(
+            scaled_stock=F('stock') * stock_limit.denominator,
+            scaled_threshold=F('stock_initial') * stock_limit.numerator,
+        ).filter(scaled_stock__lt=F('scaled_threshold'))
+
+
+class StockLevelModel(models.Model):
+    stock = models.PositiveBigIntegerField()  # Available stock in milligrams (net of reservations)
+    reserved = models.PositiveBigIntegerField(default=0)  # Milligrams held by active cart reservations
+    stock_initial = models.PositiveBigIntegerField(default=0)  # Initial stock (mg) for threshold calculation
     email_sent = models.BooleanField(default=False)
 
+    objects = StockLevelQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def is_below_threshold(self, stock_limit):
+        return self.stock * stock_limit.denominator < self.stock_initial * stock_limit.numerator
+
     def save(self, *args, **kwargs):
-        stock_limit = float(os.environ.get('STOCK_LIMIT'))
+        stock_limit = get_stock_limit()
 
         if not self.pk:  # On creation only
             self.stock_initial = self.stock
 
         # Check if stock is greater than 50% of the stock_initial and set emailSent to False if it is
-        if self.stock >= (self.stock_initial * stock_limit):
+        if not self.is_below_threshold(stock_limit):
             self.email_sent = False
 
         super().save(*args, **kwargs)
 
+
+class Ingredient(BaseFullModel, StockLevelModel):
+    """
+    Catalog ingredient; its own stock columns hold the global stock used by callers without a branch.
+    """
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='inventory_ingredient_sync_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 
+class BranchIngredient(BaseFullModel, StockLevelModel):
+    """
+    Branch-scoped stock row, so orders from different branches never update the same row.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='stock')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='branch_stock')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'ingredient'], name='unique_branch_ingredient'),
+        ]
+
+    @property
+    def name(self):
+        return self.ingredient.name
+
+    def __str__(self):
+        return f'{self.ingredient.name} @ {self.branch.name}'
+
+
 class Product(BaseFullModel):
     name = models.CharField(max_length=100, unique=True)
     ingredients = models.ManyToManyField(Ingredient, through='ProductIngredient')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='inventory_product_sync_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -36,14 +102,182 @@ class Product(BaseFullModel):
 class ProductIngredient(BaseFullModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
-    quantity = models.FloatField()  # Quantity of ingredient in grams
+    quantity = models.PositiveBigIntegerField()  # Quantity of ingredient in milligrams
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='inventory_prod_ingr_sync_idx'),
+        ]
+
+
+class ProductSubRecipe(BaseFullModel):
+    """
+    A prepared component (sauce, dough, ...) used by another product's recipe; the component is itself
+    a product with its own ingredients and sub-recipes.
+    """
+    parent = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sub_recipes')
+    component = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='used_in')
+    quantity = models.PositiveIntegerField()  # Portions of the component per unit of the parent
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['parent', 'component'], name='unique_product_sub_recipe'),
+        ]
+
+    def clean(self):
+        from .recipes import ensure_acyclic
+        ensure_acyclic(self.parent_id, self.component_id)
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        super().save(*args, **kwargs)
+
+
+class FlattenedRecipe(models.Model):
+    """
+    Precomputed bill of materials: total milligrams of each ingredient per unit of a product, through
+    every level of sub-recipes. Rebuilt by inventory.recipes whenever a recipe changes, so order
+    processing is one flat lookup regardless of nesting depth.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='flattened_recipe')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveBigIntegerField()  # Milligrams per unit of the product
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'ingredient'], name='unique_flattened_recipe_line'),
+        ]
+
+
+class CatalogTombstone(models.Model):
+    """
+    Records a deleted catalog row so the delta feed can tell terminals to drop it.
+    """
+    model = models.CharField(max_length=50)  # Catalog section, e.g. "products"
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='inventory_tombstone_sync_idx'),
+        ]
 
 
 class Order(BaseFullModel):
     products = models.ManyToManyField(Product, through='OrderProduct')
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, default=None)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='inventory_order_created_idx'),
+        ]
+
+    @staticmethod
+    def detail_cache_key(order_id):
+        """
+        Cache key of the pre-rendered order detail response.
+        """
+        return f'order-detail:v1:{order_id}'
 
 
 class OrderProduct(BaseFullModel):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+
+
+class OrderIngestCheckpoint(models.Model):
+    """
+    Progress of `manage.py ingest_orders` through a spooled NDJSON file. Updated in the same transaction as
+    each batch of orders, so a resumed run never applies a batch twice.
+    """
+    source = models.CharField(max_length=500, unique=True)  # Absolute path of the spool file
+    offset = models.PositiveBigIntegerField(default=0)  # Byte offset of the next unread line
+    lines = models.PositiveBigIntegerField(default=0)
+    accepted = models.PositiveBigIntegerField(default=0)
+    rejected = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# region Stock Reservations
+class StockReservation(BaseFullModel):
+    """
+    Ingredient quantities held for an open cart until `expires_at`. The held quantities are moved from
+    `stock` to `reserved` on the stock rows, so every availability check already excludes them.
+    """
+    ACTIVE, CONFIRMED, RELEASED, EXPIRED = 'active', 'confirmed', 'released', 'expired'
+    STATUS_CHOICES = [(ACTIVE, 'Active'), (CONFIRMED, 'Confirmed'), (RELEASED, 'Released'), (EXPIRED, 'Expired')]
+
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, blank=True, default=None)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    expires_at = models.DateTimeField()
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='reservation')
+
+    class Meta:
+        indexes = [
+            # Expiry queue: active reservations ordered by deadline
+            models.Index(fields=['status', 'expires_at'], name='inventory_reservation_exp_idx'),
+        ]
+
+
+class StockReservationProduct(models.Model):
+    reservation = models.ForeignKey(StockReservation, on_delete=models.CASCADE, related_name='products')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+
+
+class StockReservationLine(models.Model):
+    """
+    Milligrams of one ingredient held by a reservation; released or consumed exactly as recorded.
+    """
+    reservation = models.ForeignKey(StockReservation, on_delete=models.CASCADE, related_name='lines')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.PROTECT, related_name='+')
+    quantity = models.PositiveBigIntegerField()
+# endregion
+
+
+# region Stock Partitions
+class StockPartition:
+    """
+    Resolves the stock rows an order consumes: BranchIngredient rows for a branch,
+    or the global Ingredient rows when the caller has no branch.
+    """
+
+    def __init__(self, branch_id=None):
+        self.branch_id = branch_id
+        if branch_id is None:
+            self.queryset = Ingredient.objects.all()
+            self.ingredient_field, self.name_field = 'pk', 'name'
+        else:
+            self.queryset = BranchIngredient.objects.filter(branch_id=branch_id).select_related('ingredient')
+            self.ingredient_field, self.name_field = 'ingredient_id', 'ingredient__name'
+
+    def rows(self, ingredient_ids):
+        """
+        Returns the stock rows for the given ingredient ids.
+        """
+        return self.queryset.filter(**{f'{self.ingredient_field}__in': ingredient_ids})
+
+    def row(self, ingredient_id):
+        return self.queryset.filter(**{self.ingredient_field: ingredient_id})
+
+    def ingredient_id(self, row):
+        return row.pk if self.branch_id is None else row.ingredient_id
+
+    def stock_levels(self, ingredient_ids):
+        """
+        Returns {ingredient id: (name, stock)}; ingredients the branch does not stock report 0.
+        """
+        levels = {
+            ingredient_id: (name, stock)
+            for ingredient_id, name, stock in self.rows(ingredient_ids).values_list(
+                self.ingredient_field, self.name_field, 'stock')
+        }
+        missing = set(ingredient_ids) - set(levels)
+        if missing:
+            levels.update({
+                ingredient_id: (name, 0)
+                for ingredient_id, name in Ingredient.objects.filter(pk__in=missing).values_list('id', 'name')
+            })
+        return levels
+# endregion
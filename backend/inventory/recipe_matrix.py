@@ -0,0 +1,258 @@
+# region Imports
+import bisect
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import connections
+from utils.caching import get_invalidation_bus
+from .models import FlattenedRecipe
+# endregion
+
+MAGIC = b'RCPMTX01'
+HEADER = struct.Struct('<8sQQQQ')  # magic, generation, products, ingredients, non-zero entries
+GENERATION = struct.Struct('<Q')
+CHANGE_NAMESPACE = 'recipe-matrix'  # Invalidation bus messages carrying the id of a committed recipe change
+
+
+class RecipeMatrix:
+    """
+    One generation of the compiled product x ingredient matrix, read zero-copy from a memory map.
+
+    The file is the header followed by int64 arrays in CSR layout: sorted product ids, row offsets,
+    the ingredient index (column -> ingredient id), then the column and milligrams of every entry.
+    """
+
+    def __init__(self, mapping, built_at=None):
+        self.built_at = built_at  # Epoch seconds the file was written
+        magic, self.generation, products, ingredients, entries = HEADER.unpack_from(mapping)
+        if magic != MAGIC:
+            raise ValueError("Not a recipe matrix file")
+        view, offset = memoryview(mapping), HEADER.size
+
+        def array(length):
+            nonlocal offset
+            section = view[offset:offset + length * 8].cast('q')
+            offset += length * 8
+            return section
+
+        self.product_ids = array(products)
+        self.row_offsets = array(products + 1)
+        self.ingredient_ids = array(ingredients)
+        self.columns = array(entries)
+        self.quantities = array(entries)
+
+    def lines(self, product_id):
+        """
+        [(ingredient id, milligrams per unit)] of a product; empty when it has no recipe.
+        """
+        row = bisect.bisect_left(self.product_ids, product_id)
+        if row == len(self.product_ids) or self.product_ids[row] != product_id:
+            return []
+        return [(self.ingredient_ids[self.columns[entry]], self.quantities[entry])
+                for entry in range(self.row_offsets[row], self.row_offsets[row + 1])]
+
+    @staticmethod
+    def compile(generation, recipe_lines):
+        """
+        Serializes (product id, ingredient id, milligrams) rows into the file layout.
+        """
+        rows = {}
+        for product_id, ingredient_id, quantity in recipe_lines:
+            rows.setdefault(product_id, []).append((ingredient_id, quantity))
+        ingredient_ids = sorted({ingredient_id for lines in rows.values() for ingredient_id, _ in lines})
+        column_of = {ingredient_id: column for column, ingredient_id in enumerate(ingredient_ids)}
+
+        product_ids, row_offsets, columns, quantities = sorted(rows), [0], [], []
+        for product_id in product_ids:
+            for ingredient_id, quantity in sorted(rows[product_id]):
+                columns.append(column_of[ingredient_id])
+                quantities.append(quantity)
+            row_offsets.append(len(columns))
+
+        arrays = [product_ids, row_offsets, ingredient_ids, columns, quantities]
+        return HEADER.pack(MAGIC, generation, len(product_ids), len(ingredient_ids), len(columns)) + b''.join(
+            struct.pack(f'<{len(values)}q', *values) for values in arrays)
+
+
+class SharedRecipeMatrix:
+    """
+    The recipe matrix shared by every worker on the node through a memory-mapped file (under /dev/shm by
+    default, so it lives in memory once regardless of the number of workers).
+
+    Readers never lock: a tiny mapped generation file tells them when to switch. Writers serialize on
+    an flock, write the next generation to a temporary file, os.replace() it over the matrix file and then
+    bump the generation. A reader still holding the previous generation keeps a valid mapping of the old,
+    unlinked file until it picks up the new one on its next lookup.
+
+    Other nodes learn about a recipe change from the invalidation bus: the first worker of each node to
+    receive a change id withdraws the matrix and records the id, so its siblings skip it. A matrix older
+    than `max_age` seconds is rebuilt as well, in case a broadcast was missed.
+    """
+
+    def __init__(self, path, max_age=None):
+        self.path = path
+        self.max_age = max_age
+        self._generation_map = None
+        self._matrix = None
+
+    def _open_generation(self):
+        if self._generation_map is None:
+            try:
+                with open(f'{self.path}.generation', 'rb') as generation_file:
+                    self._generation_map = mmap.mmap(generation_file.fileno(), GENERATION.size,
+                                                     access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                return None
+        return self._generation_map
+
+    def current(self):
+        """
+        The matrix of the latest generation, or None while no matrix is published (the caller falls back
+        to the database); a missing matrix is built here unless another process is already building it.
+        """
+        generation_map = self._open_generation()
+        generation = GENERATION.unpack_from(generation_map)[0] if generation_map is not None else None
+        matrix = self._matrix
+        if matrix is None or matrix.generation < (generation or 0):
+            matrix = self._matrix = self._map()
+        if (matrix is None or self._expired(matrix)) and self.publish(blocking=False):
+            matrix = self._matrix = self._map()
+        return matrix
+
+    def _expired(self, matrix):
+        return bool(self.max_age) and time.time() - matrix.built_at > self.max_age
+
+    def _map(self):
+        try:
+            with open(self.path, 'rb') as matrix_file:
+                return RecipeMatrix(mmap.mmap(matrix_file.fileno(), 0, access=mmap.ACCESS_READ),
+                                    os.fstat(matrix_file.fileno()).st_mtime)
+        except FileNotFoundError:
+            return None
+
+    def recipes(self, product_ids):
+        """
+        Returns {product id: [(ingredient id, milligrams)]} for every product, or None when unavailable.
+        """
+        matrix = self.current()
+        if matrix is None:
+            return None
+        return {product_id: matrix.lines(product_id) for product_id in product_ids}
+
+    # region Writers
+    def _locked(self, blocking, write):
+        """
+        Runs write(generation file) holding the writer lock; returns False if not blocking and busy.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return False
+            try:
+                generation_path = f'{self.path}.generation'
+                if not os.path.exists(generation_path):
+                    with open(generation_path, 'wb') as generation_file:
+                        generation_file.write(GENERATION.pack(0))
+                with open(generation_path, 'r+b') as generation_file:
+                    generation_map = mmap.mmap(generation_file.fileno(), GENERATION.size)
+                    try:
+                        write(generation_map)
+                    finally:
+                        generation_map.close()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return True
+
+    def _applied_change(self):
+        try:
+            with open(f'{self.path}.change') as change_file:
+                return change_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _record_change(self, change_id):
+        if change_id is not None:
+            with open(f'{self.path}.change', 'w') as change_file:
+                change_file.write(change_id)
+
+    def publish(self, blocking=True, change_id=None):
+        """
+        Compiles FlattenedRecipe into the next generation and switches every worker over to it. A
+        `change_id` is recorded as applied on this node.
+        """
+        def write(generation_map):
+            generation = GENERATION.unpack_from(generation_map)[0] + 1
+            temporary = f'{self.path}.{os.getpid()}.tmp'
+            with open(temporary, 'wb') as matrix_file:
+                matrix_file.write(RecipeMatrix.compile(generation, FlattenedRecipe.objects.values_list(
+                    'product_id', 'ingredient_id', 'quantity').iterator()))
+            os.replace(temporary, self.path)
+            GENERATION.pack_into(generation_map, 0, generation)
+            self._record_change(change_id)
+
+        return self._locked(blocking, write)
+
+    def invalidate(self, change_id=None):
+        """
+        Withdraws the published matrix so workers read recipes from the database until the next publish.
+        Also the invalidation bus handler: a `change_id` already applied on this node is skipped.
+        """
+        def write(generation_map):
+            if change_id is not None and self._applied_change() == change_id:
+                return
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            GENERATION.pack_into(generation_map, 0, GENERATION.unpack_from(generation_map)[0] + 1)
+            self._record_change(change_id)
+
+        self._locked(True, write)
+
+    # endregion
+
+
+# One handle per matrix file in this process
+_matrices = {}
+_matrices_lock = threading.Lock()
+
+
+def get_recipe_matrix():
+    """
+    Returns this process's handle on the node's shared recipe matrix, or None when disabled. The file name
+    is derived from the database, so test databases never share a matrix with the real one.
+    """
+    config = settings.RECIPE_MATRIX
+    if not config['ENABLED']:
+        return None
+    bus = get_invalidation_bus()
+    bus.ensure_listener()  # Workers that only read the matrix still need to hear about recipe changes
+    database = hashlib.sha1(str(connections['default'].settings_dict['NAME']).encode()).hexdigest()[:12]
+    path = os.path.join(config['DIR'] or tempfile.gettempdir(), f'recipe-matrix-{database}.bin')
+    matrix = _matrices.get(path)
+    if matrix is None:
+        with _matrices_lock:
+            matrix = _matrices.get(path)
+            if matrix is None:
+                matrix = _matrices[path] = SharedRecipeMatrix(path, config['MAX_AGE'])
+                bus.subscribe(CHANGE_NAMESPACE, matrix.invalidate)
+    return matrix
+
+
+def publish_recipe_change(recipe_matrix):
+    """
+    Republishes this node's matrix after a committed recipe change and tells every other node to withdraw
+    theirs (each rebuilds on its next read).
+    """
+    change_id = uuid.uuid4().hex
+    recipe_matrix.publish(change_id=change_id)
+    get_invalidation_bus().publish(CHANGE_NAMESPACE, change_id)
@@ -0,0 +1,151 @@
+# region Imports
+from collections import defaultdict
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from utils.caching import get_two_tier_cache
+from .models import ProductIngredient, ProductSubRecipe, FlattenedRecipe
+# endregion
+
+
+# region Recipe Graph
+def load_sub_recipe_edges():
+    """
+    Returns {parent id: [(component id, portions)]} for every sub-recipe.
+    """
+    edges = defaultdict(list)
+    for parent_id, component_id, quantity in ProductSubRecipe.objects.values_list('parent_id', 'component_id',
+                                                                                   'quantity'):
+        edges[parent_id].append((component_id, quantity))
+    return edges
+
+
+def ensure_acyclic(parent_id, component_id):
+    """
+    Raises ValidationError if making component_id a sub-recipe of parent_id would create a cycle,
+    i.e. if parent_id is reachable from component_id.
+    """
+    if parent_id == component_id:
+        raise ValidationError("A product cannot be a sub-recipe of itself.")
+
+    edges = load_sub_recipe_edges()
+    pending, seen = [component_id], set()
+    while pending:
+        product_id = pending.pop()
+        if product_id == parent_id:
+            raise ValidationError(f"Product {component_id} already uses product {parent_id}; "
+                                  f"adding it as a sub-recipe would create a cycle.")
+        if product_id not in seen:
+            seen.add(product_id)
+            pending.extend(child_id for child_id, _ in edges.get(product_id, []))
+
+
+def ancestors_of(product_ids, edges):
+    """
+    Returns the given products plus every product that uses them, directly or through sub-recipes.
+    """
+    parents_of = defaultdict(set)
+    for parent_id, components in edges.items():
+        for component_id, _ in components:
+            parents_of[component_id].add(parent_id)
+
+    affected, pending = set(), list(product_ids)
+    while pending:
+        product_id = pending.pop()
+        if product_id not in affected:
+            affected.add(product_id)
+            pending.extend(parents_of[product_id])
+    return affected
+
+
+def descendants_of(product_ids, edges):
+    closure, pending = set(), list(product_ids)
+    while pending:
+        product_id = pending.pop()
+        if product_id not in closure:
+            closure.add(product_id)
+            pending.extend(component_id for component_id, _ in edges.get(product_id, []))
+    return closure
+# endregion
+
+
+# region Flattening
+def flatten(product_ids, edges, lines):
+    """
+    Returns {product id: {ingredient id: milligrams}} for the given products, expanding sub-recipes.
+    `lines` maps product id -> [(ingredient id, milligrams)] for the products' own ingredients.
+    """
+    vectors = {}
+
+    def visit(product_id, path):
+        if product_id in vectors:
+            return vectors[product_id]
+        if product_id in path:
+            raise ValidationError(f"Sub-recipe cycle through product {product_id}.")
+
+        vector = defaultdict(int)
+        for ingredient_id, quantity in lines.get(product_id, []):
+            vector[ingredient_id] += quantity
+        for component_id, portions in edges.get(product_id, []):
+            for ingredient_id, quantity in visit(component_id, path | {product_id}).items():
+                vector[ingredient_id] += quantity * portions
+
+        vectors[product_id] = dict(vector)
+        return vectors[product_id]
+
+    for product_id in product_ids:
+        visit(product_id, frozenset())
+    return {product_id: vectors[product_id] for product_id in product_ids}
+
+
+def rebuild_flattened_recipes(product_ids=None):
+    """
+    Recomputes the FlattenedRecipe rows of the given products and of every product using them
+    (all products when product_ids is None).
+    """
+    edges = load_sub_recipe_edges()
+    if product_ids is None:
+        affected = set(ProductIngredient.objects.values_list('product_id', flat=True)) | set(edges)
+    else:
+        affected = ancestors_of(product_ids, edges)
+
+    lines = defaultdict(list)
+    for product_id, ingredient_id, quantity in ProductIngredient.objects.filter(
+            product_id__in=descendants_of(affected, edges)).values_list('product_id', 'ingredient_id', 'quantity'):
+        lines[product_id].append((ingredient_id, quantity))
+
+    vectors = flatten(affected, edges, lines)
+    with transaction.atomic():
+        stale = FlattenedRecipe.objects.all() if product_ids is None else FlattenedRecipe.objects.filter(
+            product_id__in=affected)
+        stale.delete()
+        FlattenedRecipe.objects.bulk_create([
+            FlattenedRecipe(product_id=product_id, ingredient_id=ingredient_id, quantity=quantity)
+            for product_id, vector in vectors.items()
+            for ingredient_id, quantity in vector.items()
+        ])
+        # Dropped now and again once committed, so a read racing the rebuild cannot keep the old recipe
+        invalidate_recipe_cache(None if product_ids is None else affected)
+        transaction.on_commit(lambda: invalidate_recipe_cache(None if product_ids is None else affected,
+                                                              republish=True))
+    return affected
+
+
+def invalidate_recipe_cache(product_ids=None, republish=False):
+    """
+    Drops cached flattened recipes of the given products (all products when None) in every worker, and
+    withdraws the node's shared recipe matrix, or, once the change is committed, publishes its next
+    generation and has every other node withdraw theirs.
+    """
+    recipe_cache = get_two_tier_cache('recipes')
+    if product_ids is None:
+        recipe_cache.invalidate()
+    elif product_ids:
+        recipe_cache.delete(*product_ids)
+
+    from .recipe_matrix import get_recipe_matrix, publish_recipe_change  # Keeps mmap off the worker boot path
+    recipe_matrix = get_recipe_matrix()
+    if recipe_matrix is not None and republish:
+        publish_recipe_change(recipe_matrix)
+    elif recipe_matrix is not None:
+        recipe_matrix.invalidate()
+# endregion
@@ -0,0 +1,75 @@
+# region Imports
+import logging
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import StockPartition, StockReservation
+# endregion
+
+logger = logging.getLogger(__name__)
+
+
+def hold_stock(partition, consumption, user):
+    """
+    Moves the quantities from `stock` to `reserved` with one conditional UPDATE per ingredient; returns the
+    ingredient ids that did not have enough stock. Call inside a transaction and roll back on a shortfall.
+    """
+    return [
+        ingredient_id
+        for ingredient_id, quantity in consumption.items()
+        if not partition.row(ingredient_id).filter(stock__gte=quantity).update(
+            stock=F('stock') - quantity, reserved=F('reserved') + quantity, user_id_update=user)
+    ]
+
+
+def _transition(reservation_id, to_status, **filters):
+    """
+    Moves an active reservation to `to_status`; returns False when another request already did.
+    """
+    return bool(StockReservation.objects.filter(pk=reservation_id, status=StockReservation.ACTIVE, **filters)
+                .update(status=to_status, updated_at=timezone.now()))
+
+
+def release_reservation(reservation, to_status=StockReservation.RELEASED):
+    """
+    Returns a reservation's held quantities to stock. Safe to race: only the request that flips the
+    status away from active gives the stock back.
+    """
+    with transaction.atomic():
+        if not _transition(reservation.pk, to_status):
+            return False
+        partition = StockPartition(reservation.branch_id)
+        for ingredient_id, quantity in reservation.lines.values_list('ingredient_id', 'quantity'):
+            partition.row(ingredient_id).update(stock=F('stock') + quantity, reserved=F('reserved') - quantity)
+    return True
+
+
+def release_expired_reservations(now=None, limit=500):
+    """
+    Releases active reservations past their deadline, oldest first (walks the status/expires_at index).
+    Returns the number released.
+    """
+    expired = StockReservation.objects.filter(
+        status=StockReservation.ACTIVE, expires_at__lte=now or timezone.now()).order_by('expires_at')[:limit]
+    released = sum(release_reservation(reservation, StockReservation.EXPIRED) for reservation in expired)
+    if released:
+        logger.info("Released %s expired stock reservations", released)
+    return released
+
+
+def consume_reservation(reservation, order):
+    """
+    Turns a reservation's hold into consumption for `order`: the stock was already taken when the
+    reservation was made, so only `reserved` is decremented and no inventory check is repeated.
+    Returns {ingredient id: milligrams consumed}, or None when the reservation is no longer active or has
+    expired. Call inside the order's transaction.
+    """
+    if not _transition(reservation.pk, StockReservation.CONFIRMED, expires_at__gt=timezone.now()):
+        return None
+    StockReservation.objects.filter(pk=reservation.pk).update(order=order)
+
+    partition = StockPartition(reservation.branch_id)
+    consumption = dict(reservation.lines.values_list('ingredient_id', 'quantity'))
+    for ingredient_id, quantity in consumption.items():
+        partition.row(ingredient_id).update(reserved=F('reserved') - quantity)
+    return consumption
@@ -1,15 +1,30 @@
 # region Imports
-from .models import Order, Product, Ingredient, OrderProduct
-from django.core.mail import send_mail
-from utils.importinglibs.data_manipulation_libs import settings, os, transaction, serializers
+import datetime
+from .models import Order, OrderProduct, FlattenedRecipe, StockPartition, get_stock_limit
+from .models import StockReservation, StockReservationLine, StockReservationProduct
+from .reservations import consume_reservation, hold_stock, release_expired_reservations
+from .events import publish_order_created, publish_low_stock
+from .alerts import low_stock_alerts
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from utils.baseclasses.base_serializers import BatchedPrimaryKeyRelatedField, BatchedRelationListSerializer
+from utils.caching import get_two_tier_cache
+from utils.endpointhandling.exceptions import BaseCustomException
+from utils.importinglibs.data_manipulation_libs import transaction, serializers
 # endregion
 
 
 # region Serializers
 class OrderProductSerializer(serializers.ModelSerializer):
+    # All line items' products are fetched in one query, and create() reuses the resolved objects
+    serializer_related_field = BatchedPrimaryKeyRelatedField
+
     class Meta:
         model = OrderProduct
         fields = ['product', 'quantity']
+        list_serializer_class = BatchedRelationListSerializer
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -17,7 +32,8 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'products']
+        fields = ['id', 'branch', 'products']
+        read_only_fields = ['branch']
         extra_kwargs = {
             'user_id_create': {'required': False},
             'user_id_update': {'required': False},
@@ -25,142 +41,270 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """
-        Create an order, check inventory, process each product in the order,
-        update ingredient stock, and send email notifications if stock is low.
+        Create an order: admit it with read-only stock checks, then atomically re-check and
+        decrement the stock of the caller's branch, and send email notifications if stock is low.
+        With a `reservation` the order consumes the stock already held for it instead.
         """
+        stock_limit = get_stock_limit()  # Retrieve the stock limit (e.g. 1/2) as an exact fraction
+
+        # region Step 1: Acquire order data
+        reservation = validated_data.pop('reservation', None)
+        if reservation is not None:
+            validated_data['branch_id'] = reservation.branch_id
+            products_data = [{'product': line.product, 'quantity': line.quantity}
+                             for line in reservation.products.select_related('product')]
+        else:
+            products_data = validated_data.pop('products')
+        user_id_create, user_id_update = validated_data['user_id_create'], validated_data['user_id_update']
+
+        # Orders consume the stock of the creating user's branch (global stock when they have none)
+        validated_data.setdefault('branch_id', user_id_create.branch_id)
+        partition = StockPartition(validated_data['branch_id'])
+        # endregion
+
+        # region Step 2: Admission stage - read-only inventory check before any write
+        if reservation is None:
+            ingredient_consumption = self.calculate_consumption(products_data)
+            self.check_available(ingredient_consumption, partition)
+        # endregion
+
         try:
             with transaction.atomic():
-                stock_limit = float(os.environ.get('STOCK_LIMIT'))  # Retrieve the stock limit (e.g. 0.5)
-
-                # region Step 1: Acquire order data and create the order instance
-                products_data = validated_data.pop('products')
                 order = Order.objects.create(**validated_data)
-                user_id_create, user_id_update = validated_data.pop('user_id_create'), validated_data.pop(
-                    'user_id_update')
-                # endregion
 
-                # region Step 2: Check inventory before processing the order
-                insufficient_ingredients = self.check_inventory(products_data)
-                if insufficient_ingredients:
-                    raise serializers.ValidationError({
-                        'insufficient_stock': f"Insufficient stock for the following ingredients: "
-                                              f"{', '.join(insufficient_ingredients)}"
-                    })
+                # region Step 3: Atomically re-check and decrement stock for each ingredient
+                if reservation is not None:
+                    # The reservation already holds the stock; no inventory check is repeated
+                    ingredient_consumption = consume_reservation(reservation, order)
+                    if ingredient_consumption is None:
+                        raise BaseCustomException("The reservation has expired or was already used.",
+                                                  status.HTTP_409_CONFLICT, key='reservation_inactive')
+                else:
+                    short_ingredient_ids = [
+                        ingredient_id
+                        for ingredient_id, total_required in ingredient_consumption.items()
+                        if not partition.row(ingredient_id).filter(stock__gte=total_required).update(
+                            stock=F('stock') - total_required, user_id_update=user_id_update)
+                    ]
+                    if short_ingredient_ids:
+                        # Stock changed since admission: the order is rejected whatever a re-read shows now
+                        self.raise_for_failed_decrement(ingredient_consumption, short_ingredient_ids, partition)
                 # endregion
 
-                # region Step 3: Process each product, update stock, and create OrderProduct entries
-                updated_ingredients = []  # List to hold ingredients that need to be updated
-
-                for product_data in products_data:
-                    # Fetch the product and its related ingredients
-                    product = Product.objects.prefetch_related('productingredient_set__ingredient').get(
-                        pk=product_data['product'].id)
-                    quantity = product_data['quantity']
-
-                    # Process the ingredients associated with the product
-                    for product_ingredient in product.productingredient_set.all():
-                        ingredient = product_ingredient.ingredient
-                        total_consumption = product_ingredient.quantity * quantity
-
-                        # Update ingredient stock
-                        ingredient.stock -= total_consumption
-                        ingredient.user_id_update = user_id_update
-
-                        # Check for stock threshold and set the email flag
-                        if ingredient.stock < ingredient.stock_initial * stock_limit and not ingredient.email_sent:
-                            self.notify_low_stock(ingredient, stock_limit)
-                            ingredient.email_sent = True
-                        elif ingredient.stock >= ingredient.stock_initial * stock_limit:
-                            ingredient.email_sent = False
-
-                        # Add the ingredient to the list of updated ingredients
-                        updated_ingredients.append(ingredient)
-
-                    # Create the association between the order and the product
-                    OrderProduct.objects.create(order=order, product=product, quantity=quantity,
-                                                user_id_create=user_id_create, user_id_update=user_id_update)
+                # region Step 4: Check for stock threshold (in SQL) and set the email flag
+                self.flag_low_stock(partition, ingredient_consumption, stock_limit)
+                # endregion
 
-                    # Perform a bulk update for all modified ingredients
-                    if updated_ingredients:
-                        Ingredient.objects.bulk_update(updated_ingredients, ['stock', 'email_sent', 'user_id_update'])
-                        updated_ingredients = []
+                # region Step 5: Create the association between the order and its products
+                OrderProduct.objects.bulk_create([
+                    OrderProduct(order=order, product=product_data['product'], quantity=product_data['quantity'],
+                                 user_id_create=user_id_create, user_id_update=user_id_update)
+                    for product_data in products_data
+                ])
+                # endregion
 
+                # Kitchen displays only hear about the order once it is durable
+                transaction.on_commit(lambda: publish_order_created(order, products_data))
                 return order
-                # endregion
 
+        except BaseCustomException:
+            raise
         except Exception as e:
             # Catch any exception during the order creation and raise a validation error
             raise serializers.ValidationError(f"Error occurred while creating the order: {e}")
 
-    # region Inventory Check Method
+    # region Inventory Check Methods
     @staticmethod
-    def check_inventory(products_data):
+    def calculate_consumption(products_data):
         """
-        Checks if the stock is sufficient for each ingredient required in the order.
-        Returns a list of ingredient names that have insufficient stock.
+        Returns the total quantity (exact integer milligrams) required per ingredient id across all products
+        in the order.
         """
-        insufficient_ingredients = []
-
-        # Step 1: Track total ingredient consumption across all products in the order
         ingredient_consumption = {}
 
-        # Create a list of product IDs to avoid querying inside the loop
-        product_ids = [product_data['product'].id for product_data in products_data]
+        # Flattened bills of materials (sub-recipes already expanded) come from the node's shared recipe
+        # matrix; while it is being republished, from the two-tier recipe cache, and the products it misses
+        # are fetched in one query
+        from .recipe_matrix import get_recipe_matrix  # Maps files; loaded by the warm-up, not at worker boot
+        product_ids = list({product_data['product'].id for product_data in products_data})
+        recipe_matrix = get_recipe_matrix()
+        recipes = recipe_matrix.recipes(product_ids) if recipe_matrix is not None else None
+
+        if recipes is None:
+            recipe_cache = get_two_tier_cache('recipes')
+            recipes = recipe_cache.get_many(product_ids)
+            missing = [product_id for product_id in product_ids if product_id not in recipes]
+            if missing:
+                generation = recipe_cache.generation()  # Before the query: a recipe change meanwhile voids the fill
+                loaded = {product_id: [] for product_id in missing}
+                for product_id, ingredient_id, quantity in FlattenedRecipe.objects.filter(
+                        product_id__in=missing).values_list('product_id', 'ingredient_id', 'quantity'):
+                    loaded[product_id].append((ingredient_id, quantity))
+                recipe_cache.fill(loaded, generation)
+                recipes.update(loaded)
 
-        # Fetch all products and their related ingredients in one go
-        products = Product.objects.prefetch_related('productingredient_set__ingredient').filter(id__in=product_ids)
-
-        # Convert the list of products to a dictionary for faster lookup
-        product_dict = {product.id: product for product in products}
-
-        # Step 2: Calculate total ingredient consumption across all products in the order
         for product_data in products_data:
-            product = product_dict.get(product_data['product'].id)
-            if not product:
-                continue  # Skip if product is not found
-
             quantity = product_data['quantity']
+            for ingredient_id, ingredient_quantity in recipes.get(product_data['product'].id, []):
+                ingredient_consumption[ingredient_id] = (
+                    ingredient_consumption.get(ingredient_id, 0) + ingredient_quantity * quantity
+                )
 
-            # Check each product's ingredients and calculate the total consumption
-            for product_ingredient in product.productingredient_set.all():
-                ingredient = product_ingredient.ingredient
-                total_consumption = product_ingredient.quantity * quantity
+        return ingredient_consumption
 
-                # Track the total consumption of each ingredient
-                if ingredient.id not in ingredient_consumption:
-                    ingredient_consumption[ingredient.id] = 0
-                ingredient_consumption[ingredient.id] += total_consumption
+    @staticmethod
+    def check_inventory(ingredient_consumption, partition=None):
+        """
+        Checks if the stock of the partition (global stock by default) is sufficient for each ingredient
+        required in the order. Read-only: returns a list of shortfall entries for the ingredients with
+        insufficient stock.
+        """
+        insufficient_ingredients = []
 
-        # Step 3: Check if the total consumption exceeds the stock for each ingredient
-        for ingredient_id, total_required in ingredient_consumption.items():
-            ingredient = Ingredient.objects.get(id=ingredient_id)
+        stock_levels = (partition or StockPartition()).stock_levels(ingredient_consumption)
+        for ingredient_id, (name, stock) in stock_levels.items():
+            total_required = ingredient_consumption[ingredient_id]
 
             # If the stock is insufficient, add the ingredient to the list
-            if ingredient.stock < total_required:
-                insufficient_ingredients.append(ingredient.name)
+            if stock < total_required:
+                insufficient_ingredients.append(
+                    OrderSerializer.shortfall_entry(ingredient_id, name, total_required, stock))
 
         return insufficient_ingredients
 
+    @staticmethod
+    def shortfall_entry(ingredient_id, name, required, available):
+        return {
+            'ingredient_id': ingredient_id,
+            'ingredient': name,
+            'required': required,
+            'available': available,
+            'shortfall': max(required - available, 0),
+        }
+
+    @classmethod
+    def check_available(cls, ingredient_consumption, partition):
+        """
+        Raises the shortfall error unless the partition can cover the consumption. On a shortfall, expired
+        reservations are released first and the check is repeated, so lapsed carts never block an order.
+        """
+        insufficient_ingredients = cls.check_inventory(ingredient_consumption, partition)
+        if insufficient_ingredients and release_expired_reservations():
+            insufficient_ingredients = cls.check_inventory(ingredient_consumption, partition)
+        cls.raise_for_shortfall(insufficient_ingredients)
+
+    @staticmethod
+    def shortfall_error(insufficient_ingredients):
+        """
+        Builds the structured insufficient-stock error listing the shortfall per ingredient.
+        """
+        return BaseCustomException(
+            f"Insufficient stock for the following ingredients: "
+            f"{', '.join(entry['ingredient'] for entry in insufficient_ingredients)}",
+            status.HTTP_400_BAD_REQUEST,
+            key='insufficient_stock',
+            errors=insufficient_ingredients,
+        )
+
+    @classmethod
+    def raise_for_shortfall(cls, insufficient_ingredients):
+        """
+        Raises the insufficient-stock error if any ingredient falls short.
+        """
+        if insufficient_ingredients:
+            raise cls.shortfall_error(insufficient_ingredients)
+
+    @classmethod
+    def raise_for_failed_decrement(cls, ingredient_consumption, short_ingredient_ids, partition):
+        """
+        Raises the insufficient-stock error for the ingredients whose conditional decrement matched no row.
+        Always raises: a restock committed after the failed UPDATE can make a re-read look sufficient, yet
+        the stock was not decremented. The re-read only fills in the error details.
+        """
+        stock_levels = partition.stock_levels(short_ingredient_ids)
+        raise cls.shortfall_error([
+            cls.shortfall_entry(ingredient_id, stock_levels[ingredient_id][0],
+                                ingredient_consumption[ingredient_id], stock_levels[ingredient_id][1])
+            for ingredient_id in short_ingredient_ids
+        ])
+
     # endregion
 
     # region Email Notification Method
+    @classmethod
+    def flag_low_stock(cls, partition, ingredient_ids, stock_limit):
+        """
+        Finds the partition's rows that just fell below the threshold (in SQL), queues their alert and
+        event, and sets their email flag. Call inside the transaction that decremented the stock.
+        """
+        low_stock_ingredients = []
+        for ingredient in partition.rows(ingredient_ids).below_threshold(stock_limit).filter(email_sent=False):
+            cls.notify_low_stock(ingredient, stock_limit)
+            ingredient.email_sent = True
+            low_stock_ingredients.append(ingredient)
+            transaction.on_commit(lambda row=ingredient: publish_low_stock(row, partition.branch_id))
+
+        if low_stock_ingredients:
+            partition.queryset.model.objects.bulk_update(low_stock_ingredients, ['email_sent'])
+
     @staticmethod
     def notify_low_stock(ingredient, stock_limit):
         """
-        Sends an email notification when the stock for an ingredient is below the defined threshold.
+        Queues a low-stock alert for the ingredient once the order commits; alerts are coalesced
+        into one digest email per recipient (see inventory.alerts).
         """
-        from_email = settings.DEFAULT_FROM_EMAIL
-        send_mail(
-            "Stock Alert",
-            f"The stock for {ingredient.name} is below {stock_limit * 100}%.",
-            from_email=from_email,
-            recipient_list=['merchant@example.com'],
-            fail_silently=False,
-        )
-
-        # Update the ingredient's email_sent flag to avoid sending duplicate emails
-        ingredient.email_sent = True
-        ingredient.save()
+        transaction.on_commit(lambda: low_stock_alerts.record(ingredient, stock_limit))
     # endregion
 
+
+class StockReservationProductSerializer(serializers.ModelSerializer):
+    serializer_related_field = BatchedPrimaryKeyRelatedField
+
+    class Meta:
+        model = StockReservationProduct
+        fields = ['product', 'quantity']
+        list_serializer_class = BatchedRelationListSerializer
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    products = StockReservationProductSerializer(many=True)
+    ttl_seconds = serializers.IntegerField(write_only=True, required=False, min_value=1)
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'branch', 'status', 'expires_at', 'order', 'products', 'ttl_seconds']
+        read_only_fields = ['branch', 'status', 'expires_at', 'order']
+
+    def validate_ttl_seconds(self, value):
+        return min(value, settings.STOCK_RESERVATION_MAX_TTL)
+
+    def create(self, validated_data):
+        """
+        Hold the ingredients of a cart for `ttl_seconds` (STOCK_RESERVATION_TTL by default): the same
+        read-only admission check as an order, then the quantities move from `stock` to `reserved`.
+        """
+        products_data = validated_data.pop('products')
+        ttl = validated_data.pop('ttl_seconds', settings.STOCK_RESERVATION_TTL)
+        user_id_create, user_id_update = validated_data['user_id_create'], validated_data['user_id_update']
+        validated_data['branch_id'] = user_id_create.branch_id
+        partition = StockPartition(validated_data['branch_id'])
+
+        ingredient_consumption = OrderSerializer.calculate_consumption(products_data)
+        OrderSerializer.check_available(ingredient_consumption, partition)
+
+        with transaction.atomic():
+            reservation = StockReservation.objects.create(
+                expires_at=timezone.now() + datetime.timedelta(seconds=ttl), **validated_data)
+            short_ingredient_ids = hold_stock(partition, ingredient_consumption, user_id_update)
+            if short_ingredient_ids:
+                OrderSerializer.raise_for_failed_decrement(ingredient_consumption, short_ingredient_ids, partition)
+            StockReservationProduct.objects.bulk_create([
+                StockReservationProduct(reservation=reservation, **product_data) for product_data in products_data
+            ])
+            StockReservationLine.objects.bulk_create([
+                StockReservationLine(reservation=reservation, ingredient_id=ingredient_id, quantity=quantity)
+                for ingredient_id, quantity in ingredient_consumption.items()
+            ])
+        return reservation
+
 # endregion
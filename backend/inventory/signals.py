@@ -0,0 +1,49 @@
+# region Imports
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Ingredient, Order, OrderProduct, Product, ProductIngredient, ProductSubRecipe
+from .recipes import rebuild_flattened_recipes
+# endregion
+
+
+# region Cached Order Detail Invalidation
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_detail(sender, instance, created=False, **kwargs):
+    """
+    Orders are immutable through the API; this only fires for admin or shell edits.
+    """
+    if not created:
+        cache.delete(Order.detail_cache_key(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=OrderProduct)
+def invalidate_order_detail_line(sender, instance, **kwargs):
+    cache.delete(Order.detail_cache_key(instance.order_id))
+# endregion
+
+
+# region Flattened Recipe Maintenance
+@receiver([post_save, post_delete], sender=ProductIngredient)
+def rebuild_recipe_for_line(sender, instance, raw=False, **kwargs):
+    # Fixtures (raw saves) are followed by `manage.py rebuild_recipes`
+    if not raw:
+        rebuild_flattened_recipes([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=ProductSubRecipe)
+def rebuild_recipe_for_sub_recipe(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rebuild_flattened_recipes([instance.parent_id])
+# endregion
+
+
+# region Catalog Sync Tombstones
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductIngredient)
+def record_catalog_deletion(sender, instance, **kwargs):
+    # Cascaded deletes send post_delete per row, so recipe lines of a deleted product get tombstones too
+    from .catalog import record_tombstone  # Loads DRF exceptions; keep it off the worker boot path
+    record_tombstone(instance)
+# endregion
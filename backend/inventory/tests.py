@@ -1,10 +1,39 @@
 # region Imports
-from rest_framework.test import APITestCase
-from rest_framework import status
-from django.urls import reverse
-from .models import Product, Ingredient, Order, OrderProduct, ProductIngredient
-from utils.models import User
+import asyncio
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from fractions import Fraction
 from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from utils.admission import AdmissionController, ServiceOverloaded
+from utils.db_routers import PrimaryReplicaRouter, is_pinned_to_primary, replica_reads
+from utils.models import User, Branch
+from .alerts import low_stock_alerts
+from .events import Event, EventBroker, broker
+from .exports import export_queryset, stream_export
+from .forecast import StockoutProjector
+from .group_commit import GroupCommitWriter, PendingOrder
+from .ingest import OrderIngestor
+from .models import BranchIngredient, FlattenedRecipe, Ingredient, Order, OrderIngestCheckpoint, OrderProduct
+from .models import Product, ProductIngredient, ProductSubRecipe, StockPartition, StockReservation
+from .recipe_matrix import GENERATION, SharedRecipeMatrix
+from .serializers import OrderSerializer
 # endregion
 
 
@@ -32,6 +61,7 @@ class OrderTestCase(APITestCase):
         )
         user.set_password(self.user_password)
         user.save()
+        self.user = user
 
         # Create a non-superuser for permission testing
         self.user_email_disable = "cannotaccess@foodex.com"
@@ -212,3 +242,717 @@ class OrderTestCase(APITestCase):
             self.assertEqual(response_3.status_code, 201)
             self.assertEqual(mock_notify.call_count, 2)
     # endregion
+
+    # region Test Case: Short-Stock Order Rejected Before Any Write
+    def test_short_stock_rejected_before_write(self):
+        payload = {"products": [{"product": self.burger.id, "quantity": 100}]}  # Needs 2kg onion, 1kg in stock
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(self.order_url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # No row is inserted and no write transaction is opened for a rejected order
+        self.assertEqual(Order.objects.count(), 0)
+        write_queries = [q['sql'] for q in captured.captured_queries
+                         if q['sql'].startswith(('INSERT', 'UPDATE', 'SAVEPOINT'))]
+        self.assertEqual(write_queries, [])
+
+        # The error lists the shortfall per ingredient
+        error = response.data['message']
+        self.assertEqual(error['key'], 'insufficient_stock')
+        self.assertEqual(error['errors'], [{
+            'ingredient_id': self.onion.id, 'ingredient': 'onion',
+            'required': 2000, 'available': 1000, 'shortfall': 1000,
+        }])
+
+    # endregion
+
+    # region Test Case: A Failed Decrement Rejects the Order Even If Stock Is Restocked Meanwhile
+    def test_failed_decrement_rejects_despite_restock(self):
+        payload = {"products": [{"product": self.burger.id, "quantity": 100}]}  # Needs 2kg onion, 1kg in stock
+        original_stock_levels = StockPartition.stock_levels
+
+        def restock_then_read(partition, ingredient_ids):
+            # A restock commits between the failed conditional UPDATE and the re-read
+            Ingredient.objects.filter(pk=self.onion.pk).update(stock=5000)
+            return original_stock_levels(partition, ingredient_ids)
+
+        with patch.object(OrderSerializer, 'check_available'), \
+                patch.object(StockPartition, 'stock_levels', restock_then_read):
+            response = self.client.post(self.order_url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message']['key'], 'insufficient_stock')
+        self.assertEqual([entry['ingredient'] for entry in response.data['message']['errors']], ['onion'])
+        self.assertEqual(Order.objects.count(), 0)
+        self.beef.refresh_from_db()
+        self.assertEqual(self.beef.stock, 20000)
+
+    # endregion
+
+    # region Test Case: Orders Consume Only the Caller's Branch Stock
+    def test_order_consumes_branch_stock(self):
+        audit = {"user_id_create": self.user, "user_id_update": self.user}
+        branch_a = Branch.objects.create(name="branch a", **audit)
+        branch_b = Branch.objects.create(name="branch b", **audit)
+        for branch in (branch_a, branch_b):
+            for ingredient in (self.beef, self.cheese, self.onion):
+                BranchIngredient.objects.create(branch=branch, ingredient=ingredient, stock=1000, **audit)
+
+        self.user.branch = branch_a
+        self.user.save()
+
+        payload = {"products": [{"product": self.burger.id, "quantity": 2}]}
+        response = self.client.post(self.order_url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.get().branch, branch_a)
+
+        # Branch A rows are decremented; branch B and the global stock are untouched
+        stock_a = dict(BranchIngredient.objects.filter(branch=branch_a).values_list('ingredient_id', 'stock'))
+        self.assertEqual(stock_a, {self.beef.id: 1000 - 300, self.cheese.id: 1000 - 60, self.onion.id: 1000 - 40})
+        self.assertEqual(set(BranchIngredient.objects.filter(branch=branch_b).values_list('stock', flat=True)), {1000})
+        self.beef.refresh_from_db()
+        self.assertEqual(self.beef.stock, 20000)
+
+        # Branch A cannot draw on branch B's stock
+        payload = {"products": [{"product": self.burger.id, "quantity": 5}]}  # Needs 750g beef, 700g left
+        response = self.client.post(self.order_url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([entry['ingredient'] for entry in response.data['message']['errors']], ['beef'])
+
+    # endregion
+
+    # region Test Case: Order Event Published Once the Transaction Commits
+    def test_order_event_published_on_commit(self):
+        payload = {"products": [{"product": self.burger.id, "quantity": 2}]}
+        last_event = broker.publish('marker', {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.order_url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        events = broker.replay(last_event.id)
+        self.assertEqual(len(events), 1)
+        self.assertIn(b"event: order_created", events[0].frame)
+        self.assertIn(f'"id": {Order.objects.get().id}'.encode(), events[0].frame)
+
+    # endregion
+
+    # region Test Case: Threshold Crossings Coalesced Into One Digest per Recipient
+    @override_settings(LOW_STOCK_DIGEST_WINDOW=3600, LOW_STOCK_ALERT_RECIPIENTS=['a@example.com', 'b@example.com'])
+    def test_low_stock_digest_per_recipient(self):
+        # Put beef and cheese right at their 50% thresholds
+        self.beef.stock = 10000
+        self.beef.save()
+        self.cheese.stock = 2500
+        self.cheese.save()
+
+        payload = {"products": [{"product": self.burger.id, "quantity": 1}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.order_url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)  # Still inside the digest window
+
+        with patch('inventory.alerts.get_connection', wraps=get_connection) as mock_connection:
+            self.assertEqual(low_stock_alerts.flush(), 2)
+        mock_connection.assert_called_once()
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['a@example.com', 'b@example.com'])
+        for message in mail.outbox:
+            self.assertIn("beef", message.body)
+            self.assertIn("cheese", message.body)
+
+    # endregion
+
+    # region Test Case: Undelivered Digests Are Retried With the Next Window
+    @override_settings(LOW_STOCK_DIGEST_WINDOW=3600, LOW_STOCK_ALERT_RECIPIENTS=['a@example.com', 'b@example.com'])
+    def test_low_stock_digest_retried_after_send_failure(self):
+        self.beef.stock = 10000
+        self.beef.save()
+
+        payload = {"products": [{"product": self.burger.id, "quantity": 1}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(self.order_url, payload, format='json').status_code, 201)
+
+        connection = get_connection()
+        original_send = connection.send_messages
+
+        def send_or_fail(messages):
+            if messages[0].to == ['b@example.com']:
+                raise ConnectionRefusedError("SMTP server unavailable")
+            return original_send(messages)
+
+        connection.send_messages = send_or_fail
+        with patch('inventory.alerts.get_connection', return_value=connection), \
+                self.assertLogs('inventory.alerts', 'ERROR'):
+            self.assertEqual(low_stock_alerts.flush(), 1)
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com']])
+
+        # The next window only sends the digest that failed, to the recipient that missed it
+        self.assertEqual(low_stock_alerts.flush(), 1)
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com'], ['b@example.com']])
+        self.assertIn("beef", mail.outbox[1].body)
+
+    # endregion
+
+    # region Test Case: Threshold Math Is Exact in SQL and in Python
+    @patch.dict(os.environ, {"STOCK_LIMIT": "0.1"})
+    def test_threshold_comparison_is_exact(self):
+        # 30 * 0.1 is 3.0000000000000004 in floats, so a float comparison calls 3 "below" 10%
+        self.onion.stock_initial, self.onion.stock = 30, 3
+        self.onion.save()
+
+        self.assertFalse(self.onion.is_below_threshold(Fraction("0.1")))
+        self.assertFalse(Ingredient.objects.filter(pk=self.onion.pk).below_threshold(Fraction("0.1")).exists())
+
+        self.onion.stock = 2
+        self.onion.save()
+        self.assertTrue(Ingredient.objects.filter(pk=self.onion.pk).below_threshold(Fraction("0.1")).exists())
+
+    # endregion
+
+    # region Test Case: Safe Reads Use Replicas Except Right After the Client Writes
+    @override_settings(DATABASE_REPLICAS=['default'])  # Stand-in alias; what matters is the routing decision
+    def test_replica_reads_with_read_your_writes(self):
+        cache.clear()
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Order), 'default')
+
+        with patch('utils.db_routers.random.choice', return_value='default') as mock_choice:
+            # Not pinned: the list is read from a replica
+            self.assertEqual(self.client.get(self.order_url).status_code, status.HTTP_200_OK)
+            self.assertTrue(mock_choice.called)
+
+            # After a write the client is pinned to the primary
+            payload = {"products": [{"product": self.burger.id, "quantity": 1}]}
+            self.assertEqual(self.client.post(self.order_url, payload, format='json').status_code, 201)
+            self.assertTrue(is_pinned_to_primary(self.user.pk))
+
+            mock_choice.reset_mock()
+            self.assertEqual(self.client.get(self.order_url).status_code, status.HTTP_200_OK)
+            self.assertFalse(mock_choice.called)
+
+        # The routing flag never leaks past the request
+        self.assertEqual(router.db_for_read(Order), 'default')
+        with replica_reads(), patch('utils.db_routers.random.choice', return_value='replica') as mock_choice:
+            self.assertEqual(router.db_for_read(Order), 'replica')
+
+    # endregion
+
+    # region Test Case: Order Detail Served From Cache With ETag and 304
+    def test_order_detail_cached_with_etag(self):
+        cache.clear()
+        order = Order.objects.create(user_id_create=self.user, user_id_update=self.user)
+        detail_url = reverse('order-detail', args=[order.id])
+
+        response = self.client.get(detail_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['data']['id'], order.id)
+        etag = response['ETag']
+
+        # Served again without touching the orders table
+        with CaptureQueriesContext(connection) as captured:
+            cached_response = self.client.get(detail_url)
+        self.assertEqual(cached_response.content, response.content)
+        self.assertFalse([q for q in captured.captured_queries if 'inventory_order' in q['sql']])
+
+        not_modified = self.client.get(detail_url, headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Equivalent ids share the cache entry the signals invalidate
+        self.assertEqual(self.client.get(reverse('order-detail', args=[f'0{order.id}']))['ETag'], etag)
+        invalid_response = self.client.get(reverse('order-detail', args=['x1']))
+        self.assertEqual(invalid_response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Permissions are still enforced for cached orders
+        token = self.get_token(self.user_email_disable, self.user_password_disable).data["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    # endregion
+
+    # region Test Case: Nested Sub-Recipes Consume Their Ingredients Through Every Level
+    def test_nested_sub_recipes_flattened(self):
+        audit = {"user_id_create": self.user, "user_id_update": self.user}
+        base = Product.objects.create(name="sauce base", **audit)
+        ProductIngredient.objects.create(product=base, ingredient=self.onion, quantity=5, **audit)
+        sauce = Product.objects.create(name="burger sauce", **audit)
+        ProductIngredient.objects.create(product=sauce, ingredient=self.cheese, quantity=10, **audit)
+        ProductSubRecipe.objects.create(parent=sauce, component=base, quantity=2, **audit)
+        ProductSubRecipe.objects.create(parent=self.burger, component=sauce, quantity=3, **audit)
+
+        # burger = 150 beef + 30 cheese + 20 onion + 3 x (10 cheese + 2 x 5 onion)
+        flat = dict(FlattenedRecipe.objects.filter(product=self.burger).values_list('ingredient_id', 'quantity'))
+        self.assertEqual(flat, {self.beef.id: 150, self.cheese.id: 60, self.onion.id: 50})
+
+        # Changing a nested recipe re-flattens every product using it
+        ProductIngredient.objects.filter(product=base).get().delete()
+        flat = dict(FlattenedRecipe.objects.filter(product=self.burger).values_list('ingredient_id', 'quantity'))
+        self.assertEqual(flat[self.onion.id], 20)
+
+        payload = {"products": [{"product": self.burger.id, "quantity": 2}]}
+        self.assertEqual(self.client.post(self.order_url, payload, format='json').status_code, 201)
+        self.cheese.refresh_from_db()
+        self.assertEqual(self.cheese.stock, 5000 - 60 * 2)
+
+        # A product cannot (indirectly) contain itself
+        with self.assertRaises(ValidationError):
+            ProductSubRecipe.objects.create(parent=base, component=self.burger, quantity=1, **audit)
+
+    # endregion
+
+    # region Test Case: Order Writes Beyond the Admission Queue Get 429 With Retry-After
+    def test_order_write_overload_rejected(self):
+        controller = AdmissionController('order_writes', limit=1, queue_depth=0, queue_timeout=0)
+        payload = {"products": [{"product": self.burger.id, "quantity": 1}]}
+
+        with patch.dict('utils.admission._controllers', {'order_writes': controller}):
+            with controller.admit():  # Another request holds the only writer slot
+                response = self.client.post(self.order_url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response['Retry-After'], '1')
+            self.assertEqual(Order.objects.count(), 0)
+
+            # Once the slot is free the same request is admitted
+            response = self.client.post(self.order_url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        metrics = controller.snapshot()
+        self.assertEqual((metrics['admitted'], metrics['rejected'], metrics['active']), (2, 1, 0))
+
+    # endregion
+
+    # region Test Case: Orders Exported as Streamed CSV / NDJSON Within a Date Range
+    def test_streaming_order_export(self):
+        for quantity in (1, 2, 3):
+            payload = {"products": [{"product": self.burger.id, "quantity": quantity}]}
+            self.assertEqual(self.client.post(self.order_url, payload, format='json').status_code, 201)
+        Order.objects.filter(orderproduct__quantity=1).update(created_at=datetime.datetime(2024, 1, 31, 23, 0))
+
+        response = self.client.get(reverse('order-export'), {'start': '2024-02-01'})
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], 'order_id,created_at,branch_id,created_by_id,product_id,product,quantity')
+        self.assertEqual([row.rsplit(',', 1)[1] for row in rows[1:]], ['2', '3'])
+
+        response = self.client.get(reverse('order-export'), {'output': 'ndjson', 'end': '2024-01-31'})
+        orders = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([order['products'][0]['quantity'] for order in orders], [1])
+
+        # Under ASGI the blocks are streamed through an async iterator, not collected into a list first
+        async def export_over_asgi():
+            response = await self.async_client.get(reverse('order-export'), {'start': '2024-02-01'},
+                                                   headers={'Authorization': f'Bearer {self.token}'})
+            return response.is_async, b''.join([block async for block in response.streaming_content])
+
+        is_async, content = async_to_sync(export_over_asgi)()
+        self.assertTrue(is_async)
+        self.assertEqual(content.decode().splitlines(), rows)
+
+        # One streamed order query, then the line items are fetched once per chunk, not once per order
+        with CaptureQueriesContext(connection) as captured:
+            b''.join(stream_export('csv', export_queryset(), chunk_size=2))
+        self.assertEqual(len(captured.captured_queries), 1 + 2)
+
+        response = self.client.get(reverse('order-export'), {'start': 'last month'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # endregion
+
+    # region Test Case: Catalog Delta Feed Returns Only Changes and Tombstones After the Cursor
+    @override_settings(CATALOG_SYNC_SETTLE_SECONDS=0)
+    def test_catalog_delta_feed(self):
+        url = reverse('catalog-changes')
+        initial = self.client.get(url).data['data']
+        self.assertEqual([row['name'] for row in initial['ingredients']], ['beef', 'cheese', 'onion'])
+        self.assertEqual(len(initial['product_ingredients']), 3)
+        self.assertFalse(initial['has_more'])
+
+        # Nothing changed: an empty delta
+        unchanged = self.client.get(url, {'since': initial['cursor']}).data['data']
+        self.assertEqual((unchanged['ingredients'], unchanged['products'], unchanged['deleted']['products']),
+                         ([], [], []))
+
+        self.cheese.name = 'cheddar'
+        self.cheese.save()
+        line = ProductIngredient.objects.get(ingredient=self.onion)
+        line_id = line.id
+        line.delete()
+
+        delta = self.client.get(url, {'since': unchanged['cursor']}).data['data']
+        self.assertEqual([row['name'] for row in delta['ingredients']], ['cheddar'])
+        self.assertEqual(delta['product_ingredients'], [])
+        self.assertEqual(delta['deleted']['product_ingredients'], [line_id])
+
+        # Paging: one row per section per call until has_more is false
+        with override_settings(CATALOG_SYNC_PAGE_SIZE=1):
+            page = self.client.get(url).data['data']
+            self.assertTrue(page['has_more'])
+            self.assertEqual(len(page['ingredients']), 1)
+
+        self.assertEqual(self.client.get(url, {'since': 'not-a-cursor'}).status_code, 400)
+
+    # endregion
+
+    # region Test Case: Reserved Stock Is Held for the Cart and Confirmed Without a Re-check
+    def test_stock_reservation_confirm(self):
+        reservations_url = reverse('reservation-list')
+        response = self.client.post(reservations_url, {"products": [{"product": self.burger.id, "quantity": 10}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        reservation = StockReservation.objects.get()
+        self.onion.refresh_from_db()
+        self.assertEqual((self.onion.stock, self.onion.reserved), (800, 200))
+
+        # Held stock is not available to other orders
+        response = self.client.post(self.order_url, {"products": [{"product": self.burger.id, "quantity": 45}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Confirming consumes the hold: no stock query, the order gets the reserved products
+        confirm_url = reverse('reservation-confirm', args=[reservation.id])
+        with patch.object(StockPartition, 'stock_levels') as stock_levels:
+            self.assertEqual(self.client.post(confirm_url).status_code, status.HTTP_201_CREATED)
+        stock_levels.assert_not_called()
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.CONFIRMED)
+        self.assertEqual(reservation.order.orderproduct_set.get().quantity, 10)
+        self.onion.refresh_from_db()
+        self.assertEqual((self.onion.stock, self.onion.reserved), (800, 0))
+
+        self.assertEqual(self.client.post(confirm_url).status_code, status.HTTP_409_CONFLICT)
+
+        # A hold that fails its conditional UPDATE is rejected even if a restock lands before the re-read
+        original_stock_levels = StockPartition.stock_levels
+
+        def restock_then_read(partition, ingredient_ids):
+            Ingredient.objects.filter(pk=self.onion.pk).update(stock=5000)
+            return original_stock_levels(partition, ingredient_ids)
+
+        with patch.object(OrderSerializer, 'check_available'), \
+                patch.object(StockPartition, 'stock_levels', restock_then_read):
+            response = self.client.post(reservations_url, {"products": [{"product": self.burger.id, "quantity": 45}]},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    # endregion
+
+    # region Test Case: Expired Reservations Give Their Stock Back
+    def test_expired_reservation_released(self):
+        payload = {"products": [{"product": self.burger.id, "quantity": 40}]}  # 800 of 1000 onion
+        self.assertEqual(self.client.post(reverse('reservation-list'), payload, format='json').status_code, 201)
+        reservation = StockReservation.objects.get()
+        StockReservation.objects.filter(pk=reservation.pk).update(expires_at=datetime.datetime(2020, 1, 1))
+
+        # The order would be short while the lapsed cart holds stock, so the hold is released first
+        self.assertEqual(self.client.post(self.order_url, payload, format='json').status_code, 201)
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.EXPIRED)
+        self.onion.refresh_from_db()
+        self.assertEqual((self.onion.stock, self.onion.reserved), (200, 0))
+
+        confirm_url = reverse('reservation-confirm', args=[reservation.id])
+        self.assertEqual(self.client.post(confirm_url).status_code, status.HTTP_409_CONFLICT)
+
+    # endregion
+
+    # region Test Case: Spooled Orders Ingested in Batches and Resumed From the Checkpoint
+    def test_ingest_spooled_orders(self):
+        lines = [
+            {"products": [{"product": self.burger.id, "quantity": 10}], "created_at": "2024-03-01T12:00:00"},
+            "not json",
+            {"products": [{"product": self.burger.id, "quantity": 45}]},  # Needs 900 of the 800 onion left
+            {"products": [{"product": self.burger.id, "quantity": 5}]},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as spool:
+            for line in lines[:3]:
+                spool.write((line if isinstance(line, str) else json.dumps(line)) + '\n')
+        self.addCleanup(os.remove, spool.name)
+
+        rejects = io.BytesIO()
+        checkpoint = OrderIngestor(self.user, batch_size=2, rejects=rejects).ingest(spool.name)
+        self.assertEqual((checkpoint.lines, checkpoint.accepted, checkpoint.rejected), (3, 1, 2))
+        self.assertEqual([json.loads(line)['line'] for line in rejects.getvalue().splitlines()], [2, 3])
+        self.assertEqual(Order.objects.get().created_at, datetime.datetime(2024, 3, 1, 12, 0))
+        self.onion.refresh_from_db()
+        self.assertEqual(self.onion.stock, 800)
+
+        # More lines spooled later: a new run only applies what follows the checkpoint
+        with open(spool.name, 'a') as spool_file:
+            spool_file.write(json.dumps(lines[3]) + '\n')
+        checkpoint = OrderIngestor(self.user, batch_size=2).ingest(spool.name)
+        self.assertEqual((checkpoint.lines, checkpoint.accepted), (4, 2))
+        self.assertEqual(OrderIngestCheckpoint.objects.get().offset, os.path.getsize(spool.name))
+        self.onion.refresh_from_db()
+        self.assertEqual(self.onion.stock, 700)
+
+    # endregion
+
+    # region Test Case: Line Item Products Resolved in One Query, Unknown Ids Reported Together
+    def test_line_item_products_batched(self):
+        fries = Product.objects.create(name="fries", user_id_create=self.user, user_id_update=self.user)
+        lines = [{"product": self.burger.id, "quantity": 1}, {"product": fries.id, "quantity": 2},
+                 {"product": self.burger.id, "quantity": 3}]
+        serializer = OrderSerializer(data={"products": lines})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([line['product'] for line in serializer.validated_data['products']],
+                         [self.burger, fries, self.burger])
+
+        response = self.client.post(self.order_url, {"products": lines + [
+            {"product": 9998, "quantity": 1}, {"product": 9999, "quantity": 1}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("9998, 9999", str(response.data))
+
+    # endregion
+
+    # region Test Case: Workers Switch to a Republished Recipe Matrix by Its Generation
+    def test_shared_recipe_matrix_generations(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'recipes.bin')
+        writer, reader = SharedRecipeMatrix(path), SharedRecipeMatrix(path)  # As seen by two workers
+        self.assertTrue(writer.publish())
+
+        old = reader.current()
+        self.assertEqual(sorted(reader.recipes([self.burger.id])[self.burger.id]),
+                         [(self.beef.id, 150), (self.cheese.id, 30), (self.onion.id, 20)])
+        self.assertEqual(reader.recipes([9999]), {9999: []})
+
+        ProductIngredient.objects.filter(product=self.burger, ingredient=self.onion).update(quantity=25)
+        FlattenedRecipe.objects.filter(product=self.burger, ingredient=self.onion).update(quantity=25)
+        writer.publish()
+        self.assertEqual(reader.current().generation, old.generation + 1)
+        self.assertIn((self.onion.id, 25), reader.recipes([self.burger.id])[self.burger.id])
+        self.assertIn((self.onion.id, 20), old.lines(self.burger.id))  # The old mapping stays readable
+
+        # Withdrawn while a recipe changes; the next reader publishes a fresh generation
+        writer.invalidate()
+        self.assertEqual(reader.current().generation, old.generation + 3)
+
+        # A change committed on another node: the first worker here withdraws the matrix, its sibling skips
+        change_id = 'change-1'
+        sibling = SharedRecipeMatrix(path)
+        reader.invalidate(change_id)
+        generation = reader._open_generation()
+        self.assertEqual(GENERATION.unpack_from(generation)[0], old.generation + 4)
+        sibling.invalidate(change_id)
+        self.assertEqual(GENERATION.unpack_from(generation)[0], old.generation + 4)
+
+        # A matrix older than max_age is rebuilt, even without a broadcast
+        aging = SharedRecipeMatrix(path, max_age=60)
+        current = aging.current()
+        current.built_at -= 120
+        self.assertEqual(aging.current().generation, current.generation + 1)
+
+    # endregion
+
+    # region Test Case: Group Commit Writes a Batch Together With Per-Order Decisions
+    def test_group_commit_batch(self):
+        cashier = User.objects.create(email="cashier@foodex.com", phone="+200000000002")
+        cheese_plate = Product.objects.create(name="cheese plate", user_id_create=self.user, user_id_update=self.user)
+        ProductIngredient.objects.create(product=cheese_plate, ingredient=self.cheese, quantity=100,
+                                         user_id_create=self.user, user_id_update=self.user)
+        batch = [PendingOrder([{"product": product, "quantity": quantity}], user, None)
+                 for product, quantity, user in ((self.burger, 10, self.user), (self.burger, 45, cashier),
+                                                 (cheese_plate, 5, cashier))]
+        # The second needs 900 of the 800 onion the first leaves
+        with CaptureQueriesContext(connection) as queries:
+            GroupCommitWriter(max_wait=0.005, max_batch=64, max_pending=8).commit(batch)
+
+        self.assertEqual([pending.order is not None for pending in batch], [True, False, True])
+        self.assertEqual(batch[1].error.key, 'insufficient_stock')
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderProduct.objects.get(order=batch[2].order).quantity, 5)
+        self.onion.refresh_from_db()
+        self.assertEqual(self.onion.stock, 800)
+        # One conditional UPDATE per ingredient for the whole batch
+        stock_updates = [query for query in queries if query['sql'].startswith('UPDATE "inventory_ingredient"')
+                         and '"stock" >=' in query['sql']]
+        self.assertEqual(len(stock_updates), 3)
+        # Each stock row records the user of the last order that consumed it
+        self.cheese.refresh_from_db()
+        self.assertEqual((self.onion.user_id_update, self.cheese.user_id_update), (self.user, cashier))
+
+        # An order the writer does not take in time is withdrawn and answered with a 429
+        writer = GroupCommitWriter(max_wait=0.005, max_batch=64, max_pending=8, timeout=0.05)
+        with patch.object(writer, '_ensure_writer'):  # As if the writer thread had died
+            with self.assertRaises(ServiceOverloaded):
+                writer.submit([{"product": self.burger, "quantity": 1}], cashier, None)
+        self.assertFalse(writer.gather()[0].claim())
+
+    # endregion
+
+    # region Test Case: Stockout Projected From Recent Burn Rates and Refreshed Incrementally
+    def test_stockout_projection(self):
+        def order_at(hours_ago):
+            payload = {"products": [{"product": self.burger.id, "quantity": 10}]}  # 200 onion, 1500 beef
+            self.assertEqual(self.client.post(self.order_url, payload, format='json').status_code, 201)
+            Order.objects.filter(pk=Order.objects.latest('id').pk).update(
+                created_at=datetime.datetime.now() - datetime.timedelta(hours=hours_ago))
+
+        Ingredient.objects.create(name="salt", stock=100, user_id_create=self.user, user_id_update=self.user)
+        # Uniform weights over the two complete hours of a three-hour window
+        projector = StockoutProjector(window_hours=3, half_life_hours=1e9)
+        order_at(2)
+        projector.refresh()
+        by_name = {entry['ingredient']: entry for entry in projector.project()}
+        self.assertEqual(by_name['onion']['burn_rate_per_hour'], 100)
+        self.assertEqual(by_name['onion']['hours_to_stockout'], 8)  # 800 left
+        self.assertIsNone(by_name['salt']['hours_to_stockout'])
+
+        # An order still in flight: its id is lower than the next one's, but it is not visible yet
+        audit = {"user_id_create": self.user, "user_id_update": self.user}
+        late_order = Order.objects.create(**audit)
+        OrderProduct.objects.create(order=late_order, product=self.burger, quantity=10, **audit)
+        Order.objects.filter(pk=late_order.pk).update(created_at=datetime.datetime(2020, 1, 1))
+
+        # Only the recent hours are re-read on the next refresh
+        order_at(1)
+        with CaptureQueriesContext(connection) as queries:
+            projector.refresh()
+        self.assertLessEqual(len(queries), 3)
+        projection = projector.project()
+        self.assertEqual(projection[0]['ingredient'], 'onion')
+        self.assertEqual((projection[0]['burn_rate_per_hour'], projection[0]['hours_to_stockout']), (200, 3))
+
+        # The in-flight order commits: it is counted although a higher id was already folded in, and an
+        # order with a future timestamp is left out instead of failing the refresh
+        Order.objects.filter(pk=late_order.pk).update(created_at=datetime.datetime.now() - datetime.timedelta(hours=1))
+        order_at(-5)
+        projector.refresh()
+        onion = {entry['ingredient']: entry for entry in projector.project()}['onion']
+        self.assertEqual(onion['burn_rate_per_hour'], 300)  # 200mg two hours ago, 400mg one hour ago
+
+        response = self.client.get(reverse('stockout-projection'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # endregion
+
+
+class EventBrokerTestCase(SimpleTestCase):
+
+    # region Helpers
+    @staticmethod
+    def collect(stream, count):
+        async def take():
+            frames = []
+            async for frame in stream:
+                frames.append(frame)
+                if len(frames) == count:
+                    break
+            await stream.aclose()
+            return frames
+
+        return take()
+
+    # endregion
+
+    # region Test Case: Resume From Last-Event-ID Replays Only Missed Events
+    def test_resume_replays_missed_events(self):
+        event_broker = EventBroker()
+        first = event_broker.publish('order_created', {'id': 1})
+        second = event_broker.publish('order_created', {'id': 2})
+        third = event_broker.publish('order_created', {'id': 3})
+
+        frames = asyncio.run(self.collect(event_broker.stream(last_event_id=first.id), 2))
+        self.assertEqual(frames, [second.frame, third.frame])
+
+    # endregion
+
+    # region Test Case: Live Events Are Encoded Once and Fanned Out
+    def test_fan_out_shares_one_encoded_frame(self):
+        event_broker = EventBroker()
+
+        async def scenario():
+            streams = [event_broker.stream(), event_broker.stream(branch_id=7), event_broker.stream(branch_id=8)]
+            readers = [asyncio.ensure_future(self.collect(stream, 1)) for stream in streams]
+            await asyncio.sleep(0.01)  # Let every stream subscribe
+            event = event_broker.publish('low_stock', {'ingredient': 'beef'}, branch_id=7)
+            done, pending = await asyncio.wait(readers, timeout=0.5)
+            for reader in pending:
+                reader.cancel()
+            return event, [reader.result() for reader in readers if reader in done]
+
+        event, results = asyncio.run(scenario())
+
+        # The branch 8 subscriber does not receive branch 7 events; the others share the same bytes
+        self.assertEqual(len(results), 2)
+        for frames in results:
+            self.assertIs(frames[0], event.frame)
+
+    # endregion
+
+    # region Test Case: A Subscriber That Falls Behind Is Dropped and Resumes From the Buffer
+    def test_slow_subscriber_dropped_then_resumes(self):
+        event_broker = EventBroker(queue_size=2)
+
+        async def scenario():
+            reader = asyncio.ensure_future(self.collect(event_broker.stream(), 10))
+            await asyncio.sleep(0.01)  # Let the stream subscribe
+            events = [event_broker.publish('order_created', {'id': index}) for index in range(4)]
+            received = await asyncio.wait_for(reader, timeout=1)  # Ends once the stream is dropped
+            return events, received
+
+        events, received = asyncio.run(scenario())
+        self.assertLess(len(received), len(events))
+        self.assertEqual(event_broker._subscribers, set())
+
+        # Reconnecting with the last delivered id replays everything that was dropped
+        last_event_id = int(received[-1].split(b'\n')[0][4:]) if received else 0
+        frames = asyncio.run(self.collect(event_broker.stream(last_event_id=last_event_id),
+                                          len(events) - len(received)))
+        self.assertEqual(received + frames, [event.frame for event in events])
+
+    # endregion
+
+    # region Test Case: Events Published Through Redis Decode to the Same Frame
+    def test_redis_message_decodes_to_local_frame(self):
+        local = EventBroker().publish('low_stock', {'ingredient': 'beef'}, branch_id=7)
+
+        # The message the publish script builds: "<id>\0<branch id>\0<body>"
+        message = f'{local.id}\0{7}\0'.encode() + Event.encode_body('low_stock', {'ingredient': 'beef'})
+        event = Event.from_message(message)
+        self.assertEqual((event.id, event.branch_id, event.frame), (local.id, 7, local.frame))
+        self.assertIsNone(Event.from_message(message.replace(b'\x007\x00', b'\x00\x00')).branch_id)
+
+    # endregion
+
+    # region Test Case: Several ASGI Workers Require the Redis Event Stream
+    def test_asgi_workers_require_redis(self):
+        with self.assertRaisesMessage(CommandError, 'REDIS_URL'):
+            call_command('serve', '--asgi', '--workers', '2')
+
+    # endregion
+
+
+class AdminChangelistTestCase(TestCase):
+
+    # region Test Setup: Staff User and a Few Orders
+    def setUp(self):
+        self.user = User.objects.create(email="ops@foodex.com", first_name="Ops", last_name="Staff",
+                                        phone="+200000000000", is_staff=True, is_superuser=True)
+        audit = {"user_id_create": self.user, "user_id_update": self.user}
+        product = Product.objects.create(name="burger", **audit)
+        for _ in range(3):
+            order = Order.objects.create(**audit)
+            OrderProduct.objects.create(order=order, product=product, quantity=1, **audit)
+        self.client.force_login(self.user)
+
+    # endregion
+
+    # region Test Case: Changelists Never Run an Unbounded COUNT(*)
+    def test_changelists_avoid_full_counts(self):
+        for model in ('order', 'orderproduct', 'ingredient', 'product', 'productingredient'):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(reverse(f'admin:inventory_{model}_changelist'))
+            self.assertEqual(response.status_code, 200)
+
+            unbounded_counts = [q['sql'] for q in captured.captured_queries
+                                if 'COUNT(*)' in q['sql'] and f'"inventory_{model}"' in q['sql']
+                                and 'LIMIT' not in q['sql']]
+            self.assertEqual(unbounded_counts, [], model)
+
+    # endregion
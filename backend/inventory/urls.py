@@ -1,7 +1,14 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet
+from .views import OrderViewSet, StockReservationViewSet, CatalogChangesView, StockoutProjectionView, order_events
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'reservations', StockReservationViewSet, basename='reservation')
 
-urlpatterns = router.urls
+urlpatterns = [
+    # Registered before the router so "events" is not captured as an order pk
+    path('orders/events/', order_events, name='order-events'),
+    path('catalog/changes/', CatalogChangesView.as_view(), name='catalog-changes'),
+    path('stock/stockout/', StockoutProjectionView.as_view(), name='stockout-projection'),
+] + router.urls
@@ -1,7 +1,31 @@
 # region Imports
+from asgiref.sync import sync_to_async
+import datetime
+import hashlib
+from django.core.cache import cache
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db import router
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from utils.admission import get_admission_controller
 from utils.baseclasses.base_views import CustomResponseViewSet
-from .models import Order
-from .serializers import OrderSerializer
+from utils.endpointhandling.exceptions import BaseCustomException
+from utils.endpointhandling.responses import success_response, PrerenderedResponse
+from .catalog import catalog_changes
+from .events import broker
+from .exports import EXPORT_FORMATS, async_blocks, export_queryset, parse_export_bound, stream_export
+from .forecast import stockout_projection
+from .group_commit import get_group_commit_writer
+from .models import Ingredient, Order, Product, StockReservation
+from .reservations import release_reservation
+from .serializers import OrderSerializer, StockReservationSerializer
 from utils.endpointhandling.custom_django_permissions import CustomDjangoModelPermissions
 # endregion
 
@@ -11,4 +35,182 @@ class OrderViewSet(CustomResponseViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [CustomDjangoModelPermissions]
+
+    def perform_create(self, serializer):
+        """
+        Order writes go through the `order_writes` admission controller so bursts queue briefly or get
+        a fast 429 instead of all contending for the database write lock. With ORDER_GROUP_COMMIT enabled
+        they are handed to the process's group-commit writer instead, which already writes one batch at a
+        time and bounds how many orders may wait.
+        """
+        group_commit = get_group_commit_writer()
+        if group_commit is not None:
+            serializer.instance = group_commit.submit(serializer.validated_data['products'], self.request.user,
+                                                      self.request.user.branch_id)
+            return
+        with get_admission_controller('order_writes').admit():
+            super().perform_create(serializer)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Orders never change once created, so the rendered detail response is cached per order id for
+        ORDER_DETAIL_CACHE_TIMEOUT and served with a strong ETag (304 when the client already has it).
+        Permission checks run in initial() before the cache is consulted.
+        """
+        try:
+            order_id = int(kwargs[self.lookup_field])  # "01" and "1" share one cache entry
+        except ValueError:
+            raise BaseCustomException("Order not found.", 404, key="order_not_found")
+        cache_key = Order.detail_cache_key(order_id)
+        cached = cache.get(cache_key)
+        if cached is None:
+            data = self.get_serializer(self.get_object()).data
+            body = JSONRenderer().render(success_response(data).data)
+            cached = (f'"{hashlib.sha256(body).hexdigest()}"', body)
+            cache.set(cache_key, cached, timeout=settings.ORDER_DETAIL_CACHE_TIMEOUT)
+
+        etag, body = cached
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = PrerenderedResponse(status=304)
+        else:
+            response = PrerenderedResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Streams orders with their line items as CSV (`?output=csv`, one row per line item) or NDJSON
+        (`?output=ndjson`, one order per line), filtered by `?start=` / `?end=` (ISO dates or datetimes;
+        a date as end includes that day). Rows are read in chunks, so memory stays flat for any range,
+        under WSGI and ASGI alike.
+        """
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise BaseCustomException(f"Unsupported output '{export_format}', use one of: "
+                                      f"{', '.join(EXPORT_FORMATS)}.", 400, key="invalid_export_format")
+        start = parse_export_bound(request.query_params.get('start'), 'start')
+        end = parse_export_bound(request.query_params.get('end'), 'end', end=True)
+
+        # The body is produced after the view returns, so pick the (replica) alias while the request runs
+        queryset = export_queryset(start, end, using=router.db_for_read(Order))
+        blocks = stream_export(export_format, queryset)
+        if isinstance(request._request, ASGIRequest):
+            blocks = async_blocks(blocks)  # Sent block by block instead of being collected first
+        response = StreamingHttpResponse(blocks, content_type=EXPORT_FORMATS[export_format])
+        last_included = end - datetime.timedelta(microseconds=1) if end else None
+        filename = '-'.join(['orders', *(bound.date().isoformat() for bound in (start, last_included) if bound)])
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class StockReservationViewSet(CustomResponseViewSet):
+    """
+    Time-limited stock holds for open carts: POST holds the cart's ingredients, `confirm/` turns the hold
+    into an order without re-checking stock, `release/` gives it back (expiry does the same).
+    """
+    serializer_class = StockReservationSerializer
+    permission_classes = [CustomDjangoModelPermissions]
+
+    def get_queryset(self):
+        return StockReservation.objects.filter(user_id_create=self.request.user).prefetch_related('products')
+
+    def perform_create(self, serializer):
+        with get_admission_controller('order_writes').admit():
+            super().perform_create(serializer)
+
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        reservation = self.get_object()
+        with get_admission_controller('order_writes').admit():
+            order = OrderSerializer().create({
+                'reservation': reservation, 'user_id_create': request.user, 'user_id_update': request.user,
+            })
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def release(self, request, pk=None):
+        reservation = self.get_object()
+        if not release_reservation(reservation):
+            raise BaseCustomException("The reservation is no longer active.", status.HTTP_409_CONFLICT,
+                                      key='reservation_inactive')
+        reservation.refresh_from_db()
+        return Response(self.get_serializer(reservation).data)
+# endregion
+
+
+# region POS Catalog Sync
+class CatalogChangesView(APIView):
+    """
+    Delta feed of the POS catalog: `GET ?since=<cursor>` returns ingredients, products and recipe lines
+    changed after the cursor plus ids deleted since then, and the cursor for the next call.
+    Omit `since` for the initial full download; keep calling while `has_more` is true.
+    """
+    queryset = Product.objects.all()  # Permission model: view_product
+    permission_classes = [CustomDjangoModelPermissions]
+    schema = None  # Untyped payload; the format is documented in the README
+
+    def get(self, request):
+        return success_response(catalog_changes(request.query_params.get('since')))
+
+
+class StockoutProjectionView(APIView):
+    """
+    Projected hours until each ingredient of the user's stock partition runs out at its recent burn rate,
+    soonest first. Served from a cache refreshed incrementally every STOCKOUT_FORECAST['REFRESH_SECONDS'].
+    """
+    queryset = Ingredient.objects.all()  # Permission model: view_ingredient
+    permission_classes = [CustomDjangoModelPermissions]
+    schema = None  # Untyped payload; the format is documented in the README
+
+    def get(self, request):
+        return success_response(stockout_projection(request.user.branch_id))
+# endregion
+
+
+# region Server-Sent Events
+def authenticate_event_subscriber(request):
+    """
+    Authenticates the stream once per connection. Browsers' EventSource cannot send headers,
+    so the access token is also accepted as the `token` query parameter.
+    """
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header else request.GET.get('token')
+    if raw_token is None:
+        return None
+    try:
+        user = authenticator.get_user(authenticator.get_validated_token(raw_token))
+    except AuthenticationFailed:
+        return None
+    return user if user.has_perm('inventory.view_order') else None
+
+
+async def order_events(request):
+    """
+    Streams new orders and low-stock transitions as server-sent events (serve under ASGI).
+    A reconnecting client sends Last-Event-ID and only receives the events it missed.
+    """
+    user = await sync_to_async(authenticate_event_subscriber)(request)
+    if user is None:
+        # Same envelope as error_response, rendered without DRF since this is a plain async view
+        return JsonResponse({
+            "success": False,
+            "message": "Authentication credentials were not provided or lack permission.",
+            "data": None,
+            "key": "forbidden",
+            "errors": None,
+        }, status=403)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    response = StreamingHttpResponse(
+        broker.stream(int(last_event_id) if last_event_id and last_event_id.isdigit() else None,
+                      branch_id=user.branch_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
 # endregion
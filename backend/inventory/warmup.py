@@ -0,0 +1,14 @@
+# region Imports
+from .models import Product
+from .serializers import OrderSerializer
+# endregion
+
+
+def preload_catalog():
+    """
+    Runs the order pipeline's catalog queries once for every product, so the recipe matrix (or the
+    recipe cache) is built in the master before fork and, on SQLite, the catalog pages sit in the OS
+    page cache every worker reads from.
+    """
+    products_data = [{'product': product, 'quantity': 1} for product in Product.objects.only('id')]
+    OrderSerializer.check_inventory(OrderSerializer.calculate_consumption(products_data))
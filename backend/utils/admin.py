@@ -1,3 +1,9 @@
 from django.contrib import admin
+from utils.baseclasses.base_admin import LargeTableModelAdmin
+from utils.models import Branch
 
-# Register your models here.
+
+@admin.register(Branch)
+class BranchAdmin(LargeTableModelAdmin):
+    list_display = ('id', 'name', 'created_at')
+    search_fields = ('name',)
@@ -0,0 +1,164 @@
+# region Imports
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from utils.endpointhandling.exceptions import BaseCustomException
+# endregion
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceOverloaded(BaseCustomException):
+    """
+    Raised when a request cannot be admitted; rendered as 429 with a Retry-After header.
+
+    Attributes:
+        wait (int): Seconds the client should wait before retrying (read by DRF's exception handler).
+    """
+
+    def __init__(self, message, wait, key="overloaded"):
+        super().__init__(message, 429, key=key, errors={"retry_after": wait})
+        self.wait = wait
+
+
+class AdmissionController:
+    """
+    Bounds how many requests run a section concurrently and how many may queue for it.
+
+    Requests beyond `limit` wait in a FIFO queue of at most `queue_depth` entries for up to
+    `queue_timeout` seconds; anything over the queue depth or past the timeout is rejected right
+    away with ServiceOverloaded instead of piling up on a lock further down. Limits are per process,
+    so with several gunicorn workers the effective limit is `limit * workers`.
+    """
+
+    def __init__(self, name, limit, queue_depth, queue_timeout):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_depth = max(0, queue_depth)
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._queue = []  # Tickets of waiting requests, oldest first
+        self._active = 0
+        self._service_time = 0.0  # Moving average of seconds spent inside the section
+        self._stats = self._empty_stats()
+
+    # region Metrics
+    @staticmethod
+    def _empty_stats():
+        return {'admitted': 0, 'rejected': 0, 'timed_out': 0, 'peak_queue_depth': 0,
+                'total_wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    def snapshot(self):
+        """
+        Returns the current load and the counters since start (or the last reset).
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats.update({
+                'name': self.name,
+                'limit': self.limit,
+                'queue_limit': self.queue_depth,
+                'active': self._active,
+                'queue_depth': len(self._queue),
+                'avg_service_seconds': round(self._service_time, 6),
+                'avg_wait_seconds': round(stats['total_wait_seconds'] / stats['admitted'], 6)
+                if stats['admitted'] else 0.0,
+            })
+        return stats
+
+    def reset_stats(self):
+        with self._condition:
+            self._stats = self._empty_stats()
+
+    # endregion
+
+    # region Admission
+    def retry_after(self):
+        """
+        Seconds until the current queue should have drained, at least 1.
+        """
+        backlog = self._active + len(self._queue)
+        return max(1, math.ceil(self._service_time * backlog / self.limit))
+
+    def _reject(self, reason):
+        wait = self.retry_after()
+        self._stats['rejected'] += 1
+        if reason == 'timeout':
+            self._stats['timed_out'] += 1
+        logger.warning("%s admission rejected (%s): %s active, %s queued", self.name, reason,
+                       self._active, len(self._queue))
+        return ServiceOverloaded(f"Too many concurrent {self.name} requests, retry in {wait}s.", wait)
+
+    @contextmanager
+    def admit(self):
+        """
+        Context manager holding one of the `limit` slots for its body; raises ServiceOverloaded
+        when the queue is full or the wait exceeds `queue_timeout`.
+        """
+        started = time.monotonic()
+        with self._condition:
+            if self._active >= self.limit or self._queue:
+                if len(self._queue) >= self.queue_depth:
+                    raise self._reject('queue_full')
+
+                ticket = object()
+                self._queue.append(ticket)
+                self._stats['peak_queue_depth'] = max(self._stats['peak_queue_depth'], len(self._queue))
+                deadline = started + self.queue_timeout
+                try:
+                    while self._active >= self.limit or self._queue[0] is not ticket:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._condition.wait(remaining):
+                            if self._active >= self.limit or self._queue[0] is not ticket:
+                                raise self._reject('timeout')
+                finally:
+                    self._queue.remove(ticket)
+                    self._condition.notify_all()  # The next ticket may now be at the head
+
+            self._active += 1
+            waited = time.monotonic() - started
+            self._stats['admitted'] += 1
+            self._stats['total_wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+
+        entered = time.monotonic()
+        try:
+            yield waited
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - entered)
+                self._condition.notify_all()
+
+    # endregion
+
+
+# Process-wide controllers by name, built lazily from settings.ADMISSION_CONTROL
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_admission_controller(name):
+    """
+    Returns the shared controller configured under settings.ADMISSION_CONTROL[name].
+    """
+    controller = _controllers.get(name)
+    if controller is None:
+        from django.conf import settings
+        with _controllers_lock:
+            controller = _controllers.get(name)
+            if controller is None:
+                config = settings.ADMISSION_CONTROL[name]
+                controller = AdmissionController(name, config['LIMIT'], config['QUEUE_DEPTH'],
+                                                 config['QUEUE_TIMEOUT'])
+                _controllers[name] = controller
+    return controller
+
+
+def admission_snapshots():
+    """
+    Metrics of every controller created in this process.
+    """
+    return {name: controller.snapshot() for name, controller in list(_controllers.items())}
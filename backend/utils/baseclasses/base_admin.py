@@ -0,0 +1,62 @@
+# region Imports
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+# endregion
+
+
+# region Row Estimates
+def estimate_table_rows(model, using='default'):
+    """
+    Returns the planner's row estimate for the model's table without scanning it, or None
+    when the backend offers no estimate.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute("SELECT table_rows FROM information_schema.tables "
+                           "WHERE table_schema = DATABASE() AND table_name = %s", [model._meta.db_table])
+        elif connection.vendor == 'sqlite':
+            # Read from the rowid b-tree edge, an upper bound that ignores deleted rows
+            cursor.execute(f"SELECT MAX(rowid) FROM {table}")
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs a full COUNT(*): unfiltered changelists use the table estimate and
+    filtered ones count at most `exact_count_limit` + 1 rows.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_table_rows(queryset.model, using=queryset.db)
+            if estimate is not None and estimate > self.exact_count_limit:
+                return estimate
+        return queryset.order_by()[:self.exact_count_limit + 1].count()
+# endregion
+
+
+# region Base Admin Classes
+class LargeTableModelAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin for tables with millions of rows: estimated counts, raw-id audit user fields,
+    primary-key ordering and no full result count.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ('-id',)
+    raw_id_fields = ('user_id_create', 'user_id_update')
+    readonly_fields = ('created_at', 'updated_at')
+# endregion
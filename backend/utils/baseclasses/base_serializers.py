@@ -0,0 +1,76 @@
+# region Imports
+from django.core.exceptions import ValidationError as DjangoValidationError
+from utils.importinglibs.data_manipulation_libs import serializers
+# endregion
+
+
+# region Base Classes ==============================================================================
+class BatchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    A primary key relation that, inside a BatchedRelationListSerializer, takes its object from the ones the
+    list resolved in a single query instead of running one lookup per item. Used standalone it behaves
+    like PrimaryKeyRelatedField.
+    """
+
+    def resolved_objects(self):
+        list_serializer = getattr(self.parent, 'parent', None)
+        return getattr(list_serializer, 'resolved_relations', {}).get(self.field_name)
+
+    def to_internal_value(self, data):
+        resolved = self.resolved_objects()
+        if resolved is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in resolved:
+            self.fail('does_not_exist', pk_value=data)
+        return resolved[pk]
+
+
+class BatchedRelationListSerializer(serializers.ListSerializer):
+    """
+    `many=True` list that resolves every BatchedPrimaryKeyRelatedField of its items up front: the ids of
+    all items are collected and fetched with one `id__in` query per field, and unknown ids are reported
+    together. The child serializer opts in with `Meta.list_serializer_class` and
+    `serializer_related_field = BatchedPrimaryKeyRelatedField`.
+    """
+
+    def to_internal_value(self, data):
+        self.resolved_relations = {}
+        if isinstance(data, list):
+            errors = {}
+            for field in self.child.fields.values():
+                if isinstance(field, BatchedPrimaryKeyRelatedField) and not field.read_only:
+                    missing = self.resolve(field, data)
+                    if missing:
+                        errors[field.field_name] = [
+                            f"Invalid pks {', '.join(map(str, missing))} - objects do not exist."]
+            if errors:
+                raise serializers.ValidationError(errors)
+        return super().to_internal_value(data)
+
+    def resolve(self, field, data):
+        """
+        Fetches the objects of one relation for every item; returns the unknown ids in payload order.
+        Malformed ids are left for the field to report per item.
+        """
+        queryset = field.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = []
+        for item in data:
+            value = item.get(field.field_name) if isinstance(item, dict) else None
+            if value is None or isinstance(value, bool):
+                continue
+            try:
+                pks.append(pk_field.to_python(value))
+            except DjangoValidationError:
+                continue
+
+        resolved = self.resolved_relations[field.field_name] = queryset.in_bulk(set(pks)) if pks else {}
+        return list(dict.fromkeys(pk for pk in pks if pk not in resolved))
+
+# endregion
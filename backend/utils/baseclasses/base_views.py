@@ -5,12 +5,16 @@ from utils.endpointhandling.responses import (
     error_response,
     update_successful_response,
     deletion_successful_response,
+    PrerenderedResponse,
 )
 from utils.importinglibs.views import Response
 from rest_framework import mixins
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
 from django.db import IntegrityError
+from django.http import StreamingHttpResponse
+from utils.db_routers import start_replica_reads, end_replica_reads, is_pinned_to_primary, pin_client_to_primary
 
 
 # endregion
@@ -36,11 +40,29 @@ class CustomResponseViewSet(GenericViewSet, mixins.CreateModelMixin,
         except IntegrityError as e:
             raise APIException(f"Duplicate entry error: {str(e)}")
 
+    def initial(self, request, *args, **kwargs):
+        """
+        After authentication and permission checks, lets safe requests read from a replica unless the
+        client wrote recently (read-your-writes).
+        """
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned_to_primary(request.user.pk):
+            self._replica_reads_token = start_replica_reads()
+
     def finalize_response(self, request, response, *args, **kwargs):
         """
         Overrides the finalize_response to return custom responses based on HTTP method.
         """
-        if response.status_code < 299:
+        replica_reads_token = getattr(self, '_replica_reads_token', None)
+        if replica_reads_token is not None:
+            end_replica_reads(replica_reads_token)
+            self._replica_reads_token = None
+        elif request.method not in SAFE_METHODS and response.status_code < 299:
+            pin_client_to_primary(request.user.pk)
+
+        if isinstance(response, (PrerenderedResponse, StreamingHttpResponse)):
+            return super().finalize_response(request, response, *args, **kwargs)
+        elif response.status_code < 299:
             if request.method == "GET":
                 return super().finalize_response(request, success_response(response.data), *args, **kwargs)
             elif request.method == "POST":
@@ -50,7 +72,10 @@ class CustomResponseViewSet(GenericViewSet, mixins.CreateModelMixin,
             else:
                 return super().finalize_response(request, deletion_successful_response(), *args, **kwargs)
         else:
-            return super().finalize_response(request, error_response(response.data, status_code=response.status_code), *args, **kwargs)
+            wrapped = error_response(response.data, status_code=response.status_code)
+            if response.has_header('Retry-After'):
+                wrapped['Retry-After'] = response['Retry-After']
+            return super().finalize_response(request, wrapped, *args, **kwargs)
 
 
 # endregion
@@ -0,0 +1,440 @@
+# region Imports
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+# endregion
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+# region Local Tier
+class LocalLRU:
+    """
+    Bounded, thread-safe in-process LRU with a per-entry expiry.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# endregion
+
+
+# region Invalidation Broadcast
+class InvalidationBus:
+    """
+    Tells every worker to drop local entries after a write. With django-redis as the shared tier this is
+    Redis pub/sub, with a listener thread per process started lazily: every read and publish checks that
+    the current process has one, so workers forked after a cache was built in the master start their own.
+    Other backends are process-local anyway, so invalidations only apply to the current process.
+    """
+
+    def __init__(self, alias, channel):
+        self.alias = alias
+        self.channel = channel
+        self._handlers = {}  # namespace -> callable(key or None)
+        self._listener_pid = None
+        self._lock = threading.Lock()
+
+    def redis(self):
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection(self.alias)
+        except (ImportError, NotImplementedError):
+            return None
+
+    def subscribe(self, namespace, handler):
+        self._handlers[namespace] = handler
+        self.ensure_listener()
+
+    def publish(self, namespace, key=None):
+        self.ensure_listener()
+        self._dispatch(namespace, key)  # Apply locally right away, the listener skips our own messages
+        connection = self.redis()
+        if connection is not None:
+            connection.publish(self.channel, f'{os.getpid()}\0{namespace}\0{key or ""}')
+
+    def _dispatch(self, namespace, key):
+        handler = self._handlers.get(namespace)
+        if handler is not None:
+            handler(key or None)
+
+    def ensure_listener(self):
+        """
+        Starts this process's listener thread unless it runs already; a pid comparison otherwise.
+        """
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            connection = self.redis()
+            if connection is None:
+                self._listener_pid = os.getpid()
+                return
+            pubsub = connection.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(self.channel)
+            threading.Thread(target=self._listen, args=(pubsub,), name='cache-invalidation', daemon=True).start()
+            self._listener_pid = os.getpid()
+
+    def _listen(self, pubsub):
+        pid = str(os.getpid())
+        for message in pubsub.listen():
+            try:
+                sender, namespace, key = message['data'].decode().split('\0', 2)
+                if sender != pid:
+                    self._dispatch(namespace, key)
+            except Exception:
+                logger.exception("Malformed cache invalidation message: %r", message)
+
+
+# endregion
+
+
+class TwoTierCache:
+    """
+    A namespace of cached values held in a bounded in-process LRU in front of the shared cache
+    (settings.TWO_TIER_CACHE['SHARED_ALIAS'], Redis in production).
+
+    - Keys are versioned per namespace: invalidate() bumps the version, so every old entry in the
+      shared tier becomes unreachable at once and simply ages out.
+    - get_or_set() is single-flight: one caller per process and one process across the fleet (an
+      `add` lock in the shared tier) runs the producer for a missing key; the others wait for its result.
+    - Writes broadcast an invalidation so other workers drop their local copies.
+    - Loaded values are only kept if no delete() or invalidate() ran while they were loaded: both bump a
+      shared write generation, which the loader compares with the one it read before loading.
+    - A process-local shared tier (LocMemCache without REDIS_URL) never hears other workers' writes, so its
+      entries live at most `local_ttl` seconds too, which bounds their staleness.
+    """
+
+    def __init__(self, namespace, local_max_entries, local_ttl, shared_timeout, shared_alias, bus,
+                 lock_timeout=10):
+        self.namespace = namespace
+        self.local = LocalLRU(local_max_entries, local_ttl)
+        self.shared_timeout = shared_timeout
+        self.shared_alias = shared_alias
+        self.lock_timeout = lock_timeout
+        self.bus = bus
+        self._flights = {}  # key -> threading.Event of the in-process load
+        self._flights_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = self._empty_stats()
+        bus.subscribe(namespace, self._on_invalidation)
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    @property
+    def shared_is_process_local(self):
+        from django.core.cache.backends.dummy import DummyCache  # Only loaded once a cache is used
+        from django.core.cache.backends.locmem import LocMemCache
+        return isinstance(self.shared, (LocMemCache, DummyCache))
+
+    def _shared_timeout(self, timeout):
+        timeout = self.shared_timeout if timeout is None else timeout
+        if self.shared_is_process_local:
+            return self.local.ttl if timeout is None else min(timeout, self.local.ttl)
+        return timeout
+
+    # region Keys
+    def _version_key(self):
+        return f'tt:{self.namespace}:version'
+
+    def version(self):
+        """
+        Current namespace version; cached locally and refreshed on invalidation broadcasts.
+        """
+        version = self.local.get(self._version_key())
+        if version is _MISSING:
+            version = self.shared.get(self._version_key())
+            if version is None:
+                self.shared.add(self._version_key(), 1, None)
+                version = self.shared.get(self._version_key(), 1)
+            self.local.set(self._version_key(), version)
+        return version
+
+    def make_key(self, key):
+        return f'tt:{self.namespace}:v{self.version()}:{key}'
+
+    def _generation_key(self):
+        return f'tt:{self.namespace}:generation'
+
+    def generation(self):
+        """
+        Shared write generation, bumped by every delete() and invalidate(). Read it before loading values from
+        the source of truth and pass it to fill(), so values loaded before a concurrent write are not kept.
+        """
+        return self.shared.get(self._generation_key(), 0)
+
+    def _bump_generation(self):
+        try:
+            self.shared.incr(self._generation_key())
+        except ValueError:
+            self.shared.add(self._generation_key(), 1, None)
+
+    # endregion
+
+    # region Statistics
+    @staticmethod
+    def _empty_stats():
+        return {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'loads': 0, 'load_seconds': 0.0,
+                'single_flight_waits': 0, 'invalidations': 0}
+
+    def _count(self, stat, amount=1):
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats.update({
+            'namespace': self.namespace,
+            'local_entries': len(self.local),
+            'hit_ratio': round((stats['local_hits'] + stats['shared_hits']) / lookups, 4) if lookups else 0.0,
+        })
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = self._empty_stats()
+
+    # endregion
+
+    # region Reads
+    def get(self, key, default=None):
+        self.bus.ensure_listener()
+        full_key = self.make_key(key)
+        value = self.local.get(full_key)
+        if value is not _MISSING:
+            self._count('local_hits')
+            return value
+        value = self.shared.get(full_key, _MISSING)
+        if value is not _MISSING:
+            self._count('shared_hits')
+            self.local.set(full_key, value)
+            return value
+        self._count('misses')
+        return default
+
+    def get_many(self, keys):
+        """
+        Returns {key: value} for the keys found in either tier, with one shared-tier round trip.
+        """
+        self.bus.ensure_listener()
+        found, remote = {}, {}
+        for key in keys:
+            full_key = self.make_key(key)
+            value = self.local.get(full_key)
+            if value is _MISSING:
+                remote[full_key] = key
+            else:
+                found[key] = value
+        self._count('local_hits', len(found))
+        if remote:
+            for full_key, value in self.shared.get_many(list(remote)).items():
+                self.local.set(full_key, value)
+                found[remote[full_key]] = value
+            self._count('shared_hits', len(found) - (len(keys) - len(remote)))
+            self._count('misses', len(keys) - len(found))
+        return found
+
+    def get_or_set(self, key, producer, timeout=None):
+        """
+        Returns the cached value, calling `producer()` at most once across concurrent callers on a miss.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = threading.Event()
+        if not leader:
+            self._count('single_flight_waits')
+            flight.wait(self.lock_timeout)
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            return self._load(key, producer, timeout)
+
+        try:
+            return self._load_across_processes(key, producer, timeout)
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.set()
+
+    def _load_across_processes(self, key, producer, timeout):
+        lock_key = f'{self.make_key(key)}:lock'
+        if self.shared.add(lock_key, os.getpid(), self.lock_timeout):
+            try:
+                return self._load(key, producer, timeout)
+            finally:
+                self.shared.delete(lock_key)
+
+        # Another worker is loading the key: poll the shared tier until it lands or the lock lapses
+        self._count('single_flight_waits')
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            value = self.shared.get(self.make_key(key), _MISSING)
+            if value is not _MISSING:
+                self.local.set(self.make_key(key), value)
+                return value
+            if self.shared.get(lock_key) is None:
+                break
+        return self._load(key, producer, timeout)
+
+    def _load(self, key, producer, timeout):
+        generation = self.generation()
+        started = time.perf_counter()
+        value = producer()
+        self._count('loads')
+        self._count('load_seconds', time.perf_counter() - started)
+        self.fill({key: value}, generation, timeout)
+        return value
+
+    # endregion
+
+    # region Writes and Invalidation
+    def set(self, key, value, timeout=None, broadcast=True):
+        full_key = self.make_key(key)
+        self.shared.set(full_key, value, self._shared_timeout(timeout))
+        if broadcast:
+            self.bus.publish(self.namespace, key)  # Drops stale local copies, including this worker's
+        self.local.set(full_key, value)
+
+    def fill(self, values, generation, timeout=None):
+        """
+        Caches {key: value} loaded from the source of truth after generation() returned `generation`, without
+        broadcasting. If a delete() or invalidate() ran meanwhile, the values may predate it: they are dropped
+        again. The generation is re-read after writing, so a write racing the check is caught as well.
+        """
+        if not values:
+            return
+        full_keys = {self.make_key(key): value for key, value in values.items()}
+        self.shared.set_many(full_keys, self._shared_timeout(timeout))
+        for full_key, value in full_keys.items():
+            self.local.set(full_key, value)
+        if self.generation() != generation:
+            self.shared.delete_many(list(full_keys))
+            for full_key in full_keys:
+                self.local.delete(full_key)
+
+    def delete(self, *keys):
+        """
+        Drops keys from both tiers in every worker.
+        """
+        self._bump_generation()  # Before deleting, so a load that read the old value drops what it writes
+        full_keys = [self.make_key(key) for key in keys]
+        self.shared.delete_many(full_keys)
+        for key in keys:
+            self.bus.publish(self.namespace, str(key))
+
+    def invalidate(self):
+        """
+        Drops the whole namespace everywhere by moving to a new version.
+        """
+        self._bump_generation()
+        try:
+            self.shared.incr(self._version_key())
+        except ValueError:
+            self.shared.add(self._version_key(), 2, None)
+        self.bus.publish(self.namespace)
+
+    def _on_invalidation(self, key):
+        self._count('invalidations')
+        if key is None:
+            self.local.delete(self._version_key())
+            self.local.delete_prefix(f'tt:{self.namespace}:')
+        else:
+            self.local.delete(self.make_key(key))
+
+    # endregion
+
+
+# Process-wide caches by namespace, configured from settings.TWO_TIER_CACHE
+_caches = {}
+_caches_lock = threading.Lock()
+_bus = None
+
+
+def get_invalidation_bus():
+    """
+    Returns this process's InvalidationBus; other per-node state (e.g. the recipe matrix) subscribes to it too.
+    """
+    global _bus
+    if _bus is None:
+        config = settings.TWO_TIER_CACHE
+        with _caches_lock:
+            if _bus is None:
+                _bus = InvalidationBus(config['SHARED_ALIAS'], config['INVALIDATION_CHANNEL'])
+    return _bus
+
+
+def get_two_tier_cache(namespace):
+    """
+    Returns the shared TwoTierCache of a namespace (e.g. "recipes", "permissions").
+    """
+    two_tier_cache = _caches.get(namespace)
+    if two_tier_cache is None:
+        config = settings.TWO_TIER_CACHE
+        bus = get_invalidation_bus()
+        with _caches_lock:
+            two_tier_cache = _caches.get(namespace)
+            if two_tier_cache is None:
+                two_tier_cache = TwoTierCache(
+                    namespace, config['LOCAL_MAX_ENTRIES'], config['LOCAL_TTL'], config['SHARED_TIMEOUT'],
+                    config['SHARED_ALIAS'], bus)
+                _caches[namespace] = two_tier_cache
+    return two_tier_cache
+
+
+def cache_snapshots():
+    """
+    Hit/miss statistics of every two-tier cache used in this process.
+    """
+    return {namespace: two_tier_cache.snapshot() for namespace, two_tier_cache in list(_caches.items())}
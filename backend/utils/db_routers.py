@@ -0,0 +1,68 @@
+# region Imports
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+# endregion
+
+# Set only while a safe CustomResponseViewSet request runs for a client that is not pinned
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+# region Read-Your-Writes Stickiness
+def pin_client_to_primary(client_key):
+    """
+    Routes the client's reads to the primary for REPLICA_PIN_SECONDS after it writes, so it never
+    reads a replica that has not caught up with its own write yet.
+    """
+    cache.set(f'db-pin:{client_key}', True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(client_key):
+    return cache.get(f'db-pin:{client_key}', False)
+
+
+def start_replica_reads():
+    """
+    Lets the following reads go to a replica (when replicas are configured); returns the token
+    to pass to end_replica_reads.
+    """
+    return _replica_reads.set(True)
+
+
+def end_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    token = start_replica_reads()
+    try:
+        yield
+    finally:
+        end_replica_reads(token)
+# endregion
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes, and any read outside a `replica_reads` block, to the primary ('default');
+    reads inside the block go to a random alias from DATABASE_REPLICAS.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication
+        return db == 'default'
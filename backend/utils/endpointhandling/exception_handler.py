@@ -28,7 +28,9 @@ def custom_exception_handler(exc, context):
                 "key": exc.key,  # Custom key identifying the error type
                 "message": str(exc)  # String representation of the exception
             },
-            status=exc.status_code  # Status code from the exception
+            status=exc.status_code,  # Status code from the exception
+            # Keep Retry-After set by DRF for exceptions carrying a `wait` (throttling / overload)
+            headers={'Retry-After': response['Retry-After']} if response.has_header('Retry-After') else None,
         )
     # Handle generic Python exceptions in non-debug mode
     elif not os.getenv("DEBUG") and isinstance(exc, Exception) and not isinstance(exc, APIException):
@@ -2,9 +2,17 @@
 from rest_framework.response import Response  # DRF class for constructing HTTP responses
 from rest_framework import status  # Provides standard HTTP status codes
 from django.http import FileResponse  # Django class for serving files over HTTP
+from django.http import HttpResponse
 # endregion
 
 
+class PrerenderedResponse(HttpResponse):
+    """
+    An already-rendered response body (e.g. served from cache) that must be sent as-is,
+    without being wrapped in the standard response structure again.
+    """
+
+
 def standard_response(success, message, data=None, status_code=status.HTTP_200_OK, key="", errors=None):
     """
     Creates a standard HTTP response with a custom structure.
@@ -0,0 +1,31 @@
+# region Imports
+import importlib
+# endregion
+
+
+def lazy_getattr(module_name, lazy_imports):
+    """
+    Builds a module-level ``__getattr__`` (PEP 562) that imports re-exported names on first access.
+
+    Parameters:
+    - module_name (str): Name of the re-exporting module, used in the AttributeError message.
+    - lazy_imports (dict): Maps exported name -> (source module, attribute); attribute None exports the module itself.
+
+    Returns:
+    - function: The ``__getattr__`` hook to assign in the re-exporting module.
+    """
+    def __getattr__(name):
+        try:
+            source_module, attribute = lazy_imports[name]
+        except KeyError:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}") from None
+
+        value = importlib.import_module(source_module)
+        if attribute is not None:
+            value = getattr(value, attribute)
+
+        # Cache on the module so the hook runs once per name
+        setattr(importlib.import_module(module_name), name, value)
+        return value
+
+    return __getattr__
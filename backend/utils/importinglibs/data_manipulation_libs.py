@@ -1,9 +1,17 @@
-# Django ORM utilities and query operations
-from django.db import transaction
-from django.conf import settings  # Access project settings
-
 # Standard libraries
 import os  # Interact with the operating system (file system operations)
 
-# Django REST Framework utilities
-from rest_framework import serializers  # Create serializers for data validation and transformation
+from utils.importinglibs import lazy_getattr
+
+# Heavy re-exports are resolved on first access so importing models does not load DRF at worker boot
+_LAZY_IMPORTS = {
+    # Django ORM utilities and query operations
+    'transaction': ('django.db.transaction', None),
+    'settings': ('django.conf', 'settings'),  # Access project settings
+
+    # Django REST Framework utilities
+    'serializers': ('rest_framework.serializers', None),  # Create serializers for data validation and transformation
+}
+
+__all__ = ['os', *_LAZY_IMPORTS]
+__getattr__ = lazy_getattr(__name__, _LAZY_IMPORTS)
@@ -1,17 +1,24 @@
 # region Standard Library Imports
 import os  # For interacting with the operating system
 
-from rest_framework.response import Response  # For creating API responses
-from rest_framework import status  # For HTTP status codes
-from rest_framework import viewsets, permissions
-from rest_framework.views import exception_handler
-from rest_framework.exceptions import APIException
+from utils.importinglibs import lazy_getattr
+# endregion
+
+# region Lazy Re-exports
+# Resolved on first access so unused DRF / Simple JWT modules never load at worker boot
+_LAZY_IMPORTS = {
+    'Response': ('rest_framework.response', 'Response'),  # For creating API responses
+    'status': ('rest_framework.status', None),  # For HTTP status codes
+    'exception_handler': ('rest_framework.views', 'exception_handler'),
+    'APIException': ('rest_framework.exceptions', 'APIException'),
+    'APIView': ('rest_framework.views', 'APIView'),
+    'IsAdminUser': ('rest_framework.permissions', 'IsAdminUser'),
+
+    # Django REST Framework Simple JWT Imports
+    'TokenObtainPairView': ('rest_framework_simplejwt.views', 'TokenObtainPairView'),
+    'TokenRefreshView': ('rest_framework_simplejwt.views', 'TokenRefreshView'),
+}
 
-# Django REST Framework Simple JWT Imports
-from rest_framework_simplejwt.tokens import RefreshToken  # For handling JWT tokens
-from rest_framework_simplejwt.authentication import JWTAuthentication  # For JWT authentication
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+__all__ = ['os', *_LAZY_IMPORTS]
+__getattr__ = lazy_getattr(__name__, _LAZY_IMPORTS)
 # endregion
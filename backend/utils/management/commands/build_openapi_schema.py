@@ -0,0 +1,87 @@
+# region Imports
+import json
+import os
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+# endregion
+
+SWAGGER_HTML = """<!DOCTYPE html>
+<html>
+<head>
+  <title>{title}</title>
+  <meta charset="utf-8">
+  <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/swagger-ui-dist@5/swagger-ui.css">
+</head>
+<body>
+  <div id="swagger-ui"></div>
+  <script src="https://cdn.jsdelivr.net/npm/swagger-ui-dist@5/swagger-ui-bundle.js"></script>
+  <script>SwaggerUIBundle({{url: "{schema_url}", dom_id: "#swagger-ui", persistAuthorization: true}});</script>
+</body>
+</html>
+"""
+
+REDOC_HTML = """<!DOCTYPE html>
+<html>
+<head>
+  <title>{title}</title>
+  <meta charset="utf-8">
+</head>
+<body>
+  <redoc spec-url="{schema_url}"></redoc>
+  <script src="https://cdn.jsdelivr.net/npm/redoc@2.1.5/bundles/redoc.standalone.js"></script>
+</body>
+</html>
+"""
+
+
+def write_atomically(path, content):
+    """
+    Writes to a temporary file beside `path` and renames it into place, so a worker serving the artifact
+    reads either the old file or the new one, never a partial write.
+    """
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f'.{path.name}.', delete=False) as temporary:
+        try:
+            temporary.write(content)
+            temporary.flush()
+            os.fsync(temporary.fileno())
+            os.chmod(temporary.name, 0o644)  # Temporary files are private; artifacts are world-readable
+        except BaseException:
+            os.unlink(temporary.name)
+            raise
+    os.replace(temporary.name, path)
+
+
+class Command(BaseCommand):
+    help = ('Generate the OpenAPI schema once and write it, with the Swagger / ReDoc pages, as versioned '
+            'static artifacts served by /schema/, /swagger/ and /redoc/')
+
+    def handle(self, *args, **kwargs):
+        try:
+            from drf_spectacular.generators import SchemaGenerator
+            from drf_spectacular.renderers import OpenApiYamlRenderer
+        except ImportError:
+            raise CommandError("drf_spectacular is required to build the schema; run with APP_PROFILE=development")
+
+        # Generate the schema once (the same introspection SpectacularAPIView runs on every request)
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        version = settings.SPECTACULAR_SETTINGS['VERSION']
+        title = settings.SPECTACULAR_SETTINGS['TITLE']
+
+        # Versioned artifacts, plus the unversioned copies the routes serve
+        output_dir = settings.OPENAPI_SCHEMA_DIR
+        output_dir.mkdir(parents=True, exist_ok=True)
+        yaml_content = OpenApiYamlRenderer().render(schema, renderer_context={})
+        json_content = json.dumps(schema, indent=2, default=str).encode()
+        artifacts = {
+            f'schema-{version}.yaml': yaml_content,
+            f'schema-{version}.json': json_content,
+            'schema.yaml': yaml_content,
+            'schema.json': json_content,
+            'swagger.html': SWAGGER_HTML.format(title=title, schema_url='/schema/').encode(),
+            'redoc.html': REDOC_HTML.format(title=title, schema_url='/schema/').encode(),
+        }
+        for filename, content in artifacts.items():
+            write_atomically(output_dir / filename, content)
+
+        self.stdout.write(self.style.SUCCESS(f'OpenAPI schema {version} written to {output_dir}'))
@@ -22,6 +22,7 @@ class Command(BaseCommand):
                 "first_name": "Mohab",
                 "last_name": "Abbas",
                 "is_superuser": True,
+                "is_staff": True,
                 "phone": "+201159119534",
             }
         )
@@ -32,6 +33,11 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(f'{user.email} created with ID: {user.id}'))
         else:
             self.stdout.write(self.style.SUCCESS(f'{user.email} already exists with ID: {user.id}'))
+            if not user.is_staff:
+                # System users created before is_staff existed need it to open the admin
+                user.is_staff = True
+                user.save(update_fields=['is_staff'])
+                self.stdout.write(self.style.SUCCESS(f'{user.email} granted staff access'))
 
         # Write the user ID to .env file
         set_key('.env', 'SYSTEM_USER_ID', str(user.id))
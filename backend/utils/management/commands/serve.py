@@ -0,0 +1,61 @@
+# region Imports
+from django.core.management.base import BaseCommand, CommandError
+from utils.warmup import warm_up, open_worker_connections
+# endregion
+
+
+class Command(BaseCommand):
+    help = ('Serve the app with gunicorn after importing and warming everything in the master process, '
+            'so forked workers start copy-on-write and serve their first request at steady-state latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='0.0.0.0:8000')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--timeout', type=int, default=30)
+        parser.add_argument('--asgi', action='store_true',
+                            help='Serve backend.asgi with uvicorn workers (needed for the event stream)')
+
+    def handle(self, *args, **options):
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise CommandError("gunicorn is required: pip install -r requirements.txt")
+
+        if options['asgi'] and options['workers'] > 1:
+            from inventory.events import broker
+            if broker.redis() is None:
+                raise CommandError(
+                    "Without REDIS_URL the event stream only reaches subscribers of the worker that committed "
+                    "the event: serve --asgi with --workers 1, or set REDIS_URL")
+
+        stdout = self.stdout
+
+        class WarmApplication(BaseApplication):
+            def load_config(self):
+                config = {
+                    'bind': options['bind'],
+                    'workers': options['workers'],
+                    'threads': options['threads'],
+                    'timeout': options['timeout'],
+                    'preload_app': True,  # load() runs once in the master, before fork
+                }
+                if options['asgi']:
+                    config['worker_class'] = 'uvicorn.workers.UvicornWorker'
+                elif options['threads'] == 1:
+                    # Sync workers serve requests on the thread that runs this hook, so they reuse the
+                    # connections it opens; thread pools and ASGI open theirs on first use
+                    config['post_worker_init'] = lambda worker: open_worker_connections()
+                for key, value in config.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                if options['asgi']:
+                    from backend.asgi import application
+                else:
+                    from backend.wsgi import application
+                timings = warm_up()
+                stdout.write(f"Warm-up finished in {sum(timings.values()) * 1000:.1f}ms")
+                return application
+
+        WarmApplication().run()
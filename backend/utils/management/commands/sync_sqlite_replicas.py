@@ -0,0 +1,25 @@
+# region Imports
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+# endregion
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into every SQLite replica (local stand-in for replication)'
+
+    def handle(self, *args, **kwargs):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas can be synced locally; use database replication otherwise')
+
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            replica_settings = settings.DATABASES[alias]
+            if replica_settings['ENGINE'] != 'django.db.backends.sqlite3':
+                continue
+            # Online backup API: consistent snapshot without stopping writers
+            with sqlite3.connect(replica_settings['NAME']) as replica:
+                primary.connection.backup(replica)
+            self.stdout.write(self.style.SUCCESS(f'{alias} synced from primary'))
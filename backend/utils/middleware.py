@@ -0,0 +1,196 @@
+# region Imports
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+# endregion
+
+PROFILE_TOKEN_SALT = 'utils.request-profiling'
+PROFILE_HEADER = 'HTTP_X_PROFILE'  # X-Profile: <token from /utils/api/profiles/token/>
+
+# cProfile installs a process-wide hook, so only one request is profiled at a time
+_profiler_lock = threading.Lock()
+
+
+# region Profiling Tokens
+def issue_profile_token(user):
+    """
+    Signs a short-lived, single-use token a staff user sends back to have one of their requests profiled.
+    """
+    return signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).sign(str(user.pk))
+
+
+def profile_token_user_id(token):
+    """
+    Returns the user id of a valid, unexpired token, otherwise None.
+    """
+    try:
+        return signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).unsign(
+            token, max_age=settings.REQUEST_PROFILING['TOKEN_MAX_AGE'])
+    except signing.BadSignature:
+        return None
+
+
+def claim_profile_token(token):
+    """
+    Marks a token as used; returns False if it already was. Keyed by the signature, kept until it expires.
+    """
+    return cache.add(f'request-profile-token:{token.rsplit(":", 1)[-1]}', True,
+                     settings.REQUEST_PROFILING['TOKEN_MAX_AGE'])
+
+
+def profile_cache_key(profile_id):
+    return f'request-profile:{profile_id}'
+
+
+# endregion
+
+
+# region Query Capture
+class QueryRecorder:
+    """
+    Database execute wrapper recording every statement with its duration and alias.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def wrapper_for(self, alias):
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append({
+                    'alias': alias,
+                    'sql': sql,
+                    'params': repr(params) if params is not None else None,
+                    'ms': round((time.perf_counter() - started) * 1000, 3),
+                })
+        return record
+
+    def summary(self):
+        """
+        Returns the query list plus statements run more than once, either with the same parameters
+        (duplicates) or the same SQL with different parameters (similar, usually an N+1 loop).
+        """
+        duplicates = Counter((q['alias'], q['sql'], q['params']) for q in self.queries)
+        similar = Counter((q['alias'], q['sql']) for q in self.queries)
+        return {
+            'count': len(self.queries),
+            'total_ms': round(sum(q['ms'] for q in self.queries), 3),
+            'queries': self.queries,
+            'duplicates': [{'alias': alias, 'sql': sql, 'params': params, 'count': count}
+                           for (alias, sql, params), count in duplicates.most_common() if count > 1],
+            'similar': [{'alias': alias, 'sql': sql, 'count': count}
+                        for (alias, sql), count in similar.most_common() if count > 1],
+        }
+
+
+# endregion
+
+
+def top_functions(profiler, limit):
+    """
+    The `limit` most expensive functions by cumulative time.
+    """
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), (primitive_calls, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f'{filename}:{line}({function})',
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'tottime_ms': round(total * 1000, 3),
+            'cumtime_ms': round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda row: row['cumtime_ms'], reverse=True)
+    return rows[:limit]
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles a single request (cProfile + SQL capture) when it carries a valid staff profiling token
+    in the X-Profile header. A token profiles one request only, and the profile is kept only if the
+    request authenticated as the user the token was issued to and that user is still staff; otherwise it
+    is discarded and the response carries no profile headers.
+
+    The summary is stored in the cache for REQUEST_PROFILING['RESULT_TTL'] seconds and can be fetched
+    from /utils/api/profiles/<X-Profile-Id>/; the response also gets a Server-Timing header.
+    Requests without a token only pay a header lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get(PROFILE_HEADER)
+        if not token:
+            return self.get_response(request)
+
+        user_id = profile_token_user_id(token)
+        if user_id is None:
+            return self.get_response(request)
+        if not _profiler_lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile-Status'] = 'busy'
+            return response
+        try:
+            if not claim_profile_token(token):
+                return self.get_response(request)
+            return self.profile(request, user_id)
+        finally:
+            _profiler_lock.release()
+
+    @staticmethod
+    def is_token_owner(request, user_id):
+        """
+        The user the view authenticated (DRF sets it on the Django request) is the token's, and still staff.
+        """
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_authenticated and user.is_staff and str(user.pk) == user_id)
+
+    def profile(self, request, user_id):
+        config = settings.REQUEST_PROFILING
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder.wrapper_for(alias)))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        total_ms = (time.perf_counter() - started) * 1000
+        if not self.is_token_owner(request, user_id):
+            return response
+
+        profile_id = uuid.uuid4().hex
+        queries = recorder.summary()
+        cache.set(profile_cache_key(profile_id), {
+            'id': profile_id,
+            'user_id': user_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status_code': response.status_code,
+            'total_ms': round(total_ms, 3),
+            'functions': top_functions(profiler, config['TOP_FUNCTIONS']),
+            'sql': queries,
+        }, config['RESULT_TTL'])
+
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-Status'] = 'profiled'
+        response['Server-Timing'] = (f'total;dur={total_ms:.1f}, sql;dur={queries["total_ms"]:.1f};'
+                                     f'desc="{queries["count"]} queries"')
+        return response
@@ -35,6 +35,15 @@ class User(AbstractBaseUser, PermissionsMixin, SafeDeleteModel):
     last_name = models.CharField(max_length=100)
     phone = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
+    is_staff = models.BooleanField(default=False)  # Grants access to the admin site
+    branch = models.ForeignKey(
+        'Branch',
+        on_delete=models.PROTECT,
+        related_name="users",
+        null=True,
+        blank=True,
+        default=None
+    )  # Branch whose stock this user's orders consume; None uses the global stock
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -59,6 +68,12 @@ class User(AbstractBaseUser, PermissionsMixin, SafeDeleteModel):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name']
 
+    def get_full_name(self):
+        return str(self.first_name + ' ' + self.last_name)
+
+    def get_short_name(self):
+        return self.first_name
+
     def __str__(self):
         return str(self.first_name + ' ' + self.last_name)
 # endregion
@@ -89,3 +104,12 @@ class BaseCreatedAtModel(models.Model):
     class Meta:
         abstract = True
 # endregion
+
+
+# region Organization
+class Branch(BaseFullModel):
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+# endregion
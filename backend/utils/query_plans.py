@@ -0,0 +1,153 @@
+# region Imports
+import hashlib
+import json
+import re
+from collections import Counter
+from django.db import connections
+# endregion
+
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+# Finding types, most severe first
+FULL_SCAN = 'full_scan'  # Every row of a table is read
+AUTOMATIC_INDEX = 'automatic_index'  # SQLite builds a throwaway index per query: an index is missing
+TEMP_BTREE = 'temp_btree'  # Rows sorted / grouped / de-duplicated outside any index
+FULL_INDEX_SCAN = 'full_index_scan'  # Every entry of an index is read
+NOT_COVERING = 'not_covering'  # The index finds the rows but each one is then read from the table
+FINDING_TYPES = [FULL_SCAN, AUTOMATIC_INDEX, TEMP_BTREE, FULL_INDEX_SCAN, NOT_COVERING]
+
+SQLITE_PATTERNS = [
+    (AUTOMATIC_INDEX, re.compile(r'AUTOMATIC (?:PARTIAL )?COVERING INDEX')),
+    (TEMP_BTREE, re.compile(r'USE TEMP B-TREE')),
+    (FULL_INDEX_SCAN, re.compile(r'^SCAN (\S+) USING (?:COVERING )?INDEX')),
+    (FULL_SCAN, re.compile(r'^SCAN (?!CONSTANT ROW)(?!\()(\S+)$')),
+    (NOT_COVERING, re.compile(r'^SEARCH (\S+) USING INDEX')),
+]
+
+
+def fingerprint(sql):
+    """
+    Normalizes a statement so executions with different IN-list lengths or LIMITs group together; returns
+    (normalized SQL, short stable hash).
+    """
+    normalized = re.sub(r'IN \((?:%s, )*%s\)', 'IN (...)', sql)
+    normalized = re.sub(r'LIMIT \d+', 'LIMIT ?', normalized)
+    normalized = re.sub(r'OFFSET \d+', 'OFFSET ?', normalized)
+    return normalized, hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+class PlanRecorder:
+    """
+    Database execute wrapper keeping the raw SQL and parameters of every statement worth explaining.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            self.statements.append((self.alias, sql, params))
+        return execute(sql, params, many, context)
+
+
+# region Plans
+def explain(alias, sql, params):
+    """
+    Returns the plan as a list of readable lines (SQLite: EXPLAIN QUERY PLAN details; PostgreSQL: node
+    descriptions from EXPLAIN (FORMAT JSON)), or None for other databases.
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[3] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            return list(postgresql_plan_lines(json.loads(plan) if isinstance(plan, str) else plan))
+    return None
+
+
+def postgresql_plan_lines(plan):
+    pending = [node['Plan'] for node in plan]
+    while pending:
+        node = pending.pop(0)
+        line = node['Node Type']
+        if node.get('Index Name'):
+            line += f" using {node['Index Name']}"
+        if node.get('Relation Name'):
+            line += f" on {node['Relation Name']}"
+        if node.get('Sort Key'):
+            line += f" by {', '.join(node['Sort Key'])}"
+        yield line
+        pending.extend(node.get('Plans', []))
+
+
+def classify(vendor, plan):
+    """
+    Returns the findings [{'type', 'table', 'detail'}] of a plan, one per flagged plan line.
+    """
+    findings = []
+    for line in plan:
+        if vendor == 'sqlite':
+            for finding_type, pattern in SQLITE_PATTERNS:
+                match = pattern.search(line)
+                if match:
+                    table = match.group(1) if match.groups() else None
+                    findings.append({'type': finding_type, 'table': table, 'detail': line})
+                    break
+        elif vendor == 'postgresql':
+            match = re.match(r'(Seq Scan|Sort|Incremental Sort|Index Scan|HashAggregate)\b(?:.* on (\S+))?', line)
+            if match:
+                finding_type = {'Seq Scan': FULL_SCAN, 'Index Scan': NOT_COVERING}.get(match.group(1), TEMP_BTREE)
+                findings.append({'type': finding_type, 'table': match.group(2), 'detail': line})
+    return findings
+
+
+# endregion
+
+
+class QueryPlanAudit:
+    """
+    Collects the statements run by each audited request, explains every distinct statement once and
+    builds a report with stable ordering and no timings, so reports of two releases can be diffed.
+    """
+
+    def __init__(self):
+        self.vendor = connections['default'].vendor
+        self.requests = []  # {'request', 'status', 'statements'}
+        self.statements = {}  # fingerprint -> entry
+
+    def record(self, label, status, statements):
+        """
+        Adds a request's (alias, sql, params) statements, as captured by PlanRecorder.
+        """
+        self.requests.append({'request': label, 'status': status, 'statements': len(statements)})
+        for alias, sql, params in statements:
+            normalized, key = fingerprint(sql)
+            entry = self.statements.get(key)
+            if entry is None:
+                plan = explain(alias, sql, params)
+                entry = self.statements[key] = {
+                    'fingerprint': key, 'sql': normalized, 'requests': set(), 'executions': 0,
+                    'plan': plan, 'findings': classify(connections[alias].vendor, plan or []),
+                }
+            entry['requests'].add(label)
+            entry['executions'] += 1
+
+    def report(self, unexercised_routes=()):
+        statements = sorted(self.statements.values(), key=lambda entry: entry['fingerprint'])
+        by_type = Counter(finding['type'] for entry in statements for finding in entry['findings'])
+        return {
+            'vendor': self.vendor,
+            'summary': {
+                'requests': len(self.requests),
+                'statements': len(statements),
+                'flagged_statements': sum(bool(entry['findings']) for entry in statements),
+                'findings': {finding_type: by_type[finding_type] for finding_type in FINDING_TYPES},
+            },
+            'requests': self.requests,
+            'statements': [{**entry, 'requests': sorted(entry['requests'])} for entry in statements],
+            'unexercised_routes': sorted(unexercised_routes),
+        }
@@ -1,3 +1,374 @@
-from django.test import TestCase
+# region Imports
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from backend.urls import openapi_artifact_urlpatterns
+from utils.admission import AdmissionController, ServiceOverloaded
+from utils.caching import InvalidationBus, TwoTierCache
+from utils.models import User
+from utils.query_plans import PlanRecorder, QueryPlanAudit, fingerprint
+from utils.warmup import open_worker_connections, warm_up, warm_url_resolvers
+# endregion
 
-# Create your tests here.
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+IMPORTTIME_BASELINE = Path(__file__).resolve().parent / 'importtime_baseline.json'
+
+
+class ImportTimeRegressionTestCase(SimpleTestCase):
+    """
+    Boots ``backend.wsgi`` under the production profile with ``python -X importtime`` and compares
+    the boot time and imported modules with the recorded baseline. Re-record with
+    RECORD_IMPORTTIME_BASELINE=True; IMPORTTIME_TIME_FACTOR loosens the time bound on slow machines.
+    """
+    target_module = 'backend.wsgi'
+    runs = 3
+
+    # region Helpers
+    def measure_import(self):
+        """
+        Returns (cumulative microseconds of the target import, imported module names) for one cold start.
+        """
+        env = {**os.environ, 'APP_PROFILE': 'production', 'DJANGO_SETTINGS_MODULE': 'backend.settings'}
+        env.setdefault('SECRET_KEY', 'importtime-check')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {self.target_module}'],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+
+        cumulative_us, modules = None, set()
+        for line in result.stderr.splitlines():
+            # Format: "import time: <self us> | <cumulative us> | <indented module name>"
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            modules.add(name)
+            if name == self.target_module:
+                cumulative_us = int(cumulative)
+        return cumulative_us, modules
+
+    def measure_best_of_runs(self):
+        measurements = [self.measure_import() for _ in range(self.runs)]
+        return min(cumulative for cumulative, _ in measurements), measurements[-1][1]
+
+    # endregion
+
+    # region Test Case: Worker Boot Stays Within Baseline
+    def test_production_boot_within_baseline(self):
+        cumulative_us, modules = self.measure_best_of_runs()
+        self.assertIsNotNone(cumulative_us, f"{self.target_module} missing from -X importtime output")
+
+        if os.getenv('RECORD_IMPORTTIME_BASELINE') == 'True':
+            baseline = json.loads(IMPORTTIME_BASELINE.read_text()) if IMPORTTIME_BASELINE.exists() else {}
+            baseline.update({'cumulative_us': cumulative_us, 'module_count': len(modules)})
+            IMPORTTIME_BASELINE.write_text(json.dumps(baseline, indent=2) + '\n')
+            self.skipTest(f"Baseline recorded: {cumulative_us}us, {len(modules)} modules")
+
+        baseline = json.loads(IMPORTTIME_BASELINE.read_text())
+
+        # Module count is deterministic for pinned requirements, so it catches new eager imports reliably
+        self.assertLessEqual(
+            len(modules), baseline['module_count'] + baseline['module_slack'],
+            f"Worker boot now imports {len(modules)} modules (baseline {baseline['module_count']})"
+        )
+
+        # Wall time depends on the machine and its load, so only a large slowdown of the best run fails
+        time_factor = float(os.getenv('IMPORTTIME_TIME_FACTOR', baseline['time_factor']))
+        self.assertLessEqual(
+            cumulative_us, baseline['cumulative_us'] * time_factor,
+            f"Worker boot took {cumulative_us}us, over {time_factor}x the baseline {baseline['cumulative_us']}us"
+        )
+
+        # Dev-only apps must never be part of the production boot path
+        leaked = sorted(name for name in modules if name.split('.')[0] in baseline['forbidden_packages'])
+        self.assertEqual(leaked, [], f"Dev-only modules imported at boot: {leaked}")
+
+    # endregion
+
+
+class OpenApiArtifactUrls:
+    urlpatterns = openapi_artifact_urlpatterns
+
+
+class OpenApiArtifactTestCase(SimpleTestCase):
+
+    # region Test Setup: Build the Schema Into a Temporary Directory
+    def setUp(self):
+        self.schema_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.schema_dir.cleanup)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=Path(self.schema_dir.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('build_openapi_schema', stdout=open(os.devnull, 'w'))
+
+        # Requests go to the artifact views, whichever routes OPENAPI_RUNTIME_SCHEMA mounted at import
+        urlconf_override = override_settings(ROOT_URLCONF=OpenApiArtifactUrls)
+        urlconf_override.enable()
+        self.addCleanup(urlconf_override.disable)
+
+    # endregion
+
+    # region Test Case: Schema Served From the Artifact With ETag and 304 Support
+    def test_schema_served_with_etag(self):
+        response = self.client.get('/schema/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'/inventory/orders/', response.content)
+        self.assertIn('max-age=', response['Cache-Control'])
+        etag = response['ETag']
+
+        json_response = self.client.get('/schema/', {'format': 'json'})
+        self.assertEqual(json.loads(json_response.content)['info']['version'], '1.0.0')
+
+        not_modified = self.client.get('/schema/', headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+        for url in ('/swagger/', '/redoc/'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    # endregion
+
+
+class WarmUpTestCase(TestCase):
+
+    # region Test Case: Warm-up Hooks Run and Find the API Views
+    def test_warm_up_runs_every_hook(self):
+        # warm_database closes connections, which would abort the test transaction
+        hooks = [hook for hook in settings.WARMUP_HOOKS if hook != 'utils.warmup.warm_database']
+        with override_settings(WARMUP_HOOKS=hooks):
+            timings = warm_up()
+        self.assertEqual(list(timings), hooks)
+        self.assertIn('OrderViewSet', {view.__name__ for view in warm_url_resolvers()})
+
+    # endregion
+
+    # region Test Case: Worker Connections Are Only Opened When They Persist
+    def test_worker_connections_need_conn_max_age(self):
+        default = connections['default']
+        for conn_max_age, expected_calls in ((0, 0), (60, 1)):
+            with patch.dict(default.settings_dict, {'CONN_MAX_AGE': conn_max_age}), \
+                    patch.object(default, 'ensure_connection') as ensure_connection:
+                open_worker_connections()
+            self.assertEqual(ensure_connection.call_count, expected_calls)
+
+    # endregion
+
+
+class AdmissionControllerTestCase(SimpleTestCase):
+
+    # region Test Case: Waiters Are Admitted in Order, Overflow and Timeouts Are Rejected
+    def test_queue_admits_in_order_and_rejects_overflow(self):
+        controller = AdmissionController('writes', limit=1, queue_depth=1, queue_timeout=5)
+        admitted = []
+        release = threading.Event()
+
+        def waiter():
+            with controller.admit():
+                admitted.append('waiter')
+
+        with controller.admit():
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            while controller.snapshot()['queue_depth'] == 0:
+                release.wait(0.01)
+
+            # The queue is full, so the next request is rejected without waiting
+            with self.assertRaises(ServiceOverloaded) as rejected:
+                with controller.admit():
+                    pass
+            self.assertEqual(rejected.exception.status_code, 429)
+            self.assertGreaterEqual(rejected.exception.wait, 1)
+
+        thread.join(5)
+        self.assertEqual(admitted, ['waiter'])
+
+        # A queued request that cannot get a slot in time gives up
+        controller.queue_timeout = 0.05
+        with controller.admit():
+            with self.assertRaises(ServiceOverloaded):
+                with controller.admit():
+                    pass
+
+        metrics = controller.snapshot()
+        self.assertEqual((metrics['admitted'], metrics['rejected'], metrics['timed_out']), (3, 2, 1))
+        self.assertEqual((metrics['active'], metrics['queue_depth'], metrics['peak_queue_depth']), (0, 0, 1))
+
+    # endregion
+
+
+class RequestProfilingTestCase(APITestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create(email="ops@foodex.com", first_name="Ops", last_name="Staff",
+                                         phone="+200000000001", is_staff=True, is_superuser=True)
+        self.client.force_authenticate(self.staff)
+
+    # region Test Case: Signed Token Profiles One Request and Stores the Summary
+    def test_profiled_request_summary(self):
+        token = self.client.post(reverse('urls:profiling_token')).data['data']['token']
+
+        response = self.client.get(reverse('order-list'), HTTP_X_PROFILE=token)
+        self.assertEqual(response['X-Profile-Status'], 'profiled')
+        self.assertIn('sql;dur=', response['Server-Timing'])
+
+        profile = self.client.get(reverse('urls:request_profile', args=[response['X-Profile-Id']])).data['data']
+        self.assertEqual((profile['path'], profile['status_code']), (reverse('order-list'), 200))
+        self.assertGreater(profile['sql']['count'], 0)
+        self.assertTrue(profile['functions'])
+
+        # Tampered tokens and plain requests are not profiled
+        response = self.client.get(reverse('order-list'), HTTP_X_PROFILE=token + 'x')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+
+        # A token profiles one request only
+        response = self.client.get(reverse('order-list'), HTTP_X_PROFILE=token)
+        self.assertFalse(response.has_header('X-Profile-Id'))
+
+        # Tokens only work for the user they were issued to, while that user is still staff
+        token = self.client.post(reverse('urls:profiling_token')).data['data']['token']
+        other_staff = User.objects.create(email="ops2@foodex.com", phone="+200000000003", is_staff=True)
+        self.client.force_authenticate(other_staff)
+        self.assertFalse(self.client.get(reverse('order-list'), HTTP_X_PROFILE=token).has_header('X-Profile-Id'))
+        self.client.force_authenticate(self.staff)
+        token = self.client.post(reverse('urls:profiling_token')).data['data']['token']
+        User.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        self.staff.refresh_from_db()
+        self.client.force_authenticate(self.staff)
+        self.assertFalse(self.client.get(reverse('order-list'), HTTP_X_PROFILE=token).has_header('X-Profile-Id'))
+
+        # Only staff may request a token
+        self.client.force_authenticate(User.objects.create(email="cashier@foodex.com", phone="+200000000002"))
+        self.assertEqual(self.client.post(reverse('urls:profiling_token')).status_code, 403)
+
+    # endregion
+
+
+class TwoTierCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.two_tier_cache = TwoTierCache('test', local_max_entries=3, local_ttl=60, shared_timeout=60,
+                                           shared_alias='default', bus=InvalidationBus('default', 'test'))
+        self.two_tier_cache.invalidate()
+
+    # region Test Case: Local LRU, Shared Tier and Versioned Invalidation
+    def test_tiers_and_invalidation(self):
+        cache = self.two_tier_cache
+        for key in range(4):
+            cache.set(key, key * 10)
+        self.assertEqual(len(cache.local), 3)  # Version key + the two most recent entries
+
+        self.assertEqual(cache.get(3), 30)  # Local hit
+        self.assertEqual(cache.get(0), 0)  # Evicted locally, served by the shared tier
+        self.assertEqual(cache.get_many([1, 2, 9]), {1: 10, 2: 20})
+
+        cache.delete(1)
+        self.assertIsNone(cache.get(1))
+
+        cache.invalidate()  # New namespace version: every old entry is unreachable
+        self.assertIsNone(cache.get(3))
+
+        stats = cache.snapshot()
+        self.assertEqual((stats['local_hits'], stats['shared_hits'], stats['misses']), (1, 3, 3))
+
+    # endregion
+
+    # region Test Case: Concurrent Misses Run the Producer Once
+    def test_single_flight(self):
+        calls, results = [], []
+        release = threading.Event()
+
+        def producer():
+            calls.append(1)
+            release.wait(5)
+            return 'recipe'
+
+        threads = [threading.Thread(target=lambda: results.append(self.two_tier_cache.get_or_set('k', producer)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual((len(calls), results), (1, ['recipe'] * 5))
+
+    # endregion
+
+    # region Test Case: A Value Loaded Before a Concurrent Delete Is Not Kept
+    def test_load_racing_delete_not_cached(self):
+        cache = self.two_tier_cache
+
+        def producer():
+            cache.delete('k')  # The source changes while the old value is being loaded
+            return 'stale'
+
+        self.assertEqual(cache.get_or_set('k', producer), 'stale')
+        self.assertIsNone(cache.get('k'))
+        self.assertEqual(cache.get_or_set('k', lambda: 'fresh'), 'fresh')
+        self.assertEqual(cache.get('k'), 'fresh')
+
+    # endregion
+
+    # region Test Case: A Process-Local Shared Tier Keeps Entries No Longer Than the Local Tier
+    def test_process_local_shared_tier_capped(self):
+        cache = TwoTierCache('capped', local_max_entries=3, local_ttl=30, shared_timeout=3600,
+                             shared_alias='default', bus=InvalidationBus('default', 'test'))
+        self.assertTrue(cache.shared_is_process_local)  # LocMemCache in tests
+        self.assertEqual((cache._shared_timeout(None), cache._shared_timeout(10)), (30, 10))
+        with patch.object(TwoTierCache, 'shared_is_process_local', False):
+            self.assertEqual(cache._shared_timeout(None), 3600)
+
+    # endregion
+
+    # region Test Case: A Forked Worker Starts Its Own Invalidation Listener
+    def test_listener_started_after_fork(self):
+        connection = MagicMock()
+        connection.pubsub.return_value.listen.return_value = iter([])
+        bus = InvalidationBus('default', 'test')
+        with patch.object(bus, 'redis', return_value=connection):
+            two_tier_cache = TwoTierCache('forked', local_max_entries=3, local_ttl=60, shared_timeout=60,
+                                          shared_alias='default', bus=bus)
+            two_tier_cache.get('k')
+            self.assertEqual(connection.pubsub.call_count, 1)  # Started in the "master" only
+
+            with patch('utils.caching.os.getpid', return_value=os.getpid() + 1):
+                two_tier_cache.get_many(['k'])
+                two_tier_cache.get('k')
+            self.assertEqual(connection.pubsub.call_count, 2)  # One more, in the "worker"
+
+    # endregion
+
+
+class QueryPlanAuditTestCase(TestCase):
+
+    # region Test Case: Statements Explained Once and Flagged by Plan
+    def test_plans_flag_scans_and_sorts(self):
+        recorder = PlanRecorder('default')
+        with connection.execute_wrapper(recorder):
+            list(User.objects.all_with_deleted().filter(phone='+200000000000'))  # No index on phone
+            list(User.objects.filter(email__in=['a@foodex.com', 'b@foodex.com']).order_by('first_name'))
+            list(User.objects.filter(email__in=['c@foodex.com']).order_by('first_name'))
+
+        audit = QueryPlanAudit()
+        audit.record('GET /users/', 200, recorder.statements)
+        report = audit.report()
+        self.assertEqual(report['summary']['statements'], 2)  # IN lists of any length share a fingerprint
+        findings = {finding['type'] for entry in report['statements'] for finding in entry['findings']}
+        self.assertLessEqual({'full_scan', 'temp_btree'}, findings)
+        self.assertEqual(fingerprint('SELECT 1 WHERE id IN (%s, %s) LIMIT 21')[0],
+                         'SELECT 1 WHERE id IN (...) LIMIT ?')
+
+    # endregion
@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import CustomTokenObtainPairView, CustomTokenRefreshView
+from .views import CustomTokenObtainPairView, CustomTokenRefreshView, AdmissionMetricsView
+from .views import ProfilingTokenView, RequestProfileView, CacheMetricsView
 
 app_name = 'urls'
 
@@ -11,6 +12,19 @@ token_generation = [
     path('api/token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
 ]
 
+metrics = [
+    # Admission-control queue depth and wait times (staff only)
+    path('api/metrics/admission/', AdmissionMetricsView.as_view(), name='admission_metrics'),
+
+    # Two-tier cache hit/miss statistics (staff only)
+    path('api/metrics/cache/', CacheMetricsView.as_view(), name='cache_metrics'),
+
+    # On-demand request profiling (staff only)
+    path('api/profiles/token/', ProfilingTokenView.as_view(), name='profiling_token'),
+    path('api/profiles/<str:profile_id>/', RequestProfileView.as_view(), name='request_profile'),
+]
+
 urlpatterns = (
         token_generation
+        + metrics
 )
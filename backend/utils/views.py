@@ -1,6 +1,16 @@
 # region Imports
 from utils.importinglibs.views import *
 from django.contrib.auth import authenticate
+import hashlib
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_safe
+from utils.admission import admission_snapshots
+from utils.caching import cache_snapshots
+from utils.middleware import issue_profile_token, profile_cache_key
+from django.core.cache import cache
+from utils.endpointhandling.responses import success_response, error_response
 # endregion
 
 
@@ -34,3 +44,114 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
 class CustomTokenRefreshView(TokenRefreshView):
     pass  # Using default behavior from SimpleJWT
+
+
+# region Metrics
+class AdmissionMetricsView(APIView):
+    """
+    Staff-only view of the admission controllers in this worker: active and queued requests,
+    admitted / rejected counts and queue wait times.
+    """
+    permission_classes = [IsAdminUser]
+    schema = None  # Operational endpoint, left out of the public API schema
+
+    def get(self, request):
+        return success_response(admission_snapshots())
+
+
+class CacheMetricsView(APIView):
+    """
+    Staff-only hit/miss statistics of the two-tier caches in this worker.
+    """
+    permission_classes = [IsAdminUser]
+    schema = None
+
+    def get(self, request):
+        return success_response(cache_snapshots())
+# endregion
+
+
+# region On-Demand Profiling
+class ProfilingTokenView(APIView):
+    """
+    Issues a short-lived, single-use signed token; the caller's next request sent with it in the X-Profile
+    header is profiled by RequestProfilingMiddleware.
+    """
+    permission_classes = [IsAdminUser]
+    schema = None
+
+    def post(self, request):
+        return success_response({
+            'token': issue_profile_token(request.user),
+            'header': 'X-Profile',
+            'expires_in': settings.REQUEST_PROFILING['TOKEN_MAX_AGE'],
+        })
+
+
+class RequestProfileView(APIView):
+    """
+    Returns a stored profile: top functions by cumulative time and the SQL run, with duplicates.
+    """
+    permission_classes = [IsAdminUser]
+    schema = None
+
+    def get(self, request, profile_id):
+        profile = cache.get(profile_cache_key(profile_id))
+        if profile is None:
+            return error_response("Profile not found or expired.", status_code=status.HTTP_404_NOT_FOUND,
+                                  key="profile_not_found")
+        return success_response(profile)
+# endregion
+
+
+# region Prebuilt OpenAPI Artifacts
+# filename -> (mtime, content, etag); reloaded when build_openapi_schema rewrites the file
+_openapi_artifacts = {}
+
+
+def load_openapi_artifact(filename):
+    """
+    Returns (content, etag) of a prebuilt schema artifact, or None if it has not been built.
+    """
+    path = settings.OPENAPI_SCHEMA_DIR / filename
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _openapi_artifacts.get(filename)
+    if cached is None or cached[0] != mtime:
+        content = path.read_bytes()
+        cached = (mtime, content, f'"{hashlib.sha256(content).hexdigest()}"')
+        _openapi_artifacts[filename] = cached
+    return cached[1], cached[2]
+
+
+@require_safe
+def openapi_artifact(request, filename, content_type):
+    """
+    Serves a prebuilt schema artifact with a strong ETag and long-lived caching.
+    `?format=json` on the schema route serves the JSON variant.
+    """
+    if request.GET.get('format') == 'json' and filename.endswith('.yaml'):
+        filename, content_type = filename.replace('.yaml', '.json'), 'application/vnd.oai.openapi+json'
+
+    artifact = load_openapi_artifact(filename)
+    if artifact is None:
+        return JsonResponse({
+            "success": False,
+            "message": "OpenAPI schema has not been built, run `python manage.py build_openapi_schema`.",
+            "data": None,
+            "key": "schema_not_built",
+            "errors": None,
+        }, status=404)
+
+    content, etag = artifact
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.OPENAPI_SCHEMA_MAX_AGE)
+    return response
+# endregion
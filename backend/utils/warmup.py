@@ -0,0 +1,97 @@
+# region Imports
+import logging
+import time
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+# endregion
+
+logger = logging.getLogger('django')
+
+
+# region Warm-up Hooks
+def warm_imports():
+    """
+    Imports the request-path modules (DRF, Simple JWT) that Django itself loads lazily.
+    """
+    from rest_framework.settings import api_settings
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    # Resolving the class settings imports authentication, permission, renderer and parser classes
+    for setting in ('DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES',
+                    'DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES', 'EXCEPTION_HANDLER'):
+        getattr(api_settings, setting)
+    JWTAuthentication()
+    jwt_settings.AUTH_TOKEN_CLASSES
+
+
+def warm_url_resolvers():
+    """
+    Compiles every URL pattern and returns the DRF views found, for the serializer warm-up.
+    """
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    resolver._populate()
+
+    views, pending = [], list(resolver.url_patterns)
+    while pending:
+        pattern = pending.pop()
+        if hasattr(pattern, 'url_patterns'):
+            pending.extend(pattern.url_patterns)
+        else:
+            pattern.pattern.regex  # Compile the route regex
+            view_class = getattr(pattern.callback, 'cls', None)
+            if view_class is not None:
+                views.append(view_class)
+    return views
+
+
+def warm_serializers():
+    """
+    Builds each view's serializer fields once, filling the model _meta and field-mapping caches.
+    """
+    for view_class in set(warm_url_resolvers()):
+        serializer_class = getattr(view_class, 'serializer_class', None)
+        if serializer_class is not None:
+            serializer_class().fields
+
+
+def warm_database():
+    """
+    Verifies every database is reachable and primes the content type cache. Connections are
+    closed again: they must not be shared across fork, workers open their own after forking.
+    """
+    from django.apps import apps
+    from django.contrib.contenttypes.models import ContentType
+
+    for alias in connections:
+        connections[alias].ensure_connection()
+    ContentType.objects.get_for_models(*apps.get_models())
+    connections.close_all()
+# endregion
+
+
+def warm_up():
+    """
+    Runs the WARMUP_HOOKS in order and returns {hook path: seconds taken}.
+    """
+    timings = {}
+    for hook_path in settings.WARMUP_HOOKS:
+        started = time.perf_counter()
+        import_string(hook_path)()
+        timings[hook_path] = time.perf_counter() - started
+        logger.info(f"Warm-up {hook_path} took {timings[hook_path] * 1000:.1f}ms")
+    return timings
+
+
+def open_worker_connections():
+    """
+    Opens the worker's own persistent connections before its first request. Only connections with a
+    CONN_MAX_AGE are opened: with 0 the first request closes them again. They are thread-local, so this
+    only helps workers that serve requests on the thread running it (see the serve command).
+    """
+    for alias in connections:
+        if connections[alias].settings_dict['CONN_MAX_AGE'] != 0:
+            connections[alias].ensure_connection()
@@ -12,4 +12,5 @@ pip install -r requirements.txt
 python manage.py migrate
 python manage.py create_system_user
 python manage.py loaddata ingredients.json product_ingredients.json products.json
+python manage.py rebuild_recipes
 python manage.py runserver
\ No newline at end of file